@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Compares in-process WAV conversion with an external convert command (sox)."""
+import argparse
+import io
+import shlex
+import subprocess
+import sys
+import time
+import wave
+from pathlib import Path
+
+# Use voice2json from this source tree
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from voice2json.audio import convert_wav_data, float_to_pcm  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmark-convert.py")
+    parser.add_argument("wav_file", nargs="*", help="WAV files to convert")
+    parser.add_argument(
+        "--repeat", type=int, default=10, help="Number of times to convert each file"
+    )
+    parser.add_argument(
+        "--rate", type=int, default=8000, help="Sample rate of generated audio"
+    )
+    parser.add_argument(
+        "--seconds", type=float, default=5.0, help="Length of generated audio"
+    )
+    parser.add_argument(
+        "--convert-command",
+        default="sox -t wav - -r 16000 -e signed-integer -b 16 -c 1 -t wav -",
+        help="External command to compare against",
+    )
+    args = parser.parse_args()
+
+    if args.wav_file:
+        wavs = {path: Path(path).read_bytes() for path in args.wav_file}
+    else:
+        # Generate white noise
+        import numpy as np
+
+        noise = np.random.uniform(-0.5, 0.5, int(args.rate * args.seconds))
+        with io.BytesIO() as wav_io:
+            with wave.open(wav_io, "wb") as wav_file:
+                wav_file.setframerate(args.rate)
+                wav_file.setsampwidth(2)
+                wav_file.setnchannels(1)
+                wav_file.writeframes(float_to_pcm(noise, 2))
+
+            wavs = {f"noise ({args.rate} Hz, {args.seconds} s)": wav_io.getvalue()}
+
+    convert_cmd = shlex.split(args.convert_command)
+    for name, wav_data in wavs.items():
+        start_time = time.perf_counter()
+        for _ in range(args.repeat):
+            converted = convert_wav_data(wav_data, 16000, 2, 1)
+            assert converted is not None, f"Can't convert {name} in-process"
+
+        builtin_seconds = (time.perf_counter() - start_time) / args.repeat
+
+        command_seconds = None
+        try:
+            start_time = time.perf_counter()
+            for _ in range(args.repeat):
+                subprocess.run(
+                    convert_cmd,
+                    input=wav_data,
+                    stdout=subprocess.PIPE,
+                    check=True,
+                )
+
+            command_seconds = (time.perf_counter() - start_time) / args.repeat
+        except FileNotFoundError:
+            pass
+
+        print(name)
+        print(f"  builtin: {builtin_seconds * 1000:.2f} ms")
+        if command_seconds is None:
+            print(f"  command: not found ({convert_cmd[0]})")
+        else:
+            print(f"  command: {command_seconds * 1000:.2f} ms")
+
+
+# -----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    main()
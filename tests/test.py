@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
+import dataclasses
 import io
+import itertools
 import json
 import logging
+import math
 import os
+import pickle
+import random
 import re
 import subprocess
 import sys
+import tempfile
+import threading
+import typing
 import unittest
+import wave
 from pathlib import Path
 
 logging.basicConfig(level=logging.DEBUG)
@@ -95,6 +105,1589 @@ class Voice2JsonTestCase(unittest.TestCase):
 # -----------------------------------------------------------------------------
 
 
+class StartupTestCase(unittest.TestCase):
+    # Seconds allowed for imports after interpreter startup
+    IMPORT_BUDGET_SECONDS = 0.25
+
+    # Modules that only specific sub-commands should import
+    LAZY_MODULES = {
+        "aiofiles",
+        "aiohttp",
+        "networkx",
+        "numpy",
+        "pydash",
+        "rhasspynlu",
+        "tqdm",
+        "voice2json.core",
+        "yaml",
+    }
+
+    def test_startup_time(self):
+        """Check imports and import time of recognize-intent --help."""
+        # import time: self [us] | cumulative | imported package
+        import_output = subprocess.run(
+            [
+                sys.executable,
+                "-X",
+                "importtime",
+                "-m",
+                "voice2json",
+                "recognize-intent",
+                "--help",
+            ],
+            cwd=voice2json_dir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            check=True,
+        ).stderr.decode()
+
+        imported_modules = set()
+        import_seconds = 0.0
+        after_startup = False
+        for line in import_output.splitlines():
+            match = re.match(r"^import time:\s+\d+ \|\s+(\d+) \|( +)(\S+)$", line)
+            if not match:
+                continue
+
+            module_name = match.group(3)
+            imported_modules.add(module_name)
+
+            # Only count top-level imports done by voice2json itself
+            if len(match.group(2)) == 1:
+                if after_startup:
+                    import_seconds += int(match.group(1)) / 1e6
+                elif module_name == "runpy":
+                    after_startup = True
+
+        self.assertEqual(set(), self.LAZY_MODULES & imported_modules)
+        self.assertLess(import_seconds, self.IMPORT_BUDGET_SECONDS)
+
+
+# -----------------------------------------------------------------------------
+
+# Small intent graph used by graph and path tests (23 sentences)
+TEST_SENTENCES_INI = """
+[SetLight]
+turn (on | off){state} [the] (living room lamp | kitchen light){name}
+set brightness to (one:1 | two:2 | ten:10){value!int} [percent]
+set the (red | green){color} light (on | off){state}
+
+[GetTime]
+what time is it
+(tell me | what is) the time [please]
+"""
+
+
+def make_test_graph():
+    """Create networkx intent graph from TEST_SENTENCES_INI."""
+    import rhasspynlu
+
+    return rhasspynlu.intents_to_graph(rhasspynlu.parse_ini(TEST_SENTENCES_INI))
+
+
+class CompactGraphTestCase(unittest.TestCase):
+    def test_recognitions(self):
+        """Check that compact and networkx graphs give the same recognitions."""
+        import rhasspynlu
+
+        from voice2json.graph import CompactIntentGraph, write_compact_graph
+
+        graph = make_test_graph()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            compact_path = Path(temp_dir) / "intent.graph"
+            write_compact_graph(graph, compact_path)
+            compact_graph = CompactIntentGraph(compact_path)
+
+            try:
+                self.assertEqual(
+                    graph.number_of_nodes(), compact_graph.number_of_nodes()
+                )
+                self.assertEqual(
+                    graph.number_of_edges(), compact_graph.number_of_edges()
+                )
+
+                # (sentence, recognized strictly, recognized fuzzy)
+                sentences = [
+                    ("turn on the kitchen light", True, True),
+                    ("set brightness to ten percent", True, True),
+                    ("set the green light off", True, True),
+                    ("what is the time please", True, True),
+                    ("please turn off living room lamp", False, True),
+                    ("what time is it today", False, True),
+                    ("open the garage door", False, False),
+                ]
+
+                for sentence, is_strict, is_fuzzy in sentences:
+                    for fuzzy in [False, True]:
+                        with self.subTest(sentence=sentence, fuzzy=fuzzy):
+                            expected = rhasspynlu.recognize(
+                                sentence, graph, fuzzy=fuzzy
+                            )
+                            actual = rhasspynlu.recognize(
+                                sentence, compact_graph, fuzzy=fuzzy
+                            )
+
+                            self.assertEqual(
+                                is_fuzzy if fuzzy else is_strict, bool(expected)
+                            )
+                            self.assertEqual(
+                                [recognition_dict(r) for r in expected],
+                                [recognition_dict(r) for r in actual],
+                            )
+            finally:
+                compact_graph.close()
+
+
+def recognition_dict(recognition) -> typing.Dict[str, typing.Any]:
+    """Recognition as a dict without timing information."""
+    result = dataclasses.asdict(recognition)
+    result.pop("recognize_seconds", None)
+    return result
+
+
+# -----------------------------------------------------------------------------
+
+
+class GraphPathsTestCase(unittest.TestCase):
+    def setUp(self):
+        import networkx
+        import rhasspynlu
+
+        from voice2json.paths import GraphPaths
+
+        self.graph = make_test_graph()
+        start_node, end_node = rhasspynlu.jsgf_graph.get_start_end_nodes(self.graph)
+        self.paths = GraphPaths(self.graph, start_node, end_node)
+        self.all_paths = {
+            tuple(path)
+            for path in networkx.all_simple_paths(self.graph, start_node, end_node)
+        }
+
+    def test_count(self):
+        """Check path counts against networkx."""
+        self.assertEqual(23, len(self.all_paths))
+        self.assertEqual(len(self.all_paths), self.paths.num_paths)
+        self.assertEqual(len(self.all_paths), len(self.paths))
+
+    def test_path_index(self):
+        """Check that every index gives a different, valid path."""
+        indexed_paths = [
+            tuple(self.paths.path(index)) for index in range(self.paths.num_paths)
+        ]
+        self.assertEqual(self.all_paths, set(indexed_paths))
+        self.assertEqual(len(indexed_paths), len(set(indexed_paths)))
+
+        with self.assertRaises(IndexError):
+            self.paths.path(self.paths.num_paths)
+
+    def test_all_paths(self):
+        """Check that iterating (--all) yields every path in index order."""
+        self.assertEqual(
+            [self.paths.path(index) for index in range(self.paths.num_paths)],
+            list(self.paths),
+        )
+
+    def test_random_paths(self):
+        """Check that random paths are distinct and reproducible."""
+        random_paths = [
+            tuple(path) for path in self.paths.random_paths(10, rng=random.Random(1))
+        ]
+        self.assertEqual(10, len(set(random_paths)))
+        self.assertTrue(set(random_paths) <= self.all_paths)
+
+        # Same seed, same paths
+        self.assertEqual(
+            random_paths,
+            [tuple(path) for path in self.paths.random_paths(10, rng=random.Random(1))],
+        )
+
+        # More than available
+        self.assertEqual(
+            self.all_paths,
+            {tuple(path) for path in self.paths.random_paths(100)},
+        )
+
+
+# -----------------------------------------------------------------------------
+
+
+class ConvertAudioTestCase(unittest.TestCase):
+    def setUp(self):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            self.skipTest("numpy not available")
+
+    def test_resample(self):
+        """Check that a resampled sine keeps its length ratio and frequency."""
+        import numpy as np
+
+        from voice2json.audio import resample
+
+        in_rate, out_rate, frequency = 44100, 16000, 440
+        in_audio = 0.5 * np.sin(2 * np.pi * frequency * np.arange(in_rate) / in_rate)
+
+        out_audio = resample(in_audio, in_rate, out_rate)
+        self.assertEqual(math.ceil(len(in_audio) * out_rate / in_rate), len(out_audio))
+
+        # Dominant frequency should be unchanged (1 Hz resolution for 1 second)
+        spectrum = np.abs(np.fft.rfft(out_audio))
+        out_frequency = np.argmax(spectrum) * out_rate / len(out_audio)
+        self.assertAlmostEqual(frequency, out_frequency, delta=1)
+
+        # Amplitude should be preserved away from the edges
+        self.assertAlmostEqual(0.5, np.abs(out_audio[1000:-1000]).max(), delta=0.01)
+
+    def test_convert_wav_data(self):
+        """Check conversion of WAV rate, width, and channels."""
+        import numpy as np
+
+        from voice2json.audio import convert_wav_data, float_to_pcm
+
+        in_rate = 48000
+        tone = 0.25 * np.sin(2 * np.pi * 1000 * np.arange(in_rate // 2) / in_rate)
+        stereo = np.stack([tone, tone], axis=1).reshape(-1)
+
+        with io.BytesIO() as wav_buffer:
+            in_file: wave.Wave_write = wave.open(wav_buffer, "wb")
+            with in_file:
+                in_file.setframerate(in_rate)
+                in_file.setsampwidth(4)
+                in_file.setnchannels(2)
+                in_file.writeframes(float_to_pcm(stereo, 4))
+
+            wav_data = wav_buffer.getvalue()
+
+        out_data = convert_wav_data(wav_data, 16000, 2, 1)
+        self.assertIsNotNone(out_data)
+
+        with io.BytesIO(out_data) as wav_io:
+            with wave.open(wav_io, "rb") as out_file:
+                self.assertEqual(16000, out_file.getframerate())
+                self.assertEqual(2, out_file.getsampwidth())
+                self.assertEqual(1, out_file.getnchannels())
+                self.assertEqual(8000, out_file.getnframes())
+
+        # Not a WAV file
+        self.assertIsNone(convert_wav_data(b"not a wav file", 16000, 2, 1))
+
+
+# -----------------------------------------------------------------------------
+
+
+class AudioRingBufferTestCase(unittest.TestCase):
+    def test_wrap_around(self):
+        """Check reads and writes that cross the end of the buffer."""
+        from voice2json.audio import AudioRingBuffer
+
+        buffer = AudioRingBuffer(8)
+        self.assertTrue(buffer.write(b"abcdef"))
+        self.assertEqual(b"abcd", buffer.read(4))
+
+        # Wraps around
+        self.assertTrue(buffer.write(b"ghijkl"))
+        self.assertEqual(8, len(buffer))
+
+        out_buffer = bytearray(5)
+        self.assertEqual(5, buffer.read_into(out_buffer))
+        self.assertEqual(b"efghi", bytes(out_buffer))
+        self.assertEqual(b"jkl", buffer.read(10))
+        self.assertEqual(0, buffer.overflow_count)
+
+    def test_drop_oldest(self):
+        """Check that the oldest audio is overwritten when full."""
+        from voice2json.audio import AudioRingBuffer
+
+        buffer = AudioRingBuffer(4, drop_oldest=True)
+        self.assertTrue(buffer.write(b"abc"))
+        self.assertFalse(buffer.write(b"de"))
+        self.assertEqual(1, buffer.overflow_count)
+        self.assertEqual(1, buffer.dropped_bytes)
+
+        # Larger than capacity: only the newest audio is kept
+        self.assertFalse(buffer.write(b"fghijk"))
+        self.assertEqual(2, buffer.overflow_count)
+        self.assertEqual(7, buffer.dropped_bytes)
+        self.assertEqual(b"hijk", buffer.read(10))
+
+    def test_segments(self):
+        """Check that reads stop at the end of each segment."""
+        from voice2json.audio import AudioRingBuffer
+
+        buffer = AudioRingBuffer(16)
+        buffer.write(b"first")
+        buffer.end_segment()
+        buffer.write(b"second")
+        buffer.close()
+
+        self.assertEqual(b"first", buffer.read(10))
+        self.assertEqual(b"", buffer.read(10))
+        self.assertEqual(b"second", buffer.read(10))
+
+        # Closed and empty
+        self.assertEqual(b"", buffer.read(10))
+        self.assertTrue(buffer.closed)
+
+        # Writes to a closed buffer are dropped
+        self.assertFalse(buffer.write(b"third"))
+        self.assertEqual(5, buffer.dropped_bytes)
+
+    def test_back_pressure(self):
+        """Check that writers wait for space and time out."""
+        from voice2json.audio import AudioRingBuffer
+
+        buffer = AudioRingBuffer(4)
+        self.assertTrue(buffer.write(b"abcd"))
+        self.assertFalse(buffer.write(b"ef", timeout=0.01))
+        self.assertEqual(1, buffer.overflow_count)
+        self.assertEqual(2, buffer.dropped_bytes)
+
+        # Reader frees space for a waiting writer
+        reader = threading.Timer(0.05, buffer.read, args=(2,))
+        reader.start()
+        try:
+            self.assertTrue(buffer.write(b"gh", timeout=5))
+        finally:
+            reader.join()
+
+        self.assertEqual(b"cdgh", buffer.read(10))
+
+
+# -----------------------------------------------------------------------------
+
+TEST_DICTIONARY = """
+turn T ER N
+on AA N
+on AO N
+the DH AH
+the DH IY
+lamp L AE M P
+café K AE F EY
+zebra Z IY B R AH
+"""
+
+
+class CompiledDictionaryTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        """Check that compiled and text dictionaries have the same words."""
+        from rhasspynlu.g2p import read_pronunciations
+
+        from voice2json.dictionary import load_compiled_dictionary
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dict_path = Path(temp_dir) / "base_dictionary.txt"
+            dict_path.write_text(TEST_DICTIONARY)
+            cache_path = Path(temp_dir) / "base_dictionary.bin"
+
+            with open(dict_path, "r") as dict_file:
+                expected = read_pronunciations(dict_file, word_dict={})
+
+            pronunciations = load_compiled_dictionary(dict_path, cache_path)
+            try:
+                self.assertTrue(cache_path.is_file())
+                self.assertEqual(sorted(expected), sorted(pronunciations))
+                self.assertEqual(len(expected), len(pronunciations))
+                for word, word_prons in expected.items():
+                    self.assertIn(word, pronunciations)
+                    self.assertEqual(word_prons, pronunciations[word])
+
+                self.assertNotIn("missing", pronunciations)
+                with self.assertRaises(KeyError):
+                    pronunciations["missing"]
+            finally:
+                pronunciations.close()
+
+            # Cache is rebuilt when the dictionary changes
+            dict_path.write_text(TEST_DICTIONARY + "missing M IH S IH NG\n")
+            pronunciations = load_compiled_dictionary(dict_path, cache_path)
+            try:
+                self.assertEqual(
+                    [["M", "IH", "S", "IH", "NG"]], pronunciations["missing"]
+                )
+            finally:
+                pronunciations.close()
+
+    def test_overlay(self):
+        """Check that changes stay in memory and don't touch the cache."""
+        from voice2json.dictionary import CompiledPronunciations, compile_dictionary
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dict_path = Path(temp_dir) / "base_dictionary.txt"
+            dict_path.write_text(TEST_DICTIONARY)
+            cache_path = Path(temp_dir) / "base_dictionary.bin"
+            compile_dictionary(dict_path, cache_path)
+
+            pronunciations = CompiledPronunciations(cache_path)
+            try:
+                # Modify, add, and delete words
+                pronunciations["lamp"].append(["L", "AA", "M", "P"])
+                pronunciations["kitchen"] = [["K", "IH", "CH", "AH", "N"]]
+                del pronunciations["zebra"]
+
+                self.assertEqual(
+                    [["L", "AE", "M", "P"], ["L", "AA", "M", "P"]],
+                    pronunciations["lamp"],
+                )
+                self.assertIn("kitchen", pronunciations)
+                self.assertNotIn("zebra", pronunciations)
+                self.assertEqual(
+                    {"turn", "on", "the", "lamp", "café", "kitchen"},
+                    set(pronunciations),
+                )
+
+                with self.assertRaises(KeyError):
+                    del pronunciations["zebra"]
+
+                # Deleted words can be added back
+                pronunciations["zebra"] = [["Z", "EH", "B", "R", "AH"]]
+                self.assertEqual([["Z", "EH", "B", "R", "AH"]], pronunciations["zebra"])
+            finally:
+                pronunciations.close()
+
+            pronunciations = CompiledPronunciations(cache_path)
+            try:
+                self.assertEqual([["L", "AE", "M", "P"]], pronunciations["lamp"])
+                self.assertNotIn("kitchen", pronunciations)
+                self.assertIn("zebra", pronunciations)
+            finally:
+                pronunciations.close()
+
+
+# -----------------------------------------------------------------------------
+
+
+class SoundsLikeTestCase(unittest.TestCase):
+    def test_expand_pronunciations(self):
+        """Check best-first order, duplicates, and cap of expanded pronunciations."""
+        from voice2json.sounds_like import expand_pronunciations
+
+        known_phonemes = [[["A"], ["A", "B"]], [["B", "C"], ["C"]]]
+
+        # A B C is produced twice
+        self.assertEqual(
+            [["A", "B", "C"], ["A", "C"], ["A", "B", "B", "C"]],
+            list(expand_pronunciations(known_phonemes)),
+        )
+
+        # Capped
+        self.assertEqual(
+            [["A", "B", "C"], ["A", "C"]],
+            list(expand_pronunciations(known_phonemes, max_pronunciations=2)),
+        )
+
+        # Best combination first, even with many alternatives
+        many_phonemes = [[[str(i)] for i in range(100)] for _ in range(10)]
+        self.assertEqual(
+            [["0"] * 10],
+            list(expand_pronunciations(many_phonemes, max_pronunciations=1)),
+        )
+
+        # No alternatives for a position
+        self.assertEqual([], list(expand_pronunciations([[["A"]], []])))
+
+    def test_load_sounds_like(self):
+        """Check pronunciations and counts for each sounds like entry."""
+        from voice2json.sounds_like import load_sounds_like
+
+        pronunciations = {
+            "the": [["DH", "AH"], ["DH", "IY"]],
+            "lamp": [["L", "AE", "M", "P"]],
+            "on": [["AA", "N"], ["AO", "N"]],
+        }
+
+        sounds_like = io.StringIO(
+            "thelamp the lamp\n"
+            "onon on on\n"
+            "thelamp /L AA M P/\n"
+            "lampon lamp on(2)\n"
+        )
+
+        entry_counts: typing.List[typing.Tuple[str, int]] = []
+        load_sounds_like(
+            sounds_like,
+            pronunciations,
+            max_pronunciations=3,
+            entry_counts=entry_counts,
+        )
+
+        self.assertEqual(
+            [("thelamp", 2), ("onon", 3), ("thelamp", 1), ("lampon", 1)],
+            entry_counts,
+        )
+        self.assertEqual(
+            [
+                ["DH", "AH", "L", "AE", "M", "P"],
+                ["DH", "IY", "L", "AE", "M", "P"],
+                ["L", "AA", "M", "P"],
+            ],
+            pronunciations["thelamp"],
+        )
+        self.assertEqual(
+            [["AA", "N", "AA", "N"], ["AA", "N", "AO", "N"], ["AO", "N", "AA", "N"]],
+            pronunciations["onon"],
+        )
+        self.assertEqual([["L", "AE", "M", "P", "AO", "N"]], pronunciations["lampon"])
+
+
+# -----------------------------------------------------------------------------
+
+TEST_G2P_CORPUS = """
+l}L a}AE m}M p}P
+t}T h|e}DH|AH
+t}T h|e}DH|IY
+c}K a}AE f}F é}EY
+x}K|S
+"""
+
+
+class G2PCorpusIndexTestCase(unittest.TestCase):
+    def test_index(self):
+        """Check that indexed and in-memory g2p corpora have the same alignments."""
+        from voice2json.sounds_like import (
+            close_g2p_alignment,
+            load_g2p_corpus,
+            load_g2p_corpus_index,
+        )
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            corpus_path = Path(temp_dir) / "g2p.corpus"
+            corpus_path.write_text(TEST_G2P_CORPUS)
+            index_path = Path(temp_dir) / "g2p.corpus.index"
+
+            expected = load_g2p_corpus(corpus_path)
+            self.assertEqual({"lamp", "the", "café", "x"}, set(expected))
+
+            with load_g2p_corpus_index(corpus_path, index_path) as g2p_index:
+                self.assertEqual(len(expected), len(g2p_index))
+                for word, alignments in expected.items():
+                    self.assertIn(word, g2p_index)
+                    self.assertEqual(alignments, g2p_index[word])
+
+                self.assertNotIn("missing", g2p_index)
+                self.assertIsNone(g2p_index.get("missing"))
+                with self.assertRaises(KeyError):
+                    g2p_index["missing"]
+
+            self.assertTrue(g2p_index.corpus_file.closed)
+
+            # Index is rebuilt when the corpus changes
+            corpus_path.write_text(TEST_G2P_CORPUS + "o}OW n}N\n")
+            g2p_index = load_g2p_corpus(corpus_path, index_path=index_path)
+            try:
+                self.assertEqual([[(["o"], ["OW"]), (["n"], ["N"])]], g2p_index["on"])
+            finally:
+                close_g2p_alignment(g2p_index)
+
+            self.assertTrue(g2p_index.corpus_file.closed)
+
+            # No-op for in-memory corpus
+            close_g2p_alignment(expected)
+
+
+# -----------------------------------------------------------------------------
+
+
+class FlushCountingIO(io.StringIO):
+    """StringIO that counts calls to flush."""
+
+    def __init__(self):
+        super().__init__()
+        self.flush_count = 0
+
+    def flush(self):
+        self.flush_count += 1
+        super().flush()
+
+
+class JsonSinkTestCase(unittest.TestCase):
+    def test_flush_interval(self):
+        """Check that lines are only flushed on an interval unless line buffered."""
+        from voice2json.utils import JsonSink
+
+        out_file = FlushCountingIO()
+        sink = JsonSink(out_file, flush_interval=60)
+        sink.write({"text": "turn on the lamp"})
+        sink.write_line('{"text": "what time is it"}')
+        self.assertEqual(0, out_file.flush_count)
+
+        sink.flush()
+        self.assertEqual(1, out_file.flush_count)
+        self.assertEqual(
+            [{"text": "turn on the lamp"}, {"text": "what time is it"}],
+            [json.loads(line) for line in out_file.getvalue().splitlines()],
+        )
+
+        # Flush every line
+        out_file = FlushCountingIO()
+        sink = JsonSink(out_file, flush_interval=60, line_buffered=True)
+        sink.write_line("{}")
+        sink.write_line("{}")
+        self.assertEqual(2, out_file.flush_count)
+
+        # Closed files aren't flushed
+        out_file.close()
+        sink.flush()
+
+    def test_shared_sink(self):
+        """Check that each file has one shared sink."""
+        from voice2json.utils import flush_json_output, get_json_sink
+
+        out_file = FlushCountingIO()
+        sink = get_json_sink(out_file)
+        self.assertIs(sink, get_json_sink(out_file))
+        self.assertIsNot(sink, get_json_sink(FlushCountingIO()))
+
+        flush_count = out_file.flush_count
+        flush_json_output()
+        self.assertEqual(flush_count + 1, out_file.flush_count)
+
+
+# -----------------------------------------------------------------------------
+
+
+class GenerateExamplesTestCase(unittest.TestCase):
+    class FakeCore:
+        """Trained profile with the test intent graph."""
+
+        def check_trained(self):
+            return True
+
+        def load_intent_graph(self):
+            return make_test_graph()
+
+    def _generate(self, temp_dir: Path, **kwargs) -> typing.List[str]:
+        """Run generate-examples and return lines from all shards."""
+        from voice2json.generate import generate
+
+        shard_dir = temp_dir / str(len(list(temp_dir.iterdir())))
+        args = argparse.Namespace(
+            number=10,
+            all=False,
+            raw_symbols=False,
+            iob=False,
+            seed=1,
+            workers=1,
+            batch_size=4,
+            shard_directory=str(shard_dir),
+        )
+        for key, value in kwargs.items():
+            setattr(args, key, value)
+
+        asyncio.run(generate(args, self.FakeCore()))
+
+        # Batches are written to shards round robin
+        shard_lines = [
+            shard_path.read_text().splitlines()
+            for shard_path in sorted(shard_dir.iterdir())
+        ]
+        self.assertEqual(max(1, args.workers), len(shard_lines))
+
+        lines = []
+        for batch_index in itertools.count():
+            shard = shard_lines[batch_index % len(shard_lines)]
+            start = (batch_index // len(shard_lines)) * args.batch_size
+            batch = shard[start : start + args.batch_size]
+            if not batch:
+                break
+
+            lines.extend(batch)
+
+        return lines
+
+    def test_seed(self):
+        """Check that a seed gives the same examples for any number of workers."""
+        with tempfile.TemporaryDirectory() as temp_dir_str:
+            temp_dir = Path(temp_dir_str)
+
+            lines = self._generate(temp_dir)
+            self.assertEqual(10, len(lines))
+            self.assertEqual(10, len(set(lines)))
+            for line in lines:
+                self.assertIn(
+                    json.loads(line)["intent"]["name"], {"SetLight", "GetTime"}
+                )
+
+            self.assertEqual(lines, self._generate(temp_dir))
+            self.assertEqual(lines, self._generate(temp_dir, workers=2))
+            self.assertEqual(lines, self._generate(temp_dir, workers=3))
+            self.assertNotEqual(lines, self._generate(temp_dir, seed=2))
+
+    def test_all(self):
+        """Check that --all gives every example in the same order for any number of workers."""
+        with tempfile.TemporaryDirectory() as temp_dir_str:
+            temp_dir = Path(temp_dir_str)
+
+            lines = self._generate(temp_dir, all=True, raw_symbols=True)
+            self.assertEqual(23, len(lines))
+            self.assertEqual(23, len(set(lines)))
+            self.assertEqual(
+                lines, self._generate(temp_dir, all=True, raw_symbols=True, workers=2)
+            )
+
+
+# -----------------------------------------------------------------------------
+
+
+class SettingsTestCase(unittest.TestCase):
+    def test_from_profile(self):
+        """Check defaults, conversion, and nested settings."""
+        from voice2json.settings import Settings
+
+        settings = Settings.from_profile(
+            {
+                "audio": {"format": {"sample-width-bits": "24"}, "buffer-seconds": 2},
+                "speech-to-text": {
+                    "acoustic-model-type": "Kaldi",
+                    "kaldi": {"model-type": "nnet3"},
+                },
+                "intent-recognition": {"persistent-converters": ["reverse"]},
+            }
+        )
+
+        self.assertEqual(16000, settings.audio.format.sample_rate)
+        self.assertEqual(3, settings.audio.format.sample_width)
+        self.assertEqual(2 * 16000 * 3, settings.audio.buffer_bytes)
+        self.assertEqual("kaldi", settings.speech_to_text.acoustic_model_type)
+        self.assertEqual("nnet3", settings.speech_to_text.kaldi.model_type)
+        self.assertEqual(60, settings.speech_to_text.julius.timeout_seconds)
+        self.assertTrue(settings.intent_recognition.fuzzy)
+        self.assertEqual(
+            ("reverse",), settings.intent_recognition.persistent_converters
+        )
+
+        # Immutable
+        with self.assertRaises(AttributeError):
+            settings.intent_recognition.fuzzy = False
+
+    def test_invalid(self):
+        """Check that invalid settings raise ValueError with the setting name."""
+        from voice2json.settings import Settings
+
+        invalid_profiles = {
+            "audio.format.sample-width-bits": {
+                "audio": {"format": {"sample-width-bits": 12}}
+            },
+            "audio.buffer-policy": {"audio": {"buffer-policy": "drop-newest"}},
+            "voice-command.chunk-size": {"voice-command": {"chunk-size": "big"}},
+            "speech-to-text.kaldi.model-type": {
+                "speech-to-text": {"acoustic-model-type": "kaldi"}
+            },
+            "speech-to-text.julius.adinnet-port": {
+                "speech-to-text": {"julius": {"adinnet-port": 70000}}
+            },
+            "intent-recognition.cache-size": {"intent-recognition": {"cache-size": -1}},
+        }
+
+        for query, profile in invalid_profiles.items():
+            with self.subTest(query):
+                with self.assertRaisesRegex(ValueError, re.escape(query)):
+                    Settings.from_profile(profile)
+
+    def test_bool(self):
+        """Check that boolean settings only accept boolean values."""
+        from voice2json.settings import Settings
+
+        for value, expected in [
+            (True, True),
+            (False, False),
+            ("false", False),
+            ("No", False),
+            ("0", False),
+            (0, False),
+            ("TRUE", True),
+            ("yes", True),
+            (1, True),
+        ]:
+            with self.subTest(value):
+                settings = Settings.from_profile(
+                    {
+                        "speech-to-text": {"julius": {"streaming": value}},
+                        "intent-recognition": {"fuzzy": value},
+                    }
+                )
+                self.assertEqual(expected, settings.speech_to_text.julius.streaming)
+                self.assertEqual(expected, settings.intent_recognition.fuzzy)
+
+        for value in ["off", "", 2, None, []]:
+            with self.subTest(value):
+                with self.assertRaisesRegex(
+                    ValueError, "Invalid profile setting intent-recognition.fuzzy"
+                ):
+                    Settings.from_profile({"intent-recognition": {"fuzzy": value}})
+
+
+# -----------------------------------------------------------------------------
+
+
+class IntentGraphFingerprintTestCase(unittest.TestCase):
+    def test_fingerprint(self):
+        """Check that fingerprints only change with the graph's content."""
+        import rhasspynlu
+
+        from voice2json.paths import get_intent_graph_fingerprint
+
+        fingerprint = get_intent_graph_fingerprint(make_test_graph())
+        self.assertEqual(fingerprint, get_intent_graph_fingerprint(make_test_graph()))
+
+        # Intents and alternatives in a different order (e.g., slot programs)
+        reordered_ini = "\n".join(
+            [
+                "[GetTime]",
+                "what time is it",
+                "(what is | tell me) the time [please]",
+                "",
+                "[SetLight]",
+                "turn (off | on){state} [the] (kitchen light | living room lamp){name}",
+                "set brightness to (ten:10 | one:1 | two:2){value!int} [percent]",
+                "set the (green | red){color} light (off | on){state}",
+            ]
+        )
+        reordered_graph = rhasspynlu.intents_to_graph(
+            rhasspynlu.parse_ini(reordered_ini)
+        )
+        self.assertEqual(fingerprint, get_intent_graph_fingerprint(reordered_graph))
+
+        # Different slot value
+        changed_graph = rhasspynlu.intents_to_graph(
+            rhasspynlu.parse_ini(TEST_SENTENCES_INI.replace("ten:10", "ten:100"))
+        )
+        self.assertNotEqual(fingerprint, get_intent_graph_fingerprint(changed_graph))
+
+
+# -----------------------------------------------------------------------------
+
+
+class RecognitionCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.profile_dir = Path(self.temp_dir.name)
+
+        # Converter that doubles its input
+        converters_dir = self.profile_dir / "converters"
+        converters_dir.mkdir()
+        double_path = converters_dir / "double"
+        double_path.write_text(
+            "\n".join(
+                [
+                    f"#!{sys.executable}",
+                    "import json, sys",
+                    "for line in sys.stdin:",
+                    "    print(json.loads(line) * 2)",
+                ]
+            )
+        )
+        double_path.chmod(0o755)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _make_recognizer(self, **settings):
+        """Create a recognizer for the test sentences plus a converter."""
+        import rhasspynlu
+
+        from voice2json.core import Voice2JsonCore
+        from voice2json.recognize import IntentRecognizer
+
+        profile = {
+            "intent-recognition": {
+                "cache-file": str(self.profile_dir / "recognition_cache.pickle"),
+                **settings,
+            }
+        }
+        core = Voice2JsonCore(self.profile_dir / "profile.yml", profile)
+
+        intent_graph = rhasspynlu.intents_to_graph(
+            rhasspynlu.parse_ini(
+                TEST_SENTENCES_INI
+                + "\n[SetVolume]\nset volume to (one:1 | two:2){volume!int!double}\n"
+            )
+        )
+
+        return IntentRecognizer(core, intent_graph=intent_graph)
+
+    def test_cache(self):
+        """Check cache hits, copies, and least recently used eviction."""
+        recognizer = self._make_recognizer(**{"cache-size": 2})
+        try:
+            first = recognizer.recognize("turn on the kitchen light")
+            self.assertEqual("SetLight", first.intent.name)
+
+            # Returned recognitions can be modified without changing the cache
+            first.intent.name = "Changed"
+            second = recognizer.recognize("turn on the kitchen light")
+            self.assertEqual("SetLight", second.intent.name)
+            self.assertEqual((1, 1), (recognizer.cache_hits, recognizer.cache_misses))
+
+            # Intent filter is part of the key
+            filtered = recognizer.recognize(
+                "turn on the kitchen light", intent_filter={"GetTime"}
+            )
+            self.assertEqual("", filtered.intent.name)
+            self.assertEqual(2, recognizer.cache_misses)
+
+            # Oldest recognition is evicted
+            recognizer.recognize("what time is it")
+            self.assertEqual(2, len(recognizer.cache))
+            self.assertNotIn(
+                (tuple("turn on the kitchen light".split()), None), recognizer.cache
+            )
+        finally:
+            recognizer.stop()
+
+    def test_converters(self):
+        """Check that recognitions from user converters aren't cached."""
+        recognizer = self._make_recognizer()
+        try:
+            for _ in range(2):
+                recognition = recognizer.recognize("set volume to two")
+                self.assertEqual("SetVolume", recognition.intent.name)
+                self.assertEqual(4, recognition.entities[0].value)
+
+            self.assertEqual(0, len(recognizer.cache))
+            self.assertEqual(0, recognizer.cache_hits)
+        finally:
+            recognizer.stop()
+
+    def test_persistent_cache(self):
+        """Check that saved recognitions are only used with the same settings."""
+        recognizer = self._make_recognizer()
+        try:
+            recognizer.recognize("what time is it")
+        finally:
+            recognizer.stop()
+
+        recognizer = self._make_recognizer()
+        try:
+            self.assertEqual(1, len(recognizer.cache))
+        finally:
+            recognizer.stop()
+
+        recognizer = self._make_recognizer(fuzzy=False)
+        try:
+            self.assertEqual(0, len(recognizer.cache))
+        finally:
+            recognizer.stop()
+
+
+# -----------------------------------------------------------------------------
+
+
+class TranscribeStreamTestCase(unittest.TestCase):
+    class FailingTranscriber:
+        """Transcriber that fails after reading some audio."""
+
+        def transcribe_stream(self, audio_stream, *args):
+            next(iter(audio_stream))
+            raise RuntimeError("Transcriber failed")
+
+        def stop(self):
+            pass
+
+    class SilentRecorder:
+        """Recorder that never detects a voice command."""
+
+        events: typing.List[typing.Any] = []
+
+        def start(self):
+            pass
+
+        def process_chunk(self, chunk):
+            return None
+
+    class EndlessAudioSource:
+        """Audio source that never runs out."""
+
+        async def read(self, size):
+            await asyncio.sleep(0)
+            return bytes(size)
+
+        async def close(self):
+            pass
+
+    def test_transcriber_error(self):
+        """Check that a failing transcriber stops the command instead of hanging."""
+        try:
+            import rhasspyasr  # noqa: F401
+            import rhasspysilence  # noqa: F401
+        except ImportError:
+            self.skipTest("rhasspyasr/rhasspysilence not available")
+
+        from voice2json.settings import Settings
+        from voice2json.transcribe import transcribe_stream
+
+        test_case = self
+
+        class FakeCore:
+            settings = Settings.from_profile(
+                {"audio": {"buffer-policy": "block", "buffer-seconds": 0.1}}
+            )
+
+            def check_trained(self):
+                return True
+
+            def get_command_recorder(self):
+                return test_case.SilentRecorder()
+
+            def get_transcriber(self, **kwargs):
+                return test_case.FailingTranscriber()
+
+            async def make_audio_source(self, audio_source):
+                return test_case.EndlessAudioSource()
+
+        args = argparse.Namespace(
+            wav_sink=None,
+            event_sink=None,
+            audio_source="-",
+            open=False,
+            debug=False,
+            chunk_size=1024,
+            timeout=None,
+            exit_count=None,
+        )
+
+        with self.assertRaisesRegex(RuntimeError, "Transcriber failed"):
+            asyncio.run(asyncio.wait_for(transcribe_stream(args, FakeCore()), 30))
+
+
+# -----------------------------------------------------------------------------
+
+
+class RecognizeIntentTestCase(unittest.TestCase):
+    def setUp(self):
+        from voice2json.graph import write_compact_graph
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.profile_dir = Path(self.temp_dir.name)
+        self.cache_path = self.profile_dir / "recognition_cache.pickle"
+
+        (self.profile_dir / "profile.yml").write_text(
+            "\n".join(
+                [
+                    "speech-to-text:",
+                    "  acoustic-model-type: dummy",
+                    "intent-recognition:",
+                    f"  cache-file: {self.cache_path}",
+                ]
+            )
+        )
+        write_compact_graph(make_test_graph(), self.profile_dir / "intent.graph")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _recognize(self, sentences, *args) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Run recognize-intent and return JSON output lines."""
+        output = subprocess.check_output(
+            [
+                sys.executable,
+                "-m",
+                "voice2json",
+                "--profile",
+                str(self.profile_dir / "profile.yml"),
+                "recognize-intent",
+                "--text-input",
+                *args,
+                *sentences,
+            ],
+            cwd=voice2json_dir,
+        )
+
+        return [json.loads(line) for line in output.decode().splitlines()]
+
+    def test_workers_cache(self):
+        """Check that recognitions from worker processes are saved to the cache."""
+        sentences = [
+            "turn on the kitchen light",
+            "what time is it",
+            "set the red light off",
+            "what is the time",
+        ]
+        results = self._recognize(sentences, "--workers", "2", "--batch-size", "1")
+        self.assertEqual(
+            ["SetLight", "GetTime", "SetLight", "GetTime"],
+            [result["intent"]["name"] for result in results],
+        )
+
+        with open(self.cache_path, "rb") as cache_file:
+            _, cache = pickle.load(cache_file)
+
+        self.assertEqual(
+            {tuple(sentence.split()) for sentence in sentences},
+            {tokens for tokens, _ in cache},
+        )
+
+        # Nothing new to save
+        cache_mtime = self.cache_path.stat().st_mtime_ns
+        self._recognize(sentences[:2], "--workers", "2")
+        self.assertEqual(cache_mtime, self.cache_path.stat().st_mtime_ns)
+
+
+# -----------------------------------------------------------------------------
+
+
+class ServeTestCase(unittest.TestCase):
+    class FakeTranscriber:
+        """Transcriber that always hears the same sentence."""
+
+        def transcribe_wav(self, wav_data):
+            from rhasspyasr import Transcription
+
+            return Transcription(
+                text="what time is it",
+                likelihood=1,
+                transcribe_seconds=0,
+                wav_seconds=0,
+            )
+
+        def stop(self):
+            pass
+
+    def setUp(self):
+        from voice2json.graph import write_compact_graph
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.profile_dir = Path(self.temp_dir.name)
+        write_compact_graph(make_test_graph(), self.profile_dir / "intent.graph")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _request(self, method: str, path: str, **kwargs):
+        """Make a request to the server. Returns (status, body)."""
+        from aiohttp.test_utils import TestClient, TestServer
+
+        from voice2json.core import Voice2JsonCore
+        from voice2json.serve import make_app
+
+        transcriber = self.FakeTranscriber()
+
+        class FakeCore(Voice2JsonCore):
+            def get_transcriber(self, **kwargs):
+                return transcriber
+
+        core = FakeCore(self.profile_dir / "profile.yml", {})
+        args = argparse.Namespace(
+            open=False, debug=False, max_request_bytes=1024 * 1024, max_examples=5
+        )
+
+        async def do_request():
+            async with TestClient(TestServer(make_app(args, core))) as client:
+                response = await client.request(method, path, **kwargs)
+                return response.status, await response.text()
+
+        return asyncio.run(do_request())
+
+    def test_recognize_intent(self):
+        """Check recognition from JSON and plain text."""
+        status, body = self._request(
+            "POST",
+            "/api/recognize-intent",
+            json={"text": "turn on the kitchen light", "id": 1},
+        )
+        self.assertEqual(200, status)
+        result = json.loads(body)
+        self.assertEqual("SetLight", result["intent"]["name"])
+        self.assertEqual({"state": "on", "name": "kitchen light"}, result["slots"])
+        self.assertEqual(1, result["id"])
+
+        status, body = self._request(
+            "POST",
+            "/api/recognize-intent",
+            params={"intent-filter": "SetLight"},
+            data="what time is it",
+        )
+        self.assertEqual(200, status)
+        self.assertEqual("", json.loads(body)["intent"]["name"])
+
+    def test_recognize_intent_bad_request(self):
+        """Check that JSON that isn't an object is rejected."""
+        for data in ["[]", '"hi"', "42", "{"]:
+            with self.subTest(data):
+                status, _ = self._request(
+                    "POST",
+                    "/api/recognize-intent",
+                    data=data,
+                    headers={"Content-Type": "application/json"},
+                )
+                self.assertEqual(400, status)
+
+    def test_transcribe_recognize(self):
+        """Check transcription followed by recognition."""
+        with io.BytesIO() as wav_buffer:
+            wav_file: wave.Wave_write = wave.open(wav_buffer, "wb")
+            with wav_file:
+                wav_file.setframerate(16000)
+                wav_file.setsampwidth(2)
+                wav_file.setnchannels(1)
+                wav_file.writeframes(bytes(3200))
+
+            wav_data = wav_buffer.getvalue()
+
+        status, body = self._request("POST", "/api/transcribe-recognize", data=wav_data)
+        self.assertEqual(200, status)
+        result = json.loads(body)
+        self.assertEqual("what time is it", result["text"])
+        self.assertEqual("GetTime", result["intent"]["name"])
+
+    def test_generate_examples(self):
+        """Check that the number of examples is limited by --max-examples."""
+        status, body = self._request(
+            "GET", "/api/generate-examples", params={"number": "2"}
+        )
+        self.assertEqual(200, status)
+        self.assertEqual(2, len(json.loads(body)))
+
+        status, body = self._request(
+            "GET", "/api/generate-examples", params={"number": "100"}
+        )
+        self.assertEqual(200, status)
+        self.assertEqual(5, len(json.loads(body)))
+
+        for number in ["-1", "many"]:
+            with self.subTest(number):
+                status, _ = self._request(
+                    "GET", "/api/generate-examples", params={"number": number}
+                )
+                self.assertEqual(400, status)
+
+
+# -----------------------------------------------------------------------------
+
+
+class ProfileCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.base_dir = Path(self.temp_dir.name)
+
+        defaults_yaml = self.base_dir / "etc" / "profile.defaults.yml"
+        defaults_yaml.parent.mkdir()
+        defaults_yaml.write_text("intent-recognition:\n  fuzzy: true\n")
+
+        self.profile_dir = self.base_dir / "profile"
+        self.profile_dir.mkdir()
+        self.profile_yaml = self.profile_dir / "profile.yml"
+        self.profile_yaml.write_text(
+            'language:\n  code: !env "${VOICE2JSON_TEST_LANGUAGE}"\n'
+        )
+        self.cache_path = self.profile_dir / ".profile.cache.json"
+
+        os.environ["VOICE2JSON_TEST_LANGUAGE"] = "en-US"
+
+    def tearDown(self):
+        os.environ.pop("VOICE2JSON_TEST_LANGUAGE", None)
+        self.temp_dir.cleanup()
+
+    def _load_profile(self, *settings):
+        """Load profile with --setting overrides. Returns (profile, number of loads)."""
+        import voice2json.__main__ as voice2json_main
+
+        args = argparse.Namespace(
+            base_directory=self.base_dir,
+            machine="x86_64",
+            no_profile_cache=False,
+            setting=list(settings),
+        )
+
+        num_loads = 0
+        merge_profile = voice2json_main.merge_profile
+
+        def counting_merge_profile(*merge_args):
+            nonlocal num_loads
+            num_loads += 1
+            return merge_profile(*merge_args)
+
+        voice2json_main.merge_profile = counting_merge_profile
+        try:
+            profile = voice2json_main.load_profile(
+                self.profile_dir, self.profile_yaml, args
+            )
+        finally:
+            voice2json_main.merge_profile = merge_profile
+
+        return profile, num_loads
+
+    def test_reuse(self):
+        """Check that the cache is used when nothing has changed."""
+        profile, num_loads = self._load_profile()
+        self.assertEqual(1, num_loads)
+        self.assertTrue(self.cache_path.is_file())
+        self.assertEqual("en-US", profile["language"]["code"])
+        self.assertTrue(profile["intent-recognition"]["fuzzy"])
+
+        cached_profile, num_loads = self._load_profile()
+        self.assertEqual(0, num_loads)
+        self.assertEqual(profile, cached_profile)
+
+    def test_source_changed(self):
+        """Check that changing a profile file invalidates the cache."""
+        self._load_profile()
+
+        # Different size
+        self.profile_yaml.write_text(
+            'language:\n  code: !env "${VOICE2JSON_TEST_LANGUAGE}-x"\n'
+        )
+        profile, num_loads = self._load_profile()
+        self.assertEqual(1, num_loads)
+        self.assertEqual("en-US-x", profile["language"]["code"])
+
+        # Same size, different modification time
+        self.profile_yaml.write_text(
+            'language:\n  code: !env "${VOICE2JSON_TEST_LANGUAGE}-y"\n'
+        )
+        profile_stat = self.profile_yaml.stat()
+        os.utime(
+            self.profile_yaml,
+            ns=(profile_stat.st_atime_ns, profile_stat.st_mtime_ns + 1000000000),
+        )
+        profile, num_loads = self._load_profile()
+        self.assertEqual(1, num_loads)
+        self.assertEqual("en-US-y", profile["language"]["code"])
+
+        # Defaults
+        (self.base_dir / "etc" / "profile.defaults.yml").write_text(
+            "intent-recognition:\n  fuzzy: false\n"
+        )
+        profile, num_loads = self._load_profile()
+        self.assertEqual(1, num_loads)
+        self.assertFalse(profile["intent-recognition"]["fuzzy"])
+
+    def test_environment_changed(self):
+        """Check that changing a variable used by !env invalidates the cache."""
+        self._load_profile()
+
+        os.environ["VOICE2JSON_TEST_LANGUAGE"] = "de-DE"
+        profile, num_loads = self._load_profile()
+        self.assertEqual(1, num_loads)
+        self.assertEqual("de-DE", profile["language"]["code"])
+
+        # Unreferenced variables don't matter
+        os.environ["VOICE2JSON_TEST_UNUSED"] = "1"
+        try:
+            _, num_loads = self._load_profile()
+            self.assertEqual(0, num_loads)
+        finally:
+            os.environ.pop("VOICE2JSON_TEST_UNUSED")
+
+    def test_settings(self):
+        """Check that --setting overrides apply to, but aren't saved in, the cache."""
+        self._load_profile()
+
+        profile, num_loads = self._load_profile(
+            ("intent-recognition.fuzzy", "false"), ("language.code", '"fr-FR"')
+        )
+        self.assertEqual(0, num_loads)
+        self.assertFalse(profile["intent-recognition"]["fuzzy"])
+        self.assertEqual("fr-FR", profile["language"]["code"])
+
+        profile, num_loads = self._load_profile()
+        self.assertEqual(0, num_loads)
+        self.assertTrue(profile["intent-recognition"]["fuzzy"])
+        self.assertEqual("en-US", profile["language"]["code"])
+
+
+# -----------------------------------------------------------------------------
+
+
+class IntentGraphStatsTestCase(unittest.TestCase):
+    def test_stats(self):
+        """Check sentence, node, and edge counts overall and for each intent."""
+        import networkx
+        import rhasspynlu
+
+        from voice2json.paths import get_intent_graph_stats
+
+        graph = make_test_graph()
+        start_node, end_node = rhasspynlu.jsgf_graph.get_start_end_nodes(graph)
+        stats = get_intent_graph_stats(graph)
+
+        self.assertEqual(23, stats["sentences"])
+        self.assertEqual(graph.number_of_nodes(), stats["nodes"])
+        self.assertEqual(graph.number_of_edges(), stats["edges"])
+        self.assertEqual({"SetLight", "GetTime"}, set(stats["intents"]))
+
+        for intent_node in graph.successors(start_node):
+            intent_name = graph.edges[(start_node, intent_node)]["olabel"][
+                len("__label__") :
+            ]
+            with self.subTest(intent_name):
+                intent_stats = stats["intents"][intent_name]
+                intent_nodes = {intent_node} | networkx.descendants(graph, intent_node)
+                self.assertIn(end_node, intent_nodes)
+
+                self.assertEqual(
+                    len(list(networkx.all_simple_paths(graph, intent_node, end_node))),
+                    intent_stats["sentences"],
+                )
+                self.assertEqual(len(intent_nodes), intent_stats["nodes"])
+
+                # Edges within the intent plus the edge from the start node
+                self.assertEqual(
+                    graph.subgraph(intent_nodes).number_of_edges() + 1,
+                    intent_stats["edges"],
+                )
+
+        # Small enough to check by hand
+        self.assertEqual(18, stats["intents"]["SetLight"]["sentences"])
+        self.assertEqual(5, stats["intents"]["GetTime"]["sentences"])
+        self.assertEqual(8, stats["intents"]["GetTime"]["vocabulary"])
+
+        # The shared final node is counted once for each intent, the start node never
+        self.assertEqual(
+            graph.number_of_nodes() - 1 + (len(stats["intents"]) - 1),
+            sum(s["nodes"] for s in stats["intents"].values()),
+        )
+        self.assertEqual(
+            graph.number_of_edges(),
+            sum(s["edges"] for s in stats["intents"].values()),
+        )
+
+    def test_print_graph_stats(self):
+        """Check print-graph-stats for a profile without saved statistics."""
+        from voice2json.graph import write_compact_graph
+        from voice2json.paths import get_intent_graph_stats
+
+        graph = make_test_graph()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            profile_dir = Path(temp_dir)
+            write_compact_graph(graph, profile_dir / "intent.graph")
+
+            stats = json.loads(
+                subprocess.check_output(
+                    [
+                        sys.executable,
+                        "-m",
+                        "voice2json",
+                        "--profile",
+                        str(profile_dir),
+                        "print-graph-stats",
+                    ],
+                    cwd=voice2json_dir,
+                )
+            )
+
+        self.assertEqual(get_intent_graph_stats(graph), stats)
+
+
+# -----------------------------------------------------------------------------
+
+
+class PersistentConverterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.starts_path = Path(self.temp_dir.name) / "starts.txt"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _make_converter(self, respond: bool = True):
+        """Create converter that echoes its input along with its process id."""
+        from voice2json.recognize import PersistentCommandLineConverter
+
+        converter_path = Path(self.temp_dir.name) / "echo"
+        converter_path.write_text(
+            "\n".join(
+                [
+                    f"#!{sys.executable}",
+                    "import json, os, sys",
+                    f"with open({str(self.starts_path)!r}, 'a') as starts_file:",
+                    "    print(os.getpid(), file=starts_file)",
+                    "for line in sys.stdin:",
+                    f"    if not {respond}:",
+                    "        break",
+                    "    request = json.loads(line)",
+                    "    values = [",
+                    "        [arg, request['converter_args'], os.getpid()]",
+                    "        for arg in request['args']",
+                    "    ]",
+                    "    print(json.dumps(values), flush=True)",
+                ]
+            )
+        )
+        converter_path.chmod(0o755)
+
+        return PersistentCommandLineConverter("echo", converter_path)
+
+    def _num_starts(self) -> int:
+        return len(self.starts_path.read_text().splitlines())
+
+    def test_protocol(self):
+        """Check that one program handles many JSON requests."""
+        converter = self._make_converter()
+        try:
+            values = converter(1, "two", converter_args=["x"])
+            self.assertEqual([[1, ["x"]], ["two", ["x"]]], [v[:2] for v in values])
+
+            pid = values[0][2]
+            self.assertEqual([[3, [], pid]], converter(3))
+            self.assertEqual(1, self._num_starts())
+        finally:
+            converter.stop()
+
+        self.assertIsNone(converter.proc)
+
+    def test_restart(self):
+        """Check that a program that exits is restarted once."""
+        converter = self._make_converter()
+        try:
+            pid = converter(1)[0][2]
+
+            converter.proc.kill()
+            converter.proc.wait()
+
+            new_pid = converter(2)[0][2]
+            self.assertNotEqual(pid, new_pid)
+            self.assertEqual(2, self._num_starts())
+        finally:
+            converter.stop()
+
+    def test_failure(self):
+        """Check that a program that never responds fails after one restart."""
+        converter = self._make_converter(respond=False)
+        try:
+            with self.assertRaises(RuntimeError):
+                converter(1)
+
+            self.assertEqual(2, self._num_starts())
+        finally:
+            converter.stop()
+
+    def test_fork(self):
+        """Check that forked processes start their own copy of the program."""
+        converter = self._make_converter()
+        try:
+            parent_pid = converter(1)[0][2]
+
+            read_fd, write_fd = os.pipe()
+            child_pid = os.fork()
+            if child_pid == 0:
+                # Child process
+                try:
+                    os.close(read_fd)
+                    os.write(write_fd, json.dumps(converter(2)).encode())
+                    converter.stop()
+                finally:
+                    os._exit(0)
+
+            os.close(write_fd)
+            with os.fdopen(read_fd, "rb") as read_file:
+                child_values = json.loads(read_file.read())
+
+            os.waitpid(child_pid, 0)
+
+            self.assertNotEqual(parent_pid, child_values[0][2])
+
+            # Parent's program is still running
+            self.assertEqual([[3, [], parent_pid]], converter(3))
+            self.assertEqual(2, self._num_starts())
+        finally:
+            converter.stop()
+
+
+# -----------------------------------------------------------------------------
+
+
 class ProfileTestCase(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -178,6 +1771,61 @@ class ProfileTestCase(unittest.TestCase):
                 )
                 self.assertEqual(g2p_test["unknown"]["phonemes"], unknown_phonemes)
 
+    # -------------------------------------------------------------------------
+
+    def _recognize_intents(self, profile_dir, sentences, *args):
+        """Use recognize-intent command to recognize plain text sentences."""
+        output = subprocess.check_output(
+            [
+                "voice2json",
+                "--profile",
+                str(profile_dir),
+                "recognize-intent",
+                "--text-input",
+                *args,
+            ],
+            input="\n".join(sentences).encode(),
+        )
+
+        results = [json.loads(line) for line in output.decode().splitlines()]
+        for result in results:
+            result.pop("recognize_seconds", None)
+
+        return results
+
+    def test_recognize_workers(self):
+        """Check that recognize-intent gives the same output with multiple workers."""
+        for profile_dir in profile_dirs:
+            with self.subTest(profile_dir):
+                examples = subprocess.check_output(
+                    [
+                        "voice2json",
+                        "--profile",
+                        str(profile_dir),
+                        "generate-examples",
+                        "--number",
+                        "50",
+                        "--seed",
+                        "1",
+                    ]
+                )
+                sentences = [
+                    json.loads(line)["raw_text"]
+                    for line in examples.decode().splitlines()
+                ]
+
+                # Include a sentence that can't be recognized
+                sentences.append("this is not a valid sentence")
+
+                serial_results = self._recognize_intents(profile_dir, sentences)
+                self.assertEqual(len(sentences), len(serial_results))
+                self.assertEqual("", serial_results[-1]["intent"]["name"])
+
+                parallel_results = self._recognize_intents(
+                    profile_dir, sentences, "--workers", "2", "--batch-size", "3"
+                )
+                self.assertEqual(serial_results, parallel_results)
+
 
 # -----------------------------------------------------------------------------
 
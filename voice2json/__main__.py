@@ -7,50 +7,42 @@ For more details, see https://voice2json.org
 import argparse
 import asyncio
 import collections
+import importlib
 import json
 import logging
 import os
 import platform
-import ssl
 import sys
 import time
 import typing
 from pathlib import Path
 
-import pydash
-import yaml
-from tqdm import tqdm
-
-from .core import Voice2JsonCore
-from .generate import generate
-from .pronounce import pronounce
-from .recognize import recognize
-from .record import record_command, record_examples
-from .speak import speak
-from .test import test_examples
-from .transcribe import transcribe_stream, transcribe_wav
-from .utils import (
-    download_file,
-    env_constructor,
-    get_profile_downloads,
-    print_json,
-    reassemble_large_files,
-    recursive_update,
-)
-from .wake import wake
+# Everything else is imported by the sub-command that needs it, so startup
+# (and --help) stays fast.
+if typing.TYPE_CHECKING:
+    from .core import Voice2JsonCore
 
 _LOGGER = logging.getLogger("voice2json")
 
 DEFAULT_PROFILE = "en-us_kaldi-zamia"
 
+# Commands whose JSON output is always flushed line by line
+_STREAMING_COMMANDS = {
+    "transcribe-stream",
+    "record-command",
+    "wait-wake",
+    "record-examples",
+}
+
+# Commands whose JSON output is flushed line by line when reading from a
+# terminal or pipe.
+_STDIN_COMMANDS = {"transcribe-wav", "recognize-intent", "pronounce-word"}
+
 # -----------------------------------------------------------------------------
 
 
 async def main():
     """Called at startup."""
-    # Expand environment variables in string value
-    yaml.SafeLoader.add_constructor("!env", env_constructor)
-
     if len(sys.argv) > 1:
         if sys.argv[1] == "--version":
             # Patch argv to use print-version command
@@ -62,6 +54,8 @@ async def main():
     # Parse command-line arguments
     args = get_args()
 
+    from .utils import configure_json_output, flush_json_output, is_regular_file
+
     # voice2json_dir
     if not args.base_directory:
         args.base_directory = os.environ.get("voice2json_dir", os.getcwd())
@@ -75,9 +69,21 @@ async def main():
 
     _LOGGER.debug(args)
 
+    # Flush every line of JSON output when a person or another program may be
+    # waiting on it.
+    interactive = args.command in _STREAMING_COMMANDS
+    if args.flush_interval is None:
+        args.flush_interval = 1.0
+        interactive = interactive or (
+            (args.command in _STDIN_COMMANDS) and (not is_regular_file(sys.stdin))
+        )
+
+    configure_json_output(args.flush_interval, line_buffered=interactive)
+
     if args.command in ["print-downloads", "print-version", "download-profile"]:
         # Special-case commands (no core loaded)
         await args.func(args)
+        flush_json_output()
     else:
         # Load profile and create core
         core = await get_core(args)
@@ -86,12 +92,23 @@ async def main():
         try:
             await args.func(args, core)
         finally:
+            flush_json_output()
             await core.stop()
 
 
 # -----------------------------------------------------------------------------
 
 
+def lazy_command(module_name: str, function_name: str):
+    """Create a sub-command function that imports its module when called."""
+
+    async def command(*args):
+        module = importlib.import_module(module_name, package=__package__)
+        return await getattr(module, function_name)(*args)
+
+    return command
+
+
 def get_args() -> argparse.Namespace:
     """Parse command-line arguments."""
     parser = argparse.ArgumentParser(prog="voice2json", description="voice2json")
@@ -130,6 +147,18 @@ def get_args() -> argparse.Namespace:
             help="Don't automatically train profile",
         )
 
+        argparser.add_argument(
+            "--no-profile-cache",
+            action="store_true",
+            help="Always re-load profile YAML instead of using cached settings",
+        )
+
+        argparser.add_argument(
+            "--flush-interval",
+            type=float,
+            help="Seconds between flushes of JSON output (0 for every line, default: automatic)",
+        )
+
         argparser.add_argument(
             "--debug", action="store_true", help="Print DEBUG messages to console"
         )
@@ -157,6 +186,15 @@ def get_args() -> argparse.Namespace:
     )
     print_parser.set_defaults(func=print_profile)
 
+    # -----------------
+    # print-graph-stats
+    # -----------------
+    graph_stats_parser = sub_parsers.add_parser(
+        "print-graph-stats",
+        help="Print number of sentences and words for each intent as JSON",
+    )
+    graph_stats_parser.set_defaults(func=print_graph_stats)
+
     # ---------------
     # print-downloads
     # ---------------
@@ -217,6 +255,11 @@ def get_args() -> argparse.Namespace:
         "train-profile", help="Train voice2json profile"
     )
     train_parser.set_defaults(func=train)
+    train_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-run all training stages even if their inputs haven't changed",
+    )
 
     # --------------
     # transcribe-wav
@@ -224,7 +267,9 @@ def get_args() -> argparse.Namespace:
     transcribe_wav_parser = sub_parsers.add_parser(
         "transcribe-wav", help="Transcribe WAV file to text"
     )
-    transcribe_wav_parser.set_defaults(func=transcribe_wav)
+    transcribe_wav_parser.set_defaults(
+        func=lazy_command(".transcribe", "transcribe_wav")
+    )
     transcribe_wav_parser.add_argument(
         "--stdin-files",
         "-f",
@@ -245,6 +290,23 @@ def get_args() -> argparse.Namespace:
         action="store_true",
         help="WAV file byte size is sent on a separate line for each input WAV on stdin",
     )
+    transcribe_wav_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of transcribers to run in parallel for WAV files (default: 1)",
+    )
+    transcribe_wav_parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=4,
+        help="Number of WAV files to load/convert ahead of transcription (default: 4)",
+    )
+    transcribe_wav_parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help="Output transcriptions as soon as they're ready instead of in input order",
+    )
     transcribe_wav_parser.add_argument(
         "wav_file", nargs="*", default=[], help="Path(s) to WAV file(s)"
     )
@@ -255,7 +317,9 @@ def get_args() -> argparse.Namespace:
     transcribe_stream_parser = sub_parsers.add_parser(
         "transcribe-stream", help="Transcribe live stream of WAV chunks to text"
     )
-    transcribe_stream_parser.set_defaults(func=transcribe_stream)
+    transcribe_stream_parser.set_defaults(
+        func=lazy_command(".transcribe", "transcribe_stream")
+    )
     transcribe_stream_parser.add_argument(
         "--audio-source",
         "-a",
@@ -302,7 +366,7 @@ def get_args() -> argparse.Namespace:
     recognize_parser = sub_parsers.add_parser(
         "recognize-intent", help="Recognize intent from JSON or text"
     )
-    recognize_parser.set_defaults(func=recognize)
+    recognize_parser.set_defaults(func=lazy_command(".recognize", "recognize"))
     recognize_parser.add_argument(
         "sentence", nargs="*", default=[], help="Sentences to recognize"
     )
@@ -334,6 +398,18 @@ def get_args() -> argparse.Namespace:
         default="text",
         help="JSON property containing transcription text (default: text)",
     )
+    recognize_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to recognize sentences (default: 1)",
+    )
+    recognize_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Number of sentences handed to a worker at a time (default: 100)",
+    )
 
     # --------------
     # record-command
@@ -363,7 +439,7 @@ def get_args() -> argparse.Namespace:
     command_parser.add_argument(
         "--event-sink", "-e", help="File to write JSON events to instead of stdout"
     )
-    command_parser.set_defaults(func=record_command)
+    command_parser.set_defaults(func=lazy_command(".record", "record_command"))
 
     # ---------
     # wait-wake
@@ -387,7 +463,7 @@ def get_args() -> argparse.Namespace:
         type=int,
         help="Exit after the wake word has been spoken some number of times",
     )
-    wake_parser.set_defaults(func=wake)
+    wake_parser.set_defaults(func=lazy_command(".wake", "wake"))
 
     # --------------
     # pronounce-word
@@ -426,7 +502,7 @@ def get_args() -> argparse.Namespace:
         action="store_true",
         help="Print a blank line after the end of each word's pronunciations",
     )
-    pronounce_parser.set_defaults(func=pronounce)
+    pronounce_parser.set_defaults(func=lazy_command(".pronounce", "pronounce"))
 
     # -----------------
     # generate-examples
@@ -434,8 +510,14 @@ def get_args() -> argparse.Namespace:
     generate_parser = sub_parsers.add_parser(
         "generate-examples", help="Randomly generate example intents from profile"
     )
-    generate_parser.add_argument(
-        "--number", "-n", type=int, required=True, help="Number of examples to generate"
+    generate_number_group = generate_parser.add_mutually_exclusive_group(required=True)
+    generate_number_group.add_argument(
+        "--number", "-n", type=int, help="Number of examples to generate"
+    )
+    generate_number_group.add_argument(
+        "--all",
+        action="store_true",
+        help="Generate every possible example in order (instead of randomly)",
     )
     generate_parser.add_argument(
         "--raw-symbols",
@@ -445,7 +527,26 @@ def get_args() -> argparse.Namespace:
     generate_parser.add_argument(
         "--iob", action="store_true", help="Output IOB format instead of JSON"
     )
-    generate_parser.set_defaults(func=generate)
+    generate_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to generate examples (default: 1)",
+    )
+    generate_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Number of examples handed to a worker at a time (default: 1000)",
+    )
+    generate_parser.add_argument(
+        "--seed", type=int, help="Random seed for reproducible examples"
+    )
+    generate_parser.add_argument(
+        "--shard-directory",
+        help="Write examples to one file per worker in this directory instead of stdout",
+    )
+    generate_parser.set_defaults(func=lazy_command(".generate", "generate"))
 
     # record-examples
     record_examples_parser = sub_parsers.add_parser(
@@ -466,7 +567,7 @@ def get_args() -> argparse.Namespace:
         default=1024,
         help="Number of bytes to read at a time from stdin",
     )
-    record_examples_parser.set_defaults(func=record_examples)
+    record_examples_parser.set_defaults(func=lazy_command(".record", "record_examples"))
 
     # -------------
     # test-examples
@@ -496,9 +597,44 @@ def get_args() -> argparse.Namespace:
         "--threads",
         type=int,
         default=1,
-        help="Maximum number of threads to use (default=1)",
+        help="Number of transcribers to run in parallel (default=1)",
     )
-    test_examples_parser.set_defaults(func=test_examples)
+    test_examples_parser.set_defaults(func=lazy_command(".test", "test_examples"))
+
+    # -----
+    # serve
+    # -----
+    serve_parser = sub_parsers.add_parser(
+        "serve", help="Run HTTP server that keeps profile loaded between requests"
+    )
+    serve_parser.add_argument(
+        "--host", default="127.0.0.1", help="Host for HTTP server (default: 127.0.0.1)"
+    )
+    serve_parser.add_argument(
+        "--port", type=int, default=5000, help="Port for HTTP server (default: 5000)"
+    )
+    serve_parser.add_argument(
+        "--socket", help="Path to Unix domain socket (overrides --host/--port)"
+    )
+    serve_parser.add_argument(
+        "--open",
+        "-o",
+        action="store_true",
+        help="Use large pre-built model for transcription",
+    )
+    serve_parser.add_argument(
+        "--max-request-bytes",
+        type=int,
+        default=50 * 1024 * 1024,
+        help="Maximum size of request body in bytes (default: 50 MB)",
+    )
+    serve_parser.add_argument(
+        "--max-examples",
+        type=int,
+        default=1000,
+        help="Maximum number of examples per generate-examples request (default: 1000)",
+    )
+    serve_parser.set_defaults(func=lazy_command(".serve", "serve"))
 
     # ------------------
     # show-documentation
@@ -525,7 +661,7 @@ def get_args() -> argparse.Namespace:
     speak_parser.add_argument(
         "--marytts", action="store_true", help="Use MaryTTS instead of eSpeak"
     )
-    speak_parser.set_defaults(func=speak)
+    speak_parser.set_defaults(func=lazy_command(".speak", "speak"))
 
     # ----------------
     # download-profile
@@ -653,18 +789,61 @@ def load_profile(
     profile_dir: Path, profile_yaml: Path, args: argparse.Namespace
 ) -> typing.Dict[str, typing.Any]:
     """Load profile YAML with default settings, overrides, and platform-specific settings"""
+    import pydash
+
     # Set environment variable usually referenced in profile
     os.environ["profile_dir"] = str(profile_dir)
 
     # x86_64, armv7l, aarch64, ...
     os.environ["machine"] = args.machine
 
-    # Load profile defaults
+    if profile_yaml.exists():
+        os.environ["profile_file"] = str(profile_yaml)
+
     defaults_yaml = args.base_directory / "etc" / "profile.defaults.yml"
+
+    # Merged settings are cached next to the profile
+    cache_path: typing.Optional[Path] = None
+    if not args.no_profile_cache:
+        cache_path = profile_yaml.with_name(f".{profile_yaml.stem}.cache.json")
+
+    profile = load_cached(
+        cache_path,
+        [defaults_yaml, profile_yaml],
+        lambda env_names: merge_profile(defaults_yaml, profile_yaml, args, env_names),
+        machine=args.machine,
+    )
+
+    # Override with user settings
+    for setting_path, setting_value in args.setting:
+        try:
+            setting_value = json.loads(setting_value)
+        except json.JSONDecodeError:
+            _LOGGER.warning(
+                "Interpreting setting for %s as a string. Surround with quotes to avoid this warning.",
+                setting_path,
+            )
+            pass
+
+        _LOGGER.debug("Overriding %s with %s", setting_path, setting_value)
+        pydash.set_(profile, setting_path, setting_value)
+
+    return profile
+
+
+def merge_profile(
+    defaults_yaml: Path,
+    profile_yaml: Path,
+    args: argparse.Namespace,
+    env_names: typing.Set[str],
+) -> typing.Dict[str, typing.Any]:
+    """Merge profile YAML into default settings and apply platform-specific settings"""
+    from .utils import recursive_update
+
+    # Load profile defaults
     if defaults_yaml.exists():
         _LOGGER.debug("Loading profile defaults from %s", defaults_yaml)
-        with open(defaults_yaml, "r") as defaults_file:
-            profile = yaml.safe_load(defaults_file)
+        profile = load_yaml(defaults_yaml, env_names)
     else:
         # No defaults
         profile = {}
@@ -673,10 +852,7 @@ def load_profile(
     _LOGGER.debug("Loading profile from %s", profile_yaml)
 
     if profile_yaml.exists():
-        os.environ["profile_file"] = str(profile_yaml)
-
-        with open(profile_yaml, "r") as profile_file:
-            recursive_update(profile, yaml.safe_load(profile_file) or {})
+        recursive_update(profile, load_yaml(profile_yaml, env_names) or {})
     else:
         _LOGGER.warning("%s does not exist. Using default settings.", profile_yaml)
 
@@ -697,33 +873,133 @@ def load_profile(
                     _LOGGER.debug("Overriding %s (machine=%s)", key, args.machine)
                     recursive_update(profile[key], value)
 
-    # Override with user settings
-    for setting_path, setting_value in args.setting:
+    return profile
+
+
+def load_yaml(
+    yaml_path: Path, env_names: typing.Optional[typing.Set[str]] = None
+) -> typing.Any:
+    """Load YAML file, expanding !env tags and recording the variables they use."""
+    import yaml
+
+    from .utils import env_constructor, get_env_names
+
+    class EnvLoader(yaml.SafeLoader):
+        """Safe loader with !env tag."""
+
+    def expand_env(loader, node):
+        if env_names is not None:
+            env_names.update(get_env_names(node.value))
+
+        return env_constructor(loader, node)
+
+    EnvLoader.add_constructor("!env", expand_env)
+
+    with open(yaml_path, "r") as yaml_file:
+        return yaml.load(yaml_file, Loader=EnvLoader)
+
+
+# -----------------------------------------------------------------------------
+
+# Changed when the format of cached values changes
+CACHE_VERSION = 1
+
+
+def load_cached(
+    cache_path: typing.Optional[Path],
+    source_paths: typing.Sequence[Path],
+    load_value: typing.Callable[[typing.Set[str]], typing.Any],
+    machine: str = "",
+) -> typing.Any:
+    """Load a value from a JSON cache, or with load_value if the cache is stale.
+
+    The cache is only used if the source files (size/modification time),
+    machine, and environment variables referenced while loading are unchanged.
+    load_value receives a set to add the names of those variables to.
+    """
+    cache_key = {
+        "version": CACHE_VERSION,
+        "sources": [get_file_info(source_path) for source_path in source_paths],
+        "machine": machine,
+    }
+
+    if (cache_path is not None) and cache_path.is_file():
         try:
-            setting_value = json.loads(setting_value)
-        except json.JSONDecodeError:
-            _LOGGER.warning(
-                "Interpreting setting for %s as a string. Surround with quotes to avoid this warning.",
-                setting_path,
-            )
-            pass
+            with open(cache_path, "r") as cache_file:
+                cache = json.load(cache_file)
 
-        _LOGGER.debug("Overriding %s with %s", setting_path, setting_value)
-        pydash.set_(profile, setting_path, setting_value)
+            if (cache.get("key") == cache_key) and all(
+                os.environ.get(env_name) == env_value
+                for env_name, env_value in cache["environment"].items()
+            ):
+                _LOGGER.debug("Using cached %s", cache_path)
+                return cache["value"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            _LOGGER.debug("Failed to read %s", cache_path, exc_info=True)
+
+    env_names: typing.Set[str] = set()
+    value = load_value(env_names)
+
+    if cache_path is not None:
+        cache = {
+            "key": cache_key,
+            "environment": {
+                env_name: os.environ.get(env_name) for env_name in sorted(env_names)
+            },
+            "value": value,
+        }
+
+        # Write to temporary file first in case another process is reading
+        temp_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}")
+        try:
+            with open(temp_path, "w") as cache_file:
+                json.dump(cache, cache_file)
 
-    return profile
+            temp_path.replace(cache_path)
+            _LOGGER.debug("Wrote %s", cache_path)
+        except (OSError, TypeError, ValueError):
+            # Read-only directory or value that can't be stored as JSON
+            _LOGGER.debug("Failed to write %s", cache_path, exc_info=True)
+            if temp_path.exists():
+                temp_path.unlink()
+
+    return value
+
+
+def get_file_info(file_path: Path) -> typing.List[typing.Any]:
+    """Path, size, and modification time of a file (None if missing)."""
+    try:
+        file_stat = file_path.stat()
+        return [str(file_path), file_stat.st_size, file_stat.st_mtime_ns]
+    except OSError:
+        return [str(file_path), None, None]
 
 
-async def get_core(args: argparse.Namespace) -> Voice2JsonCore:
+async def get_core(args: argparse.Namespace) -> "Voice2JsonCore":
     """Load/download/train profile and create voice2json core."""
+    import ssl
+
+    import pydash
+    from tqdm import tqdm
+
+    from .core import Voice2JsonCore
+    from .utils import download_file, get_profile_downloads, reassemble_large_files
+
     profile_dir, profile_yaml, profile_name = get_profile_location(args)
 
     if profile_name is not None:
         # May need to download files
         download_yaml = args.base_directory / "etc" / "profiles" / f"{profile_name}.yml"
         _LOGGER.debug("Trying to load download info from %s", download_yaml)
-        with open(download_yaml, "r") as download_yaml_file:
-            files_dict = yaml.safe_load(download_yaml_file)
+        download_cache: typing.Optional[Path] = None
+        if profile_dir.is_dir() and (not args.no_profile_cache):
+            download_cache = profile_dir / ".downloads.cache.json"
+
+        files_dict = load_cached(
+            download_cache,
+            [download_yaml],
+            lambda env_names: load_yaml(download_yaml, env_names),
+        )
 
         # Create SSL context for file downloads
         ssl_context = ssl.SSLContext()
@@ -738,7 +1014,7 @@ async def get_core(args: argparse.Namespace) -> Voice2JsonCore:
         if args.command in {"pronounce-word", "speak-sentence"}:
             download_settings["text_to_speech"] = True
 
-        if args.command in {"transcribe-wav", "transcribe-stream"}:
+        if args.command in {"transcribe-wav", "transcribe-stream", "serve"}:
             download_settings["grapheme_to_phoneme"] = True
 
             # Open transcription
@@ -821,7 +1097,7 @@ async def print_version(args: argparse.Namespace) -> None:
 # -----------------------------------------------------------------------------
 
 
-async def print_profile(args: argparse.Namespace, core: Voice2JsonCore) -> None:
+async def print_profile(args: argparse.Namespace, core: "Voice2JsonCore") -> None:
     """Print all settings as JSON."""
     json.dump(core.profile, sys.stdout, indent=4)
 
@@ -829,7 +1105,27 @@ async def print_profile(args: argparse.Namespace, core: Voice2JsonCore) -> None:
 # -----------------------------------------------------------------------------
 
 
-async def print_files(args: argparse.Namespace, core: Voice2JsonCore) -> None:
+async def print_graph_stats(args: argparse.Namespace, core: "Voice2JsonCore") -> None:
+    """Print sentence/vocabulary counts from the intent graph as JSON."""
+    from .paths import get_intent_graph_stats
+
+    # Make sure profile has been trained
+    assert core.check_trained(), "Not trained"
+
+    stats_path = core.ppath("training.intent-stats-file", "intent_stats.json")
+    if stats_path and stats_path.is_file():
+        graph_stats = json.loads(stats_path.read_text())
+    else:
+        # Trained before statistics were saved
+        graph_stats = get_intent_graph_stats(core.load_intent_graph())
+
+    json.dump(graph_stats, sys.stdout, indent=4)
+
+
+# -----------------------------------------------------------------------------
+
+
+async def print_files(args: argparse.Namespace, core: "Voice2JsonCore") -> None:
     """Print paths to user profile files for backup."""
     backup_paths = (
         [
@@ -853,6 +1149,10 @@ async def print_files(args: argparse.Namespace, core: Voice2JsonCore) -> None:
 
 async def print_downloads(args: argparse.Namespace) -> None:
     """Print links to files for profiles."""
+    import yaml
+
+    from .utils import print_json
+
     profiles_dir = args.base_directory / "etc" / "profiles"
 
     if args.list_profiles:
@@ -978,19 +1278,22 @@ async def print_downloads(args: argparse.Namespace) -> None:
 # -----------------------------------------------------------------------------
 
 
-async def train(args: argparse.Namespace, core: Voice2JsonCore) -> None:
+async def train(args: argparse.Namespace, core: "Voice2JsonCore") -> None:
     """Create speech/intent artifacts for a profile."""
     start_time = time.perf_counter()
-    await core.train_profile()
+    stages_run = await core.train_profile(force=args.force)
     end_time = time.perf_counter()
 
+    for stage, was_run in stages_run.items():
+        print(stage, "trained" if was_run else "up to date")
+
     print("Training completed in", end_time - start_time, "second(s)")
 
 
 # -----------------------------------------------------------------------------
 
 
-async def show_documentation(args: argparse.Namespace, core: Voice2JsonCore) -> None:
+async def show_documentation(args: argparse.Namespace, core: "Voice2JsonCore") -> None:
     """Run basic web server with documentation."""
     import http.server
     import socketserver
@@ -1010,6 +1313,14 @@ async def show_documentation(args: argparse.Namespace, core: Voice2JsonCore) ->
 
 async def download_profile(args: argparse.Namespace) -> None:
     """Download profile files."""
+    import ssl
+
+    import pydash
+    import yaml
+    from tqdm import tqdm
+
+    from .utils import download_file, get_profile_downloads, reassemble_large_files
+
     profile_dir, profile_yaml, profile_name = get_profile_location(args)
 
     if profile_name is None:
@@ -0,0 +1,364 @@
+"""In-process audio conversion and buffering."""
+import collections
+import io
+import logging
+import math
+import threading
+import typing
+import wave
+
+_LOGGER = logging.getLogger("voice2json.audio")
+
+# Number of output samples filtered at a time during resampling
+_CHUNK_SAMPLES = 32768
+
+# -----------------------------------------------------------------------------
+
+
+def convert_wav_data(
+    wav_data: bytes, rate: int, width: int, channels: int
+) -> typing.Optional[bytes]:
+    """Convert PCM WAV data to a new sample rate, width (bytes), and channel count.
+
+    Returns None if the input format can't be converted in-process, so the
+    caller can fall back to an external program.
+    """
+    try:
+        import numpy as np
+        from numpy.lib.stride_tricks import sliding_window_view  # noqa: F401
+    except ImportError:
+        _LOGGER.debug("numpy not available")
+        return None
+
+    try:
+        with io.BytesIO(wav_data) as wav_io:
+            with wave.open(wav_io, "rb") as wav_file:
+                in_rate, in_width, in_channels = (
+                    wav_file.getframerate(),
+                    wav_file.getsampwidth(),
+                    wav_file.getnchannels(),
+                )
+                frames = wav_file.readframes(wav_file.getnframes())
+    except (wave.Error, EOFError) as e:
+        _LOGGER.debug("Can't read WAV data (%s)", e)
+        return None
+
+    if (in_width not in {1, 2, 3, 4}) or (width not in {1, 2, 3, 4}):
+        _LOGGER.debug("Unsupported sample width (%s -> %s)", in_width, width)
+        return None
+
+    if (in_channels != channels) and (1 not in {in_channels, channels}):
+        _LOGGER.debug("Unsupported channel mapping (%s -> %s)", in_channels, channels)
+        return None
+
+    # (frames, channels) in [-1, 1)
+    audio = pcm_to_float(frames, in_width).reshape((-1, in_channels))
+
+    if in_channels != channels:
+        if channels == 1:
+            # Downmix
+            audio = audio.mean(axis=1, keepdims=True)
+        else:
+            # Upmix
+            audio = np.repeat(audio, channels, axis=1)
+
+    if in_rate != rate:
+        audio = np.stack(
+            [resample(audio[:, c], in_rate, rate) for c in range(channels)], axis=1
+        )
+
+    with io.BytesIO() as wav_buffer:
+        out_file: wave.Wave_write = wave.open(wav_buffer, "wb")
+        with out_file:
+            out_file.setframerate(rate)
+            out_file.setsampwidth(width)
+            out_file.setnchannels(channels)
+            out_file.writeframes(float_to_pcm(audio.reshape(-1), width))
+
+        return wav_buffer.getvalue()
+
+
+# -----------------------------------------------------------------------------
+
+
+def pcm_to_float(frames: bytes, width: int):
+    """Convert little-endian PCM samples to a float64 array in [-1, 1)."""
+    import numpy as np
+
+    if width == 1:
+        # 8-bit WAV is unsigned
+        return (np.frombuffer(frames, dtype=np.uint8).astype(np.float64) - 128) / 128
+
+    if width == 3:
+        # Sign extend 24-bit samples into 32-bit integers
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape((-1, 3))
+        samples = np.zeros((raw.shape[0], 4), dtype=np.uint8)
+        samples[:, 1:] = raw
+        return samples.view("<i4").reshape(-1).astype(np.float64) / (2 ** 31)
+
+    dtype = {2: "<i2", 4: "<i4"}[width]
+    return np.frombuffer(frames, dtype=dtype).astype(np.float64) / (
+        2 ** ((8 * width) - 1)
+    )
+
+
+def float_to_pcm(audio, width: int) -> bytes:
+    """Convert a float array in [-1, 1) to little-endian PCM samples."""
+    import numpy as np
+
+    scale = 2 ** ((8 * width) - 1)
+    samples = np.clip(np.rint(audio * scale), -scale, scale - 1)
+
+    if width == 1:
+        return (samples + 128).astype(np.uint8).tobytes()
+
+    if width == 3:
+        return samples.astype("<i4").view(np.uint8).reshape((-1, 4))[:, :3].tobytes()
+
+    dtype = {2: "<i2", 4: "<i4"}[width]
+    return samples.astype(dtype).tobytes()
+
+
+def resample(audio, in_rate: int, out_rate: int):
+    """Resample a 1-D float array with a polyphase windowed sinc filter."""
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    divisor = math.gcd(in_rate, out_rate)
+    up, down = out_rate // divisor, in_rate // divisor
+    if up == down:
+        return audio
+
+    # Low-pass filter at the lower of the two Nyquist frequencies
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    filter_len = (2 * half_len) + 1
+    cutoff = 1.0 / max_rate
+    taps = np.sinc(cutoff * (np.arange(filter_len) - half_len)) * np.kaiser(
+        filter_len, 5.0
+    )
+    taps *= up / taps.sum()
+
+    # Split filter into one row per phase (reversed for dot products with windows)
+    phase_len = int(math.ceil(filter_len / up))
+    taps = np.concatenate([taps, np.zeros((phase_len * up) - filter_len)])
+    phases = taps.reshape((phase_len, up)).T[:, ::-1]
+
+    num_out = int(math.ceil(len(audio) * up / down))
+    padded = np.concatenate(
+        [
+            np.zeros(phase_len - 1),
+            audio,
+            np.zeros(phase_len + (half_len // up) + 1),
+        ]
+    )
+    windows = sliding_window_view(padded, phase_len)
+
+    output = np.empty(num_out)
+    for start in range(0, num_out, _CHUNK_SAMPLES):
+        end = min(num_out, start + _CHUNK_SAMPLES)
+
+        # Position of each output sample in the upsampled signal
+        positions = (np.arange(start, end) * down) + half_len
+        output[start:end] = np.einsum(
+            "ij,ij->i", windows[positions // up], phases[positions % up]
+        )
+
+    return output
+
+
+# -----------------------------------------------------------------------------
+
+
+class AudioRingBuffer:
+    """Fixed-capacity FIFO of raw audio, safe to share between threads.
+
+    Audio is copied in and out of a single preallocated bytearray through
+    memoryviews, so memory use stays flat for long-running streams. When the
+    buffer is full, writers either wait for space (back-pressure) or overwrite
+    the oldest audio (drop_oldest). Ends of segments (e.g., voice commands)
+    can be marked so readers know where each one stops.
+    """
+
+    def __init__(self, capacity: int, drop_oldest: bool = False):
+        assert capacity > 0, "Capacity must be positive"
+        self.capacity = capacity
+        self.drop_oldest = drop_oldest
+
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+
+        # Total bytes read/written (buffer offset is position % capacity)
+        self._read_pos = 0
+        self._write_pos = 0
+
+        # Write positions where segments end
+        self._segment_ends: typing.Deque[int] = collections.deque()
+        self._closed = False
+        self._condition = threading.Condition()
+
+        # Number of writes that didn't fit and bytes lost because of them
+        self.overflow_count = 0
+        self.dropped_bytes = 0
+
+    def __len__(self) -> int:
+        """Number of bytes available to read."""
+        with self._condition:
+            return self._write_pos - self._read_pos
+
+    @property
+    def closed(self) -> bool:
+        """True if close() has been called."""
+        return self._closed
+
+    def write(self, data: bytes, timeout: typing.Optional[float] = None) -> bool:
+        """Add audio to the buffer.
+
+        Without drop_oldest, waits up to timeout seconds for space (forever if
+        None). Returns False if any audio was dropped or the buffer is closed.
+        """
+        data_view = memoryview(data).cast("B")
+        all_written = True
+
+        with self._condition:
+            if self._closed:
+                self.dropped_bytes += len(data_view)
+                return False
+
+            free = self.capacity - (self._write_pos - self._read_pos)
+            if len(data_view) > free:
+                self.overflow_count += 1
+
+                if self.drop_oldest:
+                    all_written = False
+
+                    if len(data_view) > self.capacity:
+                        # Only the newest audio fits
+                        skip = len(data_view) - self.capacity
+                        data_view = data_view[skip:]
+                        self.dropped_bytes += skip
+
+                    drop = len(data_view) - free
+                    if drop > 0:
+                        self._read_pos += drop
+                        self.dropped_bytes += drop
+                        self._condition.notify_all()
+
+            offset = 0
+            while offset < len(data_view):
+                free = self.capacity - (self._write_pos - self._read_pos)
+                if free <= 0:
+                    # Back-pressure
+                    has_space = self._condition.wait_for(
+                        self._is_writable, timeout=timeout
+                    )
+                    if self._closed or (not has_space):
+                        self.dropped_bytes += len(data_view) - offset
+                        return False
+
+                    continue
+
+                num_bytes = min(free, len(data_view) - offset)
+                self._copy_in(data_view[offset : offset + num_bytes])
+                offset += num_bytes
+                self._condition.notify_all()
+
+        return all_written
+
+    def end_segment(self):
+        """Mark the end of the current segment."""
+        with self._condition:
+            self._segment_ends.append(self._write_pos)
+            self._condition.notify_all()
+
+    def close(self):
+        """Wake up waiting readers/writers. Remaining audio can still be read."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def read(self, max_size: int) -> bytes:
+        """Read up to max_size bytes, waiting until audio is available.
+
+        Returns empty bytes at the end of a segment or when the buffer is
+        closed and empty.
+        """
+        with self._condition:
+            num_bytes = self._wait_readable(max_size)
+            if num_bytes <= 0:
+                return bytes()
+
+            start = self._read_pos % self.capacity
+            end = start + num_bytes
+            if end <= self.capacity:
+                data = bytes(self._view[start:end])
+            else:
+                # Wraps around
+                data = bytes(self._view[start:]) + bytes(
+                    self._view[: end - self.capacity]
+                )
+
+            self._read_pos += num_bytes
+            self._condition.notify_all()
+
+            return data
+
+    def read_into(self, out_buffer: typing.Union[bytearray, memoryview]) -> int:
+        """Like read, but copies into out_buffer. Returns number of bytes read."""
+        out_view = memoryview(out_buffer).cast("B")
+
+        with self._condition:
+            num_bytes = self._wait_readable(len(out_view))
+            if num_bytes <= 0:
+                return 0
+
+            start = self._read_pos % self.capacity
+            first_bytes = min(num_bytes, self.capacity - start)
+            out_view[:first_bytes] = self._view[start : start + first_bytes]
+            if first_bytes < num_bytes:
+                # Wraps around
+                out_view[first_bytes:num_bytes] = self._view[: num_bytes - first_bytes]
+
+            self._read_pos += num_bytes
+            self._condition.notify_all()
+
+            return num_bytes
+
+    def _is_writable(self) -> bool:
+        """True if there's space to write or the buffer is closed."""
+        return self._closed or ((self._write_pos - self._read_pos) < self.capacity)
+
+    def _wait_readable(self, max_size: int) -> int:
+        """Wait for audio, end of segment, or close (lock must be held).
+
+        Returns number of bytes that can be read (0 at end of segment/close).
+        """
+        while True:
+            if self._segment_ends and (self._segment_ends[0] <= self._read_pos):
+                # End of segment
+                self._segment_ends.popleft()
+                return 0
+
+            available = self._write_pos - self._read_pos
+            if self._segment_ends:
+                # Don't read past the end of the segment
+                available = min(available, self._segment_ends[0] - self._read_pos)
+
+            if available > 0:
+                return min(available, max_size)
+
+            if self._closed:
+                return 0
+
+            self._condition.wait()
+
+    def _copy_in(self, data_view: memoryview):
+        """Copy data at the write position (lock must be held, data must fit)."""
+        start = self._write_pos % self.capacity
+        first_bytes = min(len(data_view), self.capacity - start)
+        self._view[start : start + first_bytes] = data_view[:first_bytes]
+        if first_bytes < len(data_view):
+            # Wrap around
+            self._view[: len(data_view) - first_bytes] = data_view[first_bytes:]
+
+        self._write_pos += len(data_view)
@@ -2,11 +2,11 @@
 Core voice2json command support.
 """
 import asyncio
+import gzip
 import io
 import logging
 import os
 import queue
-import shlex
 import ssl
 import sys
 import threading
@@ -16,6 +16,8 @@ from pathlib import Path
 
 import pydash
 
+from .settings import Settings
+
 _LOGGER = logging.getLogger("voice2json.core")
 
 # -----------------------------------------------------------------------------
@@ -36,6 +38,9 @@ class Voice2JsonCore:
         self.profile_dir = profile_file.parent
         self.profile = profile
 
+        # Settings used for every utterance/file (validated now)
+        self.settings = Settings.from_profile(profile)
+
         # Shared aiohttp client session (enable SSL)
         self.ssl_context = ssl.SSLContext()
         if certfile:
@@ -58,11 +63,46 @@ class Voice2JsonCore:
     # train-profile
     # -------------------------------------------------------------------------
 
-    async def train_profile(self):
+    async def train_profile(self, force: bool = False) -> typing.Dict[str, bool]:
         """Generate speech/intent artifacts for a profile."""
         from . import train
 
-        await train.train_profile(self.profile_dir, self.profile)
+        return await train.train_profile(self.profile_dir, self.profile, force=force)
+
+    # -------------------------------------------------------------------------
+    # recognize-intent
+    # -------------------------------------------------------------------------
+
+    def load_intent_graph(self):
+        """Load intent graph created during training.
+
+        Prefers the compact (memory-mapped) graph when it is at least as new as
+        the gzipped networkx pickle.
+        """
+        import networkx as nx
+
+        intent_graph_path = self.ppath(
+            "intent-recognition.intent-graph", "intent.pickle.gz"
+        )
+        compact_graph_path = self.ppath(
+            "intent-recognition.intent-graph-compact", "intent.graph"
+        )
+
+        if compact_graph_path and compact_graph_path.is_file():
+            if (not intent_graph_path.is_file()) or (
+                compact_graph_path.stat().st_mtime >= intent_graph_path.stat().st_mtime
+            ):
+                from .graph import CompactIntentGraph
+
+                try:
+                    _LOGGER.debug("Loading %s", compact_graph_path)
+                    return CompactIntentGraph(compact_graph_path)
+                except ValueError:
+                    _LOGGER.exception("load_intent_graph")
+
+        _LOGGER.debug("Loading %s", intent_graph_path)
+        with gzip.GzipFile(intent_graph_path, mode="rb") as graph_gzip:
+            return nx.readwrite.gpickle.read_gpickle(graph_gzip)
 
     # -------------------------------------------------------------------------
     # transcribe-wav
@@ -74,9 +114,7 @@ class Voice2JsonCore:
 
         # Load settings
         acoustic_model_type = AcousticModelType(
-            pydash.get(
-                self.profile, "speech-to-text.acoustic-model-type", "pocketsphinx"
-            ).lower()
+            self.settings.speech_to_text.acoustic_model_type
         )
 
         if acoustic_model_type == AcousticModelType.POCKETSPHINX:
@@ -105,6 +143,28 @@ class Voice2JsonCore:
 
         raise ValueError(f"Unsupported acoustic model type: {acoustic_model_type}")
 
+    def get_transcribers(self, count: int, open_transcription=False, debug=False):
+        """Create count transcribers that can be used from separate threads.
+
+        For Julius, this is the same pool of count processes repeated.
+        """
+        from .train import AcousticModelType
+
+        acoustic_model_type = AcousticModelType(
+            self.settings.speech_to_text.acoustic_model_type
+        )
+
+        if (count > 1) and (acoustic_model_type == AcousticModelType.JULIUS):
+            pool = self.get_julius_transcriber(
+                open_transcription=open_transcription, debug=debug, pool_size=count
+            )
+            return [pool] * count
+
+        return [
+            self.get_transcriber(open_transcription=open_transcription, debug=debug)
+            for _ in range(count)
+        ]
+
     def get_pocketsphinx_transcriber(self, open_transcription=False, debug=False):
         """Create Transcriber for Pocketsphinx."""
         from rhasspyasr_pocketsphinx import PocketsphinxTranscriber
@@ -149,10 +209,11 @@ class Voice2JsonCore:
         """Create Transcriber for Kaldi."""
         from rhasspyasr_kaldi import KaldiCommandLineTranscriber, KaldiModelType
 
+        from .kaldi import KaldiDecoderType, KaldiOnlineTranscriber
+
         # Load settings
-        model_type = KaldiModelType(
-            pydash.get(self.profile, "speech-to-text.kaldi.model-type")
-        )
+        kaldi_settings = self.settings.speech_to_text.kaldi
+        model_type = KaldiModelType(kaldi_settings.model_type)
 
         acoustic_model = self.ppath("speech-to-text.acoustic-model", "acoustic_model")
         assert acoustic_model, "Missing acoustic model"
@@ -168,6 +229,17 @@ class Voice2JsonCore:
                 acoustic_model / "graph"
             )
 
+        decoder_type = KaldiDecoderType(kaldi_settings.decoder)
+
+        if decoder_type == KaldiDecoderType.ONLINE:
+            if model_type == KaldiModelType.NNET3:
+                # Keep model and graph loaded in one online decoder
+                return KaldiOnlineTranscriber(model_type, acoustic_model, graph_dir)
+
+            _LOGGER.warning(
+                "Online decoding requires an nnet3 model (got %s)", model_type.value
+            )
+
         # Use kaldi-decode script
         return KaldiCommandLineTranscriber(model_type, acoustic_model, graph_dir)
 
@@ -195,9 +267,11 @@ class Voice2JsonCore:
 
         return DeepSpeechTranscriber(acoustic_model, scorer)
 
-    def get_julius_transcriber(self, open_transcription=False, debug=False):
-        """Create Transcriber for Julius."""
-        from .julius import JuliusTranscriber
+    def get_julius_transcriber(
+        self, open_transcription=False, debug=False, pool_size=1
+    ):
+        """Create Transcriber for Julius (a pool of pool_size processes if > 1)."""
+        from .julius import JuliusTranscriber, JuliusTranscriberPool
 
         # Load settings
         acoustic_model = self.ppath("speech-to-text.acoustic-model", "acoustic_model")
@@ -222,9 +296,36 @@ class Voice2JsonCore:
 
         assert dictionary and language_model, "Missing dictionary or language model"
 
-        return JuliusTranscriber(
-            self, acoustic_model, dictionary, language_model, debug=debug
+        julius_settings = self.settings.speech_to_text.julius
+        adinnet_port = julius_settings.adinnet_port
+
+        def make_transcriber(port: int) -> JuliusTranscriber:
+            return JuliusTranscriber(
+                self,
+                acoustic_model,
+                dictionary,
+                language_model,
+                streaming=julius_settings.streaming,
+                adinnet_port=port,
+                timeout=julius_settings.timeout_seconds,
+                # Empty to prefer a RAM-backed directory like /dev/shm
+                temp_directory=julius_settings.temp_directory or None,
+                debug=debug,
+            )
+
+        if pool_size <= 1:
+            return make_transcriber(adinnet_port)
+
+        # Each process needs its own port
+        pool = JuliusTranscriberPool(
+            [
+                make_transcriber((adinnet_port + i) if adinnet_port > 0 else 0)
+                for i in range(pool_size)
+            ]
         )
+        pool.start()
+
+        return pool
 
     # -------------------------------------------------------------------------
     # record-command
@@ -234,39 +335,18 @@ class Voice2JsonCore:
         """Get voice command recorder based on profile settings."""
         from rhasspysilence import WebRtcVadRecorder
 
-        # Load settings
-        vad_mode = int(pydash.get(self.profile, "voice-command.vad-mode", 3))
-        min_seconds = float(
-            pydash.get(self.profile, "voice-command.minimum-seconds", 1)
-        )
-        max_seconds = float(
-            pydash.get(self.profile, "voice-command.maximum-seconds", 30)
-        )
-        speech_seconds = float(
-            pydash.get(self.profile, "voice-command.speech-seconds", 0.3)
-        )
-        silence_seconds = float(
-            pydash.get(self.profile, "voice-command.silence-seconds", 0.5)
-        )
-        before_seconds = float(
-            pydash.get(self.profile, "voice-command.before-seconds", 0.5)
-        )
-        skip_seconds = float(pydash.get(self.profile, "voice-command.skip-seconds", 0))
-        chunk_size = int(pydash.get(self.profile, "voice-command.chunk-size", 960))
-        sample_rate = int(
-            pydash.get(self.profile, "audio.format.sample-rate-hertz", 16000)
-        )
+        voice_command = self.settings.voice_command
 
         return WebRtcVadRecorder(
-            vad_mode=vad_mode,
-            sample_rate=sample_rate,
-            chunk_size=chunk_size,
-            min_seconds=min_seconds,
-            max_seconds=max_seconds,
-            speech_seconds=speech_seconds,
-            silence_seconds=silence_seconds,
-            before_seconds=before_seconds,
-            skip_seconds=skip_seconds,
+            vad_mode=voice_command.vad_mode,
+            sample_rate=self.settings.audio.format.sample_rate,
+            chunk_size=voice_command.chunk_size,
+            min_seconds=voice_command.min_seconds,
+            max_seconds=voice_command.max_seconds,
+            speech_seconds=voice_command.speech_seconds,
+            silence_seconds=voice_command.silence_seconds,
+            before_seconds=voice_command.before_seconds,
+            skip_seconds=voice_command.skip_seconds,
         )
 
     # -------------------------------------------------------------------------
@@ -288,12 +368,21 @@ class Voice2JsonCore:
 
     async def convert_wav(self, wav_data: bytes) -> bytes:
         """Convert WAV data to expected audio format."""
-        convert_cmd_str = pydash.get(
-            self.profile,
-            "audio.convert-command",
-            "sox -t wav - -r 16000 -e signed-integer -b 16 -c 1 -t wav -",
-        )
-        convert_cmd = shlex.split(convert_cmd_str)
+        audio = self.settings.audio
+        if audio.converter == "builtin":
+            from .audio import convert_wav_data
+
+            # Common PCM formats are converted in-process
+            converted_data = await asyncio.get_running_loop().run_in_executor(
+                None, convert_wav_data, wav_data, *audio.format
+            )
+
+            if converted_data is not None:
+                return converted_data
+
+            _LOGGER.debug("Falling back to convert command")
+
+        convert_cmd = audio.convert_command
         _LOGGER.debug(convert_cmd)
 
         convert_proc = await asyncio.create_subprocess_exec(
@@ -306,15 +395,7 @@ class Voice2JsonCore:
 
     async def maybe_convert_wav(self, wav_data: bytes) -> bytes:
         """Convert WAV data to expected audio format if necessary."""
-        expected_rate = int(
-            pydash.get(self.profile, "audio.format.sample-rate-hertz", 16000)
-        )
-        expected_width = (
-            int(pydash.get(self.profile, "audio.format.sample-width-bits", 16)) // 8
-        )
-        expected_channels = int(
-            pydash.get(self.profile, "audio.format.channel-count", 1)
-        )
+        expected_rate, expected_width, expected_channels = self.settings.audio.format
 
         with io.BytesIO(wav_data) as wav_io:
             with wave.open(wav_io, "rb") as wav_file:
@@ -354,9 +435,7 @@ class Voice2JsonCore:
 
     def buffer_to_wav(self, buffer: bytes) -> bytes:
         """Wraps a buffer of raw audio data in a WAV"""
-        rate = int(pydash.get(self.profile, "audio.format.sample-rate-hertz", 16000))
-        width = int(pydash.get(self.profile, "audio.format.sample-width-bits", 16)) // 8
-        channels = int(pydash.get(self.profile, "audio.format.channel-count", 1))
+        rate, width, channels = self.settings.audio.format
 
         with io.BytesIO() as wav_buffer:
             wav_file: wave.Wave_write = wave.open(wav_buffer, mode="wb")
@@ -368,14 +447,20 @@ class Voice2JsonCore:
 
             return wav_buffer.getvalue()
 
+    def open_wav_file(self, wav_path: typing.Union[str, Path]) -> wave.Wave_write:
+        """Open a WAV file for writing raw audio in the expected format."""
+        rate, width, channels = self.settings.audio.format
+
+        wav_file: wave.Wave_write = wave.open(str(wav_path), mode="wb")
+        wav_file.setframerate(rate)
+        wav_file.setsampwidth(width)
+        wav_file.setnchannels(channels)
+
+        return wav_file
+
     async def get_audio_source(self):
         """Start a recording subprocess for expected audio format."""
-        record_cmd_str = pydash.get(
-            self.profile,
-            "audio.record-command",
-            "arecord -q -r 16000 -c 1 -f S16_LE -t raw",
-        )
-        record_cmd = shlex.split(record_cmd_str)
+        record_cmd = self.settings.audio.record_command
         _LOGGER.debug(record_cmd)
         record_proc = await asyncio.create_subprocess_exec(
             record_cmd[0], *record_cmd[1:], stdout=asyncio.subprocess.PIPE
@@ -418,14 +503,14 @@ class Voice2JsonCore:
         intent_graph_path = self.ppath(
             "intent-recognition.intent-graph", "intent.pickle.gz"
         )
+        compact_graph_path = self.ppath(
+            "intent-recognition.intent-graph-compact", "intent.graph"
+        )
 
-        missing = False
-        for path in [intent_graph_path]:
-            if not (path and path.exists()):
-                missing = True
-                break
-
-        return not missing
+        # Either graph format is enough
+        return any(
+            path and path.exists() for path in [intent_graph_path, compact_graph_path]
+        )
 
     # -------------------------------------------------------------------------
 
@@ -0,0 +1,215 @@
+"""Compiled, memory-mapped pronunciation dictionaries."""
+import array
+import collections.abc
+import logging
+import os
+import typing
+from pathlib import Path
+
+from rhasspynlu.g2p import PronunciationAction, read_pronunciations
+
+from .packed import PackedFile, StringTable, pack_strings, write_packed
+
+_LOGGER = logging.getLogger("voice2json.dictionary")
+
+DICTIONARY_MAGIC = b"V2JD"
+DICTIONARY_VERSION = 1
+
+# Section indexes
+_SOURCE_INFO = 0
+_WORD_OFFSETS = 1
+_WORD_DATA = 2
+_WORD_PRONUNCIATIONS = 3
+_PRONUNCIATION_PHONEMES = 4
+_PHONEMES = 5
+_PHONEME_OFFSETS = 6
+_PHONEME_DATA = 7
+
+_ACTIONS = list(PronunciationAction)
+
+# -----------------------------------------------------------------------------
+
+
+def load_compiled_dictionary(
+    dict_path: Path,
+    cache_path: Path,
+    action: PronunciationAction = PronunciationAction.APPEND,
+) -> "CompiledPronunciations":
+    """Load a pronunciation dictionary through its compiled cache.
+
+    The cache is (re-)built if it's missing or the dictionary has changed.
+    """
+    source_info = _get_source_info(dict_path, action)
+
+    if cache_path.is_file():
+        try:
+            pronunciations = CompiledPronunciations(cache_path)
+            if pronunciations.source_info == source_info:
+                _LOGGER.debug("Using compiled dictionary %s", cache_path)
+                return pronunciations
+
+            pronunciations.close()
+        except ValueError:
+            _LOGGER.exception("load_compiled_dictionary")
+
+    compile_dictionary(dict_path, cache_path, action=action)
+
+    return CompiledPronunciations(cache_path)
+
+
+def compile_dictionary(
+    dict_path: Path,
+    cache_path: Path,
+    action: PronunciationAction = PronunciationAction.APPEND,
+) -> None:
+    """Compile a CMU-style pronunciation dictionary into a memory-mappable file."""
+    _LOGGER.debug("Compiling %s to %s", dict_path, cache_path)
+    source_info = _get_source_info(dict_path, action)
+
+    with open(dict_path, "r") as dict_file:
+        word_dict = read_pronunciations(dict_file, word_dict={}, action=action)
+
+    # Sorted by UTF-8 bytes for binary search
+    words = sorted(word_dict, key=str.encode)
+
+    phoneme_ids: typing.Dict[str, int] = {}
+    word_pronunciations = array.array("I", [0])
+    pronunciation_phonemes = array.array("I", [0])
+    phonemes: typing.List[int] = []
+
+    for word in words:
+        for word_phonemes in word_dict[word]:
+            for phoneme in word_phonemes:
+                phonemes.append(phoneme_ids.setdefault(phoneme, len(phoneme_ids)))
+
+            pronunciation_phonemes.append(len(phonemes))
+
+        word_pronunciations.append(len(pronunciation_phonemes) - 1)
+
+    word_offsets, word_data = pack_strings(words)
+    phoneme_offsets, phoneme_data = pack_strings(phoneme_ids)
+
+    # Write to temporary file first in case another process is reading
+    temp_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}")
+    write_packed(
+        temp_path,
+        DICTIONARY_MAGIC,
+        DICTIONARY_VERSION,
+        [
+            array.array("q", source_info),
+            word_offsets,
+            word_data,
+            word_pronunciations,
+            pronunciation_phonemes,
+            array.array("H" if len(phoneme_ids) < (1 << 16) else "I", phonemes),
+            phoneme_offsets,
+            phoneme_data,
+        ],
+    )
+    temp_path.replace(cache_path)
+
+    _LOGGER.debug(
+        "Compiled %s word(s) with %s pronunciation(s)",
+        len(words),
+        len(pronunciation_phonemes) - 1,
+    )
+
+
+def _get_source_info(dict_path: Path, action: PronunciationAction) -> typing.List[int]:
+    """Values that must match for a compiled dictionary to be valid."""
+    dict_stat = dict_path.stat()
+    return [dict_stat.st_size, dict_stat.st_mtime_ns, _ACTIONS.index(action)]
+
+
+# -----------------------------------------------------------------------------
+
+
+class CompiledPronunciations(collections.abc.MutableMapping):
+    """Word -> pronunciations mapping backed by a compiled dictionary.
+
+    Words are only decoded when looked up. Looked up, added, or modified words
+    are kept in memory, so changes (custom words, sounds like) don't touch the
+    compiled file.
+    """
+
+    def __init__(self, cache_path: typing.Union[str, Path]):
+        self.packed = PackedFile(cache_path, DICTIONARY_MAGIC, DICTIONARY_VERSION)
+        sections = self.packed.sections
+
+        self.source_info = list(sections[_SOURCE_INFO])
+        self.words = StringTable(sections[_WORD_OFFSETS], sections[_WORD_DATA])
+        self.word_pronunciations = sections[_WORD_PRONUNCIATIONS]
+        self.pronunciation_phonemes = sections[_PRONUNCIATION_PHONEMES]
+        self.phonemes = sections[_PHONEMES]
+
+        phoneme_table = StringTable(sections[_PHONEME_OFFSETS], sections[_PHONEME_DATA])
+        self.phoneme_names = [phoneme_table[i] for i in range(len(phoneme_table))]
+
+        # Words that have been read or changed
+        self.overlay: typing.Dict[str, typing.List[typing.List[str]]] = {}
+        self.deleted: typing.Set[str] = set()
+
+    def __getitem__(self, word: str) -> typing.List[typing.List[str]]:
+        word_pronunciations = self.overlay.get(word)
+        if word_pronunciations is not None:
+            return word_pronunciations
+
+        word_index = None if word in self.deleted else self.words.find(word)
+        if word_index is None:
+            raise KeyError(word)
+
+        # Copy on read so callers can modify the list
+        word_pronunciations = []
+        for pron_index in range(
+            self.word_pronunciations[word_index],
+            self.word_pronunciations[word_index + 1],
+        ):
+            word_pronunciations.append(
+                [
+                    self.phoneme_names[self.phonemes[i]]
+                    for i in range(
+                        self.pronunciation_phonemes[pron_index],
+                        self.pronunciation_phonemes[pron_index + 1],
+                    )
+                ]
+            )
+
+        self.overlay[word] = word_pronunciations
+        return word_pronunciations
+
+    def __setitem__(self, word: str, pronunciations: typing.List[typing.List[str]]):
+        self.overlay[word] = pronunciations
+        self.deleted.discard(word)
+
+    def __delitem__(self, word: str):
+        if word not in self:
+            raise KeyError(word)
+
+        self.overlay.pop(word, None)
+        self.deleted.add(word)
+
+    def __contains__(self, word: typing.Any) -> bool:
+        if word in self.overlay:
+            return True
+
+        if (not isinstance(word, str)) or (word in self.deleted):
+            return False
+
+        return self.words.find(word) is not None
+
+    def __iter__(self) -> typing.Iterator[str]:
+        for word_index in range(len(self.words)):
+            word = self.words[word_index]
+            if word not in self.deleted:
+                yield word
+
+        for word in self.overlay:
+            if self.words.find(word) is None:
+                yield word
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def close(self):
+        """Release memory map."""
+        self.packed.close()
@@ -1,11 +1,16 @@
 """Methods for generating examples."""
 import argparse
 import dataclasses
-import gzip
+import itertools
 import logging
+import random
+import sys
+import typing
+from pathlib import Path
 
 from .core import Voice2JsonCore
-from .utils import dag_paths_random, itershuffle, print_json
+from .paths import GraphPaths
+from .utils import get_json_encoder, get_json_sink
 
 _LOGGER = logging.getLogger("voice2json.generate")
 
@@ -14,99 +19,202 @@ _LOGGER = logging.getLogger("voice2json.generate")
 
 async def generate(args: argparse.Namespace, core: Voice2JsonCore) -> None:
     """Generate randomish examples from intent graph."""
-    import networkx as nx
     import rhasspynlu
 
     # Make sure profile has been trained
     assert core.check_trained(), "Not trained"
 
-    # Load settings
-    intent_graph_path = core.ppath(
-        "intent-recognition.intent-graph", "intent.pickle.gz"
-    )
-
     # Load intent graph
-    _LOGGER.debug("Loading %s", intent_graph_path)
-    with gzip.GzipFile(intent_graph_path, mode="rb") as graph_gzip:
-        intent_graph = nx.readwrite.gpickle.read_gpickle(graph_gzip)
+    intent_graph = core.load_intent_graph()
 
     start_node, end_node = rhasspynlu.jsgf_graph.get_start_end_nodes(intent_graph)
     assert (start_node is not None) and (
         end_node is not None
     ), "Missing start/end node(s)"
 
-    paths_left = None
-    if args.number > 0:
-        paths_left = args.number
-
-    # Iterate through all paths
-    for path in itershuffle(dag_paths_random(intent_graph, start_node, end_node)):
-        if paths_left is not None:
-            paths_left -= 1
-            if paths_left < 0:
-                # Stop iterating
-                break
-
-        if args.raw_symbols:
-            # Output labels directly from intent graph
-            symbols = []
-            for from_node, to_node in rhasspynlu.utils.pairwise(path):
-                edge_data = intent_graph.edges[(from_node, to_node)]
-                olabel = edge_data.get("olabel")
-                if olabel:
-                    symbols.append(olabel)
-
-            print(" ".join(symbols))
-            continue
-
-        # Convert to intent
-        _, recognition = rhasspynlu.fsticuffs.path_to_recognition(path, intent_graph)
-        if not recognition:
-            _LOGGER.warning("Recognition failed for path: %s", path)
-            continue
-
-        intent = dataclasses.asdict(recognition)
-
-        # Add slots
-        intent["slots"] = {}
-        for ev in intent["entities"]:
-            intent["slots"][ev["entity"]] = ev["value"]
-
-        if args.iob:
-            # IOB format
-            token_idx = 0
-            entity_start = {ev["start"]: ev for ev in intent["entities"]}
-            entity_end = {ev["end"]: ev for ev in intent["entities"]}
-            entity = None
+    paths = GraphPaths(intent_graph, start_node, end_node)
+
+    # Same seed gives the same examples, regardless of the number of workers
+    rng = random.Random(args.seed)
+
+    # One output file per shard or stdout
+    out_files: typing.List[typing.TextIO] = [sys.stdout]
+    if args.shard_directory:
+        shard_dir = Path(args.shard_directory)
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        extension = "txt" if args.raw_symbols else ("iob" if args.iob else "jsonl")
+        out_files = [
+            open(shard_dir / f"examples_{shard_index:03d}.{extension}", "w")
+            for shard_index in range(max(1, args.workers))
+        ]
+
+    # Lines to stdout are flushed with the rest of the command's JSON output
+    out_sinks = [get_json_sink(out_file) for out_file in out_files]
+
+    try:
+        if args.workers > 1:
+            import multiprocessing
+
+            if args.all:
+                # Every path in index order
+                indexes: typing.Iterable[int] = range(paths.num_paths)
+            else:
+                # Distinct, uniformly random paths
+                indexes = paths.random_indexes(
+                    args.number if args.number > 0 else None, rng=rng
+                )
+
+            # Forked workers share the intent graph copy-on-write
+            global _WORKER_STATE
+            _WORKER_STATE = (paths, intent_graph, args)
+
+            with multiprocessing.get_context("fork").Pool(args.workers) as pool:
+                # imap preserves batch order
+                for batch_index, lines in enumerate(
+                    pool.imap(
+                        _generate_worker, _batches(indexes, max(1, args.batch_size))
+                    )
+                ):
+                    out_sink = out_sinks[batch_index % len(out_sinks)]
+                    for line in lines:
+                        out_sink.write_line(line)
+        else:
+            if args.all:
+                # Every path in graph order
+                graph_paths: typing.Iterable[typing.List[int]] = paths
+            else:
+                # Distinct, uniformly random paths
+                graph_paths = paths.random_paths(
+                    args.number if args.number > 0 else None, rng=rng
+                )
+
+            for path in graph_paths:
+                line = path_to_line(path, intent_graph, args)
+                if line is not None:
+                    out_sinks[0].write_line(line)
+    finally:
+        for out_file in out_files:
+            if out_file is not sys.stdout:
+                out_file.close()
+
+
+def path_to_line(
+    path: typing.List[int], intent_graph, args: argparse.Namespace
+) -> typing.Optional[str]:
+    """Format a path through the intent graph as a line of output."""
+    import rhasspynlu
 
-            word_tags = []
-            for word in intent["tokens"]:
-                # Determine tag label
-                tag = "O" if not entity else f"I-{entity}"
-                if token_idx in entity_start:
-                    entity = entity_start[token_idx]["entity"]
-                    tag = f"B-{entity}"
+    if args.raw_symbols:
+        # Output labels directly from intent graph
+        symbols = []
+        for from_node, to_node in rhasspynlu.utils.pairwise(path):
+            edge_data = intent_graph.edges[(from_node, to_node)]
+            olabel = edge_data.get("olabel")
+            if olabel:
+                symbols.append(olabel)
 
-                word_tags.append((word, tag))
+        return " ".join(symbols)
 
-                # word ner
-                token_idx += len(word) + 1
+    # Convert to intent
+    intent = path_to_intent(path, intent_graph)
+    if not intent:
+        _LOGGER.warning("Recognition failed for path: %s", path)
+        return None
 
-                if (token_idx - 1) in entity_end:
-                    entity = None
+    if args.iob:
+        # IOB format
+        return intent_to_iob(intent)
 
-            print("BS", end=" ")
-            for wt in word_tags:
-                print(wt[0], end=" ")
-            print("ES", end="\t")
+    # Write as jsonl
+    return get_json_encoder()(intent)
 
-            print("O", end=" ")  # BS
-            for wt in word_tags:
-                print(wt[1], end=" ")
-            print("O", end="\t")  # ES
 
-            # Intent name last
-            print(intent["intent"]["name"])
-        else:
-            # Write as jsonl
-            print_json(intent)
+def _batches(
+    items: typing.Iterable[int], batch_size: int
+) -> typing.Iterable[typing.List[int]]:
+    """Split items into lists of batch_size (the last may be shorter)."""
+    items_iter = iter(items)
+    while True:
+        batch = list(itertools.islice(items_iter, batch_size))
+        if not batch:
+            break
+
+        yield batch
+
+
+# Paths, intent graph, and arguments inherited by forked worker processes
+_WORKER_STATE: typing.Optional[
+    typing.Tuple[GraphPaths, typing.Any, argparse.Namespace]
+] = None
+
+
+def _generate_worker(indexes: typing.List[int]) -> typing.List[str]:
+    """Format a batch of paths (by index) in a worker process."""
+    assert _WORKER_STATE is not None, "Worker state not set"
+    paths, intent_graph, args = _WORKER_STATE
+
+    lines = []
+    for index in indexes:
+        line = path_to_line(paths.path(index), intent_graph, args)
+        if line is not None:
+            lines.append(line)
+
+    return lines
+
+
+# -----------------------------------------------------------------------------
+
+
+def path_to_intent(
+    path: typing.List[int], intent_graph
+) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    """Convert a path through the intent graph to an intent dict (with slots)."""
+    import rhasspynlu
+
+    _, recognition = rhasspynlu.fsticuffs.path_to_recognition(path, intent_graph)
+    if not recognition:
+        return None
+
+    intent = dataclasses.asdict(recognition)
+
+    # Add slots
+    intent["slots"] = {}
+    for ev in intent["entities"]:
+        intent["slots"][ev["entity"]] = ev["value"]
+
+    return intent
+
+
+def intent_to_iob(intent: typing.Dict[str, typing.Any]) -> str:
+    """Format an intent dict as a line of inside-outside-beginning text."""
+    token_idx = 0
+    entity_start = {ev["start"]: ev for ev in intent["entities"]}
+    entity_end = {ev["end"]: ev for ev in intent["entities"]}
+    entity = None
+
+    words: typing.List[str] = []
+    tags: typing.List[str] = []
+    for word in intent["tokens"]:
+        # Determine tag label
+        tag = "O" if not entity else f"I-{entity}"
+        if token_idx in entity_start:
+            entity = entity_start[token_idx]["entity"]
+            tag = f"B-{entity}"
+
+        words.append(word)
+        tags.append(tag)
+
+        # word ner
+        token_idx += len(word) + 1
+
+        if (token_idx - 1) in entity_end:
+            entity = None
+
+    # BS <words> ES<TAB>O <tags> O<TAB><intent name>
+    return "\t".join(
+        [
+            " ".join(["BS", *words, "ES"]),
+            " ".join(["O", *tags, "O"]),
+            intent["intent"]["name"],
+        ]
+    )
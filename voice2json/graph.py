@@ -0,0 +1,239 @@
+"""Compact, memory-mapped intent graph."""
+import array
+import logging
+import typing
+from pathlib import Path
+
+from .packed import PackedFile, StringTable, pack_strings, write_packed
+
+_LOGGER = logging.getLogger("voice2json.graph")
+
+GRAPH_MAGIC = b"V2JG"
+GRAPH_VERSION = 1
+
+# Node flags
+NODE_START = 1
+NODE_FINAL = 2
+
+# Section indexes
+_NODE_FLAGS = 0
+_NODE_WORDS = 1
+_EDGE_OFFSETS = 2
+_EDGE_TARGETS = 3
+_EDGE_ILABELS = 4
+_EDGE_OLABELS = 5
+_EDGE_LABELS = 6
+_SYMBOL_OFFSETS = 7
+_SYMBOL_DATA = 8
+
+# -----------------------------------------------------------------------------
+
+
+def write_compact_graph(graph, path: typing.Union[str, Path]) -> None:
+    """Write a networkx intent graph as CSR-style arrays with a symbol table."""
+    # Start/final nodes go first so get_start_end_nodes can stop early
+    nodes = sorted(
+        graph.nodes(data=True),
+        key=lambda n: (
+            0 if n[1].get("start") else (1 if n[1].get("final") else 2),
+            n[0],
+        ),
+    )
+    node_index = {node: index for index, (node, _) in enumerate(nodes)}
+
+    # Symbol 0 is always the empty string
+    symbols: typing.Dict[str, int] = {"": 0}
+
+    def symbol_id(s: typing.Optional[str]) -> int:
+        return symbols.setdefault(s or "", len(symbols))
+
+    node_flags = array.array("B")
+    node_words = array.array("I")
+    edge_offsets = array.array("I", [0])
+    edge_targets = array.array("I")
+    edge_ilabels = array.array("I")
+    edge_olabels = array.array("I")
+    edge_labels = array.array("I")
+
+    for node, node_data in nodes:
+        flags = 0
+        if node_data.get("start"):
+            flags |= NODE_START
+
+        if node_data.get("final"):
+            flags |= NODE_FINAL
+
+        node_flags.append(flags)
+        node_words.append(symbol_id(node_data.get("word")))
+
+        for target, edge_data in graph[node].items():
+            edge_targets.append(node_index[target])
+            edge_ilabels.append(symbol_id(edge_data.get("ilabel")))
+            edge_olabels.append(symbol_id(edge_data.get("olabel")))
+            edge_labels.append(symbol_id(edge_data.get("label")))
+
+        edge_offsets.append(len(edge_targets))
+
+    # Dictionaries preserve insertion order, so position == id
+    symbol_offsets, symbol_data = pack_strings(symbols)
+
+    write_packed(
+        path,
+        GRAPH_MAGIC,
+        GRAPH_VERSION,
+        [
+            node_flags,
+            node_words,
+            edge_offsets,
+            edge_targets,
+            edge_ilabels,
+            edge_olabels,
+            edge_labels,
+            symbol_offsets,
+            symbol_data,
+        ],
+    )
+
+    _LOGGER.debug(
+        "Wrote compact graph with %s node(s), %s edge(s), and %s symbol(s)",
+        len(node_flags),
+        len(edge_targets),
+        len(symbols),
+    )
+
+
+# -----------------------------------------------------------------------------
+
+
+class CompactIntentGraph:
+    """Read-only intent graph backed by a memory-mapped file.
+
+    Supports the subset of the networkx.DiGraph interface used by rhasspynlu
+    for recognition and path generation. Nodes are integers from 0 to N-1.
+    """
+
+    def __init__(self, path: typing.Union[str, Path]):
+        self.packed = PackedFile(path, GRAPH_MAGIC, GRAPH_VERSION)
+        sections = self.packed.sections
+
+        self.node_flags = sections[_NODE_FLAGS]
+        self.node_words = sections[_NODE_WORDS]
+        self.edge_offsets = sections[_EDGE_OFFSETS]
+        self.edge_targets = sections[_EDGE_TARGETS]
+        self.edge_ilabels = sections[_EDGE_ILABELS]
+        self.edge_olabels = sections[_EDGE_OLABELS]
+        self.edge_labels = sections[_EDGE_LABELS]
+
+        # Symbol table is small relative to the graph, so decode it once
+        symbol_table = StringTable(sections[_SYMBOL_OFFSETS], sections[_SYMBOL_DATA])
+        self.symbols = [symbol_table[i] for i in range(len(symbol_table))]
+
+    def __len__(self) -> int:
+        return len(self.node_flags)
+
+    def __iter__(self) -> typing.Iterator[int]:
+        return iter(range(len(self.node_flags)))
+
+    def __contains__(self, node: typing.Any) -> bool:
+        return isinstance(node, int) and (0 <= node < len(self.node_flags))
+
+    def __getitem__(self, node: int) -> typing.Dict[int, typing.Dict[str, str]]:
+        """Outgoing edges of node as {target: edge_data}."""
+        return {
+            self.edge_targets[i]: self._edge_data(i)
+            for i in range(self.edge_offsets[node], self.edge_offsets[node + 1])
+        }
+
+    def number_of_nodes(self) -> int:
+        """Number of nodes in graph."""
+        return len(self.node_flags)
+
+    def number_of_edges(self) -> int:
+        """Number of edges in graph."""
+        return len(self.edge_targets)
+
+    def successors(self, node: int) -> typing.Iterator[int]:
+        """Iterate over target nodes of outgoing edges."""
+        for i in range(self.edge_offsets[node], self.edge_offsets[node + 1]):
+            yield self.edge_targets[i]
+
+    def nodes(self, data: bool = False) -> "_NodeView":
+        """View of graph nodes (with attributes if data is True)."""
+        return _NodeView(self, data)
+
+    @property
+    def edges(self) -> "_EdgeView":
+        """View of graph edges, indexable by (source, target)."""
+        return _EdgeView(self)
+
+    def node_data(self, node: int) -> typing.Dict[str, typing.Any]:
+        """Attributes of a node (start, final, word)."""
+        node_data: typing.Dict[str, typing.Any] = {}
+        flags = self.node_flags[node]
+        if flags & NODE_START:
+            node_data["start"] = True
+
+        if flags & NODE_FINAL:
+            node_data["final"] = True
+
+        word_id = self.node_words[node]
+        if word_id:
+            node_data["word"] = self.symbols[word_id]
+
+        return node_data
+
+    def edge_data(self, source: int, target: int) -> typing.Dict[str, str]:
+        """Attributes of an edge (ilabel, olabel, label)."""
+        for i in range(self.edge_offsets[source], self.edge_offsets[source + 1]):
+            if self.edge_targets[i] == target:
+                return self._edge_data(i)
+
+        raise KeyError((source, target))
+
+    def _edge_data(self, edge_index: int) -> typing.Dict[str, str]:
+        return {
+            "ilabel": self.symbols[self.edge_ilabels[edge_index]],
+            "olabel": self.symbols[self.edge_olabels[edge_index]],
+            "label": self.symbols[self.edge_labels[edge_index]],
+        }
+
+    def close(self):
+        """Release memory map."""
+        self.packed.close()
+
+
+class _NodeView:
+    """Minimal stand-in for networkx NodeView/NodeDataView."""
+
+    def __init__(self, graph: CompactIntentGraph, data: bool):
+        self.graph = graph
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.graph)
+
+    def __iter__(self) -> typing.Iterator[typing.Any]:
+        if self.data:
+            for node in self.graph:
+                yield (node, self.graph.node_data(node))
+        else:
+            yield from self.graph
+
+    def __getitem__(self, node: int) -> typing.Dict[str, typing.Any]:
+        return self.graph.node_data(node)
+
+    def __contains__(self, node: typing.Any) -> bool:
+        return node in self.graph
+
+
+class _EdgeView:
+    """Minimal stand-in for networkx EdgeView."""
+
+    def __init__(self, graph: CompactIntentGraph):
+        self.graph = graph
+
+    def __len__(self) -> int:
+        return self.graph.number_of_edges()
+
+    def __getitem__(self, edge: typing.Tuple[int, int]) -> typing.Dict[str, str]:
+        return self.graph.edge_data(*edge)
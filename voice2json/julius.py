@@ -2,9 +2,13 @@
 import io
 import logging
 import os
+import queue
 import shutil
+import socket
+import struct
 import subprocess
 import tempfile
+import threading
 import time
 import typing
 import wave
@@ -24,7 +28,14 @@ _LOGGER = logging.getLogger("voice2json.julius")
 
 
 class JuliusTranscriber(Transcriber):
-    """Transcriber for Julius speech to text engine."""
+    """Transcriber for Julius speech to text engine.
+
+    With streaming, audio is sent to Julius as it arrives using the adinnet
+    protocol instead of being written to a WAV file first.
+
+    Otherwise, WAV data is written to a small set of buffer files that are
+    created once (in RAM when possible) and reused for every transcription.
+    """
 
     def __init__(
         self,
@@ -33,6 +44,11 @@ class JuliusTranscriber(Transcriber):
         dictionary: typing.Union[str, Path],
         language_model: typing.Union[str, Path],
         max_empty_lines: int = 10,
+        streaming: bool = False,
+        adinnet_port: int = 0,
+        timeout: typing.Optional[float] = None,
+        temp_directory: typing.Optional[typing.Union[str, Path]] = None,
+        num_buffers: int = 2,
         debug: bool = False,
     ):
         self.core = core
@@ -41,34 +57,57 @@ class JuliusTranscriber(Transcriber):
         self.language_model = Path(language_model)
         self.julius_proc: typing.Optional[subprocess.Popen] = None
         self.temp_dir: typing.Optional[tempfile.TemporaryDirectory] = None
-        self.julius_in: typing.Optional[typing.TextIO] = None
+        self.julius_lines: "typing.Optional[queue.Queue[typing.Optional[str]]]" = None
         self.julius_out: typing.Optional[typing.TextIO] = None
+        self.adinnet_socket: typing.Optional[socket.socket] = None
         self.max_empty_lines = max_empty_lines
+        self.streaming = streaming
+        self.adinnet_port = adinnet_port
+        self.timeout = timeout
+        self.temp_directory = temp_directory
+        self.num_buffers = max(1, num_buffers)
+        self.buffer_files: typing.List[typing.BinaryIO] = []
+        self.buffer_index = 0
         self.debug = debug
 
     def start_julius(self):
         """Start Julius process."""
         _LOGGER.debug("Starting Julius")
-        self.temp_dir = tempfile.TemporaryDirectory()
-
-        fifo_path = os.path.join(self.temp_dir.name, "filelist")
-        os.mkfifo(fifo_path)
-
         julius_cmd = [
             "julius",
             "-nosectioncheck",
             "-C",
             str(self.model_dir / "julius.jconf"),
-            "-input",
-            "file",
-            "-filelist",
-            fifo_path,
-            "-nocutsilence",
-            "-norealtime",
-            "-v",
-            str(self.dictionary),
         ]
 
+        fifo_path = ""
+        adinnet_port = self.adinnet_port
+        if self.streaming:
+            # Audio is sent over a socket and segmented by us
+            adinnet_port = adinnet_port or _get_free_port()
+            julius_cmd.extend(["-input", "adinnet", "-adport", str(adinnet_port)])
+        else:
+            # Paths to WAV files are written to a FIFO
+            self.temp_dir = tempfile.TemporaryDirectory(
+                prefix="voice2json-julius-",
+                dir=get_temp_directory(self.temp_directory),
+            )
+            _LOGGER.debug("Using temporary directory %s", self.temp_dir.name)
+
+            fifo_path = os.path.join(self.temp_dir.name, "filelist")
+            os.mkfifo(fifo_path)
+
+            # Reused for every WAV file, so nothing is created or deleted
+            # per transcription.
+            self.buffer_files = [
+                open(os.path.join(self.temp_dir.name, f"buffer_{i}.wav"), "wb+")
+                for i in range(self.num_buffers)
+            ]
+            self.buffer_index = 0
+            julius_cmd.extend(["-input", "file", "-filelist", fifo_path])
+
+        julius_cmd.extend(["-nocutsilence", "-norealtime", "-v", str(self.dictionary)])
+
         if not self.debug:
             julius_cmd.append("-quiet")
 
@@ -95,27 +134,37 @@ class JuliusTranscriber(Transcriber):
             julius_cmd, stdout=subprocess.PIPE, stderr=stderr, universal_newlines=True
         )
 
-        self.julius_out = open(fifo_path, "w")
+        # Read output in a separate thread so Julius never blocks on stdout
+        # while audio is being sent.
+        self.julius_lines = queue.Queue()
+        threading.Thread(
+            target=_read_lines,
+            args=(self.julius_proc.stdout, self.julius_lines),
+            daemon=True,
+        ).start()
+
+        if fifo_path:
+            self.julius_out = open(fifo_path, "w")
 
         # -----
 
         # Read until Julius has started
-        line = self.julius_proc.stdout.readline().lower().strip()
-        if self.debug:
-            _LOGGER.debug("Julius: %s", line)
-
+        line = self.read_line().lower()
         if "error" in line:
             raise Exception(line)
 
         while "system information end" not in line:
-            line = self.julius_proc.stdout.readline().lower().strip()
-            if self.debug:
-                _LOGGER.debug("Julius: %s", line)
+            if self.julius_proc.poll() is not None:
+                raise Exception(
+                    f"Julius exited with code {self.julius_proc.returncode}"
+                )
 
+            line = self.read_line().lower()
             if "error" in line:
                 raise Exception(line)
 
-        self.julius_in = self.julius_proc.stdout
+        if self.streaming:
+            self.adinnet_socket = _connect_adinnet(adinnet_port, self.julius_proc)
 
         _LOGGER.debug("Julius started")
 
@@ -125,6 +174,15 @@ class JuliusTranscriber(Transcriber):
             self.julius_out.close()
             self.julius_out = None
 
+        if self.adinnet_socket is not None:
+            self.adinnet_socket.close()
+            self.adinnet_socket = None
+
+        for buffer_file in self.buffer_files:
+            buffer_file.close()
+
+        self.buffer_files = []
+
         if self.temp_dir is not None:
             self.temp_dir.cleanup()
             self.temp_dir = None
@@ -132,16 +190,32 @@ class JuliusTranscriber(Transcriber):
         if self.julius_proc is not None:
             _LOGGER.debug("Stopping Julius")
             self.julius_proc.terminate()
-            self.julius_proc.wait()
+
+            try:
+                self.julius_proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                # Hung
+                self.julius_proc.kill()
+                self.julius_proc.wait()
+
             self.julius_proc = None
             _LOGGER.debug("Stopped Julius")
 
     def transcribe_wav(self, wav_bytes: bytes) -> typing.Optional[Transcription]:
         """Transcribe WAV data."""
-        if not self.julius_proc:
-            self.start_julius()
+        if self.streaming:
+            frames = _get_julius_frames(wav_bytes)
+            return self.transcribe_stream(
+                (
+                    frames[i : i + _ADINNET_CHUNK_BYTES]
+                    for i in range(0, len(frames), _ADINNET_CHUNK_BYTES)
+                ),
+                *_JULIUS_FORMAT,
+            )
+
+        self.ensure_started()
 
-        assert self.julius_in and self.julius_out, "Julius not started"
+        assert self.julius_out, "Julius not started in file mode"
 
         # Compute WAV duration
         wav_duration = get_wav_duration(wav_bytes)
@@ -150,16 +224,127 @@ class JuliusTranscriber(Transcriber):
         _LOGGER.debug("Sending %s byte(s) to Julius", len(wav_bytes))
         start_time = time.time()
 
-        with tempfile.NamedTemporaryFile(suffix=".wav", mode="wb+") as temp_file:
-            temp_file.write(wav_bytes)
-            temp_file.seek(0)
+        # Overwrite the next buffer file in place
+        buffer_file = self.buffer_files[self.buffer_index]
+        self.buffer_index = (self.buffer_index + 1) % len(self.buffer_files)
+
+        buffer_file.seek(0)
+        buffer_file.write(wav_bytes)
+        buffer_file.truncate()  # Julius reads to the end of the file
+        buffer_file.flush()
+
+        print(buffer_file.name, file=self.julius_out)
+        self.julius_out.flush()
+
+        result_text = self.read_transcription()
+        end_time = time.time()
+
+        return Transcription(
+            text=result_text,
+            transcribe_seconds=end_time - start_time,
+            wav_seconds=wav_duration,
+            likelihood=1,
+        )
+
+    def transcribe_stream(
+        self,
+        audio_stream: typing.Iterable[bytes],
+        sample_rate: int,
+        sample_width: int,
+        channels: int,
+    ) -> typing.Optional[Transcription]:
+        """Speech to text from an audio stream."""
+        if not (self.streaming and _can_stream(sample_rate, sample_width, channels)):
+            # Re-package as a WAV.
+            with io.BytesIO() as wav_buffer:
+                wav_file: wave.Wave_write = wave.open(wav_buffer, "wb")
+                with wav_file:
+                    wav_file.setframerate(sample_rate)
+                    wav_file.setsampwidth(sample_width)
+                    wav_file.setnchannels(channels)
+
+                    for frame in audio_stream:
+                        wav_file.writeframes(frame)
+
+                return self.transcribe_wav(wav_buffer.getvalue())
+
+        self.ensure_started()
+
+        assert self.adinnet_socket, "Julius not started in streaming mode"
+
+        # Julius decodes while audio is being sent.
+        # Each packet is a 32-bit little-endian byte count followed by samples.
+        num_bytes = 0
+        for chunk in audio_stream:
+            if chunk:
+                self.adinnet_socket.sendall(struct.pack("<i", len(chunk)) + chunk)
+                num_bytes += len(chunk)
+
+        # Empty packet ends the segment
+        _LOGGER.debug("Sent %s byte(s) to Julius", num_bytes)
+        start_time = time.time()
+        self.adinnet_socket.sendall(struct.pack("<i", 0))
+
+        result_text = self.read_transcription()
+        end_time = time.time()
+
+        return Transcription(
+            text=result_text,
+            transcribe_seconds=end_time - start_time,
+            wav_seconds=num_bytes / (sample_rate * sample_width * channels),
+            likelihood=1,
+        )
+
+    def ensure_started(self):
+        """Start Julius if it's not running (or restart it if it exited)."""
+        if (self.julius_proc is not None) and (self.julius_proc.poll() is not None):
+            _LOGGER.warning(
+                "Julius exited unexpectedly (code %s). Restarting.",
+                self.julius_proc.returncode,
+            )
+            self.stop()
+
+        if self.julius_proc is None:
+            self.start_julius()
+
+    def read_line(self, timeout: typing.Optional[float] = None) -> str:
+        """Read a line of Julius output (empty at end of output)."""
+        assert self.julius_lines is not None, "Julius not started"
+
+        try:
+            line = self.julius_lines.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError()
+
+        if line is None:
+            # End of output
+            self.julius_lines.put(None)
+            return ""
 
-            print(temp_file.name, file=self.julius_out)
-            self.julius_out.flush()
+        line = line.strip()
+        _LOGGER.debug("Julius> %s", line)
 
-            sentence_line = ""
-            line = self.julius_in.readline().strip()
-            _LOGGER.debug("Julius> %s", line)
+        return line
+
+    def read_transcription(self) -> str:
+        """Read Julius output until a sentence is recognized.
+
+        If no sentence arrives within the timeout, Julius is restarted so
+        late output can't be mistaken for the next result.
+        """
+        deadline: typing.Optional[float] = None
+        if self.timeout and (self.timeout > 0):
+            deadline = time.time() + self.timeout
+
+        def read_line():
+            return self.read_line(
+                timeout=None if deadline is None else max(0, deadline - time.time())
+            )
+
+        sentence_line = ""
+
+        try:
+            line = read_line()
 
             num_empty_lines = 0
             while True:
@@ -172,28 +357,66 @@ class JuliusTranscriber(Transcriber):
                     _LOGGER.warning(line)
                     break
 
-                line = self.julius_in.readline().strip()
-                _LOGGER.debug("Julius> %s", line)
+                line = read_line()
 
                 if not line:
                     num_empty_lines += 1
 
                 if num_empty_lines >= self.max_empty_lines:
                     break
+        except TimeoutError:
+            _LOGGER.warning(
+                "No result from Julius after %s second(s). Restarting.", self.timeout
+            )
+            self.stop()
 
-            # Exclude <s> and </s>
-            _LOGGER.debug(sentence_line)
-            result_text = sentence_line.replace("<s>", "").replace("</s>", "").strip()
-            end_time = time.time()
+        # Exclude <s> and </s>
+        _LOGGER.debug(sentence_line)
+        return sentence_line.replace("<s>", "").replace("</s>", "").strip()
 
-        result_text = result_text.strip()
 
-        return Transcription(
-            text=result_text,
-            transcribe_seconds=end_time - start_time,
-            wav_seconds=wav_duration,
-            likelihood=1,
-        )
+# -----------------------------------------------------------------------------
+
+
+class JuliusTranscriberPool(Transcriber):
+    """Thread-safe pool of Julius transcribers, one process each.
+
+    Each request is handled by an idle transcriber. Transcribers restart
+    their Julius process if it exits or doesn't respond within its timeout.
+    """
+
+    def __init__(self, transcribers: typing.Sequence[JuliusTranscriber]):
+        assert transcribers, "No transcribers"
+        self.transcribers = list(transcribers)
+        self.idle_transcribers: "queue.Queue[JuliusTranscriber]" = queue.Queue()
+        for transcriber in self.transcribers:
+            self.idle_transcribers.put(transcriber)
+
+    def start(self):
+        """Start all Julius processes in parallel so the first requests are fast."""
+        threads = [
+            threading.Thread(target=transcriber.ensure_started, daemon=True)
+            for transcriber in self.transcribers
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    def stop(self):
+        """Stop all transcribers."""
+        for transcriber in self.transcribers:
+            transcriber.stop()
+
+    def transcribe_wav(self, wav_bytes: bytes) -> typing.Optional[Transcription]:
+        """Transcribe WAV data with the next idle transcriber."""
+        transcriber = self.idle_transcribers.get()
+        try:
+            return transcriber.transcribe_wav(wav_bytes)
+        finally:
+            self.idle_transcribers.put(transcriber)
 
     def transcribe_stream(
         self,
@@ -202,20 +425,110 @@ class JuliusTranscriber(Transcriber):
         sample_width: int,
         channels: int,
     ) -> typing.Optional[Transcription]:
-        """Speech to text from an audio stream."""
-        # No online streaming support.
-        # Re-package as a WAV.
-        with io.BytesIO() as wav_buffer:
-            wav_file: wave.Wave_write = wave.open(wav_buffer, "wb")
-            with wav_file:
-                wav_file.setframerate(sample_rate)
-                wav_file.setsampwidth(sample_width)
-                wav_file.setnchannels(channels)
-
-                for frame in audio_stream:
-                    wav_file.writeframes(frame)
-
-            return self.transcribe_wav(wav_buffer.getvalue())
+        """Speech to text from an audio stream with the next idle transcriber."""
+        transcriber = self.idle_transcribers.get()
+        try:
+            return transcriber.transcribe_stream(
+                audio_stream, sample_rate, sample_width, channels
+            )
+        finally:
+            self.idle_transcribers.put(transcriber)
+
+
+# Bytes of audio per adinnet packet
+_ADINNET_CHUNK_BYTES = 4096
+
+# Julius models expect 16-bit 16Khz mono audio
+_JULIUS_FORMAT = (16000, 2, 1)
+
+
+def _can_stream(sample_rate: int, sample_width: int, channels: int) -> bool:
+    """True if audio can be sent to Julius without conversion."""
+    return (sample_rate, sample_width, channels) == _JULIUS_FORMAT
+
+
+def _get_julius_frames(wav_bytes: bytes) -> bytes:
+    """Get raw audio from WAV data, converting it to Julius' format if necessary."""
+    from .audio import convert_wav_data
+
+    for _ in range(2):
+        with io.BytesIO(wav_bytes) as wav_io:
+            with wave.open(wav_io, "rb") as wav_file:
+                if _can_stream(
+                    wav_file.getframerate(),
+                    wav_file.getsampwidth(),
+                    wav_file.getnchannels(),
+                ):
+                    return wav_file.readframes(wav_file.getnframes())
+
+        converted_bytes = convert_wav_data(wav_bytes, *_JULIUS_FORMAT)
+        assert converted_bytes is not None, "Unable to convert audio for Julius"
+        wav_bytes = converted_bytes
+
+    raise ValueError("Audio conversion failed")
+
+
+def _read_lines(
+    julius_stdout: typing.TextIO, lines: "queue.Queue[typing.Optional[str]]"
+) -> None:
+    """Copy lines from Julius into a queue (None at end of output)."""
+    try:
+        for line in julius_stdout:
+            lines.put(line)
+    except ValueError:
+        # Closed
+        pass
+    finally:
+        lines.put(None)
+
+
+def _get_free_port() -> int:
+    """Ask the operating system for an unused TCP port."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as port_socket:
+        port_socket.bind(("127.0.0.1", 0))
+        return port_socket.getsockname()[1]
+
+
+def _connect_adinnet(
+    port: int, julius_proc: subprocess.Popen, timeout: float = 10
+) -> socket.socket:
+    """Connect to Julius adinnet port, waiting for it to start listening."""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            adinnet_socket = socket.create_connection(("127.0.0.1", port))
+
+            # Don't delay the small end-of-segment packet
+            adinnet_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            return adinnet_socket
+        except ConnectionRefusedError:
+            if (julius_proc.poll() is not None) or (time.time() > deadline):
+                raise
+
+            time.sleep(0.05)
+
+
+# RAM-backed directories to try (in order) for temporary audio
+_TEMP_DIRECTORIES = ["/dev/shm"]
+
+
+def get_temp_directory(
+    temp_directory: typing.Optional[typing.Union[str, Path]] = None
+) -> typing.Optional[str]:
+    """Get directory for temporary audio files.
+
+    Prefers a tmpfs directory when temp_directory isn't set. Returns None
+    to use the system default.
+    """
+    if temp_directory:
+        return str(temp_directory)
+
+    for dir_path in _TEMP_DIRECTORIES:
+        if os.path.isdir(dir_path) and os.access(dir_path, os.W_OK | os.X_OK):
+            return dir_path
+
+    return None
 
 
 # -----------------------------------------------------------------------------
@@ -0,0 +1,116 @@
+"""Support for Kaldi online (nnet3) decoding."""
+import io
+import logging
+import typing
+import wave
+from enum import Enum
+
+from rhasspyasr import Transcription
+from rhasspyasr_kaldi import KaldiCommandLineTranscriber, KaldiModelType
+
+_LOGGER = logging.getLogger("voice2json.kaldi")
+
+# -----------------------------------------------------------------------------
+
+
+class KaldiDecoderType(str, Enum):
+    """Ways of running the Kaldi decoder."""
+
+    COMMAND_LINE = "command-line"
+    ONLINE = "online"
+
+
+class KaldiOnlineTranscriber(KaldiCommandLineTranscriber):
+    """Transcriber that sends all audio through one online nnet3 decoder.
+
+    The model and HCLG are loaded once, and audio chunks are decoded as they
+    arrive, so only the final lattice work is left when an utterance ends.
+    WAV data is converted and streamed too instead of starting a new Kaldi
+    process for each file.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        assert (
+            self.model_type == KaldiModelType.NNET3
+        ), "Online decoding requires an nnet3 model"
+
+    def transcribe_wav(self, wav_bytes: bytes) -> typing.Optional[Transcription]:
+        """Speech to text from WAV data."""
+        frames = _get_kaldi_frames(wav_bytes)
+        return self.transcribe_stream(
+            (frames[i : i + _CHUNK_BYTES] for i in range(0, len(frames), _CHUNK_BYTES)),
+            *_KALDI_FORMAT,
+        )
+
+    def transcribe_stream(
+        self,
+        audio_stream: typing.Iterable[bytes],
+        sample_rate: int,
+        sample_width: int,
+        channels: int,
+    ) -> typing.Optional[Transcription]:
+        """Speech to text from an audio stream."""
+        if (sample_rate, sample_width, channels) != _KALDI_FORMAT:
+            # Re-package as a WAV and convert
+            with io.BytesIO() as wav_buffer:
+                wav_file: wave.Wave_write = wave.open(wav_buffer, "wb")
+                with wav_file:
+                    wav_file.setframerate(sample_rate)
+                    wav_file.setsampwidth(sample_width)
+                    wav_file.setnchannels(channels)
+
+                    for frame in audio_stream:
+                        wav_file.writeframes(frame)
+
+                return self.transcribe_wav(wav_buffer.getvalue())
+
+        if (self.decode_proc is not None) and (self.decode_proc.poll() is not None):
+            _LOGGER.warning(
+                "Kaldi decoder exited unexpectedly (code %s). Restarting.",
+                self.decode_proc.returncode,
+            )
+            self.stop()
+
+        return super().transcribe_stream(
+            audio_stream, sample_rate, sample_width, channels
+        )
+
+    def __repr__(self) -> str:
+        return (
+            "KaldiOnlineTranscriber("
+            f"model_type={self.model_type}"
+            f", model_dir={self.model_dir}"
+            f", graph_dir={self.graph_dir}"
+            ")"
+        )
+
+
+# -----------------------------------------------------------------------------
+
+# Bytes of audio per chunk when streaming WAV data
+_CHUNK_BYTES = 4096
+
+# Kaldi online models expect 16-bit 16Khz mono audio
+_KALDI_FORMAT = (16000, 2, 1)
+
+
+def _get_kaldi_frames(wav_bytes: bytes) -> bytes:
+    """Get raw audio from WAV data, converting it to Kaldi's format if necessary."""
+    from .audio import convert_wav_data
+
+    with io.BytesIO(wav_bytes) as wav_io:
+        with wave.open(wav_io, "rb") as wav_file:
+            if (
+                wav_file.getframerate(),
+                wav_file.getsampwidth(),
+                wav_file.getnchannels(),
+            ) == _KALDI_FORMAT:
+                return wav_file.readframes(wav_file.getnframes())
+
+    converted_bytes = convert_wav_data(wav_bytes, *_KALDI_FORMAT)
+    assert converted_bytes is not None, "Unable to convert audio for Kaldi"
+
+    with io.BytesIO(converted_bytes) as wav_io:
+        with wave.open(wav_io, "rb") as wav_file:
+            return wav_file.readframes(wav_file.getnframes())
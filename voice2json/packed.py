@@ -0,0 +1,154 @@
+"""Memory-mapped tables used by compiled profile artifacts."""
+import array
+import mmap
+import struct
+import sys
+import typing
+from pathlib import Path
+
+# magic, version, byte order (0 = little, 1 = big), number of sections
+_HEADER = struct.Struct("<4sIII")
+
+# typecode, item count, byte offset
+_SECTION = struct.Struct("<4sQQ")
+
+# Sections start on 8-byte boundaries so they can be cast in place
+_ALIGN = 8
+
+SectionType = typing.Union["array.array[typing.Any]", bytes]
+
+# -----------------------------------------------------------------------------
+
+
+def write_packed(
+    path: typing.Union[str, Path],
+    magic: bytes,
+    version: int,
+    sections: typing.Sequence[SectionType],
+) -> None:
+    """Write arrays (or raw bytes) to a file that can be read with PackedFile."""
+    assert len(magic) == 4, "Magic must be 4 bytes"
+    byte_order = 0 if sys.byteorder == "little" else 1
+
+    # Compute section offsets
+    offset = _HEADER.size + (_SECTION.size * len(sections))
+    section_infos: typing.List[typing.Tuple[bytes, int, int]] = []
+    for section in sections:
+        offset += (-offset) % _ALIGN
+        if isinstance(section, array.array):
+            typecode = section.typecode.encode()
+            section_infos.append((typecode, len(section), offset))
+            offset += len(section) * section.itemsize
+        else:
+            section_infos.append((b"B", len(section), offset))
+            offset += len(section)
+
+    with open(path, "wb") as packed_file:
+        packed_file.write(_HEADER.pack(magic, version, byte_order, len(sections)))
+        for section_info in section_infos:
+            packed_file.write(_SECTION.pack(*section_info))
+
+        for section, (_, _, section_offset) in zip(sections, section_infos):
+            packed_file.write(bytes(section_offset - packed_file.tell()))
+            if isinstance(section, array.array):
+                section.tofile(packed_file)
+            else:
+                packed_file.write(section)
+
+
+class PackedFile:
+    """Read-only, memory-mapped view of a file written by write_packed."""
+
+    def __init__(self, path: typing.Union[str, Path], magic: bytes, version: int):
+        self.path = Path(path)
+
+        with open(self.path, "rb") as packed_file:
+            self._mmap = mmap.mmap(packed_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._buffer = memoryview(self._mmap)
+
+        file_magic, file_version, byte_order, num_sections = _HEADER.unpack_from(
+            self._buffer
+        )
+
+        if (file_magic != magic) or (file_version != version):
+            self.close()
+            raise ValueError(
+                f"Unexpected format in {self.path} (magic={file_magic!r}, version={file_version})"
+            )
+
+        if byte_order != (0 if sys.byteorder == "little" else 1):
+            self.close()
+            raise ValueError(f"Byte order mismatch in {self.path}")
+
+        self.sections: typing.List[memoryview] = []
+        for section_index in range(num_sections):
+            typecode, count, offset = _SECTION.unpack_from(
+                self._buffer, _HEADER.size + (section_index * _SECTION.size)
+            )
+            typecode = typecode.rstrip(b"\0").decode()
+            itemsize = array.array(typecode).itemsize
+            section = self._buffer[offset : offset + (count * itemsize)]
+            if typecode != "B":
+                section = section.cast(typecode)
+
+            self.sections.append(section)
+
+    def close(self):
+        """Release memory map."""
+        for section in getattr(self, "sections", []):
+            section.release()
+
+        self.sections = []
+        self._buffer.release()
+        self._mmap.close()
+
+
+# -----------------------------------------------------------------------------
+
+
+def pack_strings(
+    strings: typing.Iterable[str],
+) -> typing.Tuple["array.array[int]", bytes]:
+    """Pack strings into (offsets, UTF-8 data) sections for StringTable."""
+    offsets = array.array("I", [0])
+    data = bytearray()
+    for s in strings:
+        data.extend(s.encode())
+        offsets.append(len(data))
+
+    return offsets, bytes(data)
+
+
+class StringTable:
+    """Sequence of strings stored as offsets into a block of UTF-8 data."""
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return str(self.get_bytes(index), "utf-8")
+
+    def get_bytes(self, index: int) -> memoryview:
+        """Get UTF-8 data for string without decoding."""
+        return self.data[self.offsets[index] : self.offsets[index + 1]]
+
+    def find(self, s: str) -> typing.Optional[int]:
+        """Binary search for string in a sorted table. Returns index or None."""
+        key = s.encode()
+        low, high = 0, len(self)
+        while low < high:
+            mid = (low + high) // 2
+            if bytes(self.get_bytes(mid)) < key:
+                low = mid + 1
+            else:
+                high = mid
+
+        if (low < len(self)) and (self.get_bytes(low) == key):
+            return low
+
+        return None
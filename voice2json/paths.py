@@ -0,0 +1,265 @@
+"""Counting, indexing, and sampling paths through an intent graph."""
+import bisect
+import hashlib
+import json
+import logging
+import random
+import sys
+import typing
+from collections import deque
+
+_LOGGER = logging.getLogger("voice2json.paths")
+
+# -----------------------------------------------------------------------------
+
+
+class GraphPaths:
+    """Paths from a start node to an end node in a directed acyclic graph.
+
+    Paths are numbered 0 to num_paths - 1 using the number of paths from each
+    node to the end node, so any path can be built directly from its index
+    without enumerating the ones before it.
+    """
+
+    def __init__(self, graph, start_node: int, end_node: int):
+        self.graph = graph
+        self.start_node = start_node
+        self.end_node = end_node
+
+        # node -> successors that can reach end node
+        self.children: typing.Dict[int, typing.List[int]] = {}
+
+        # node -> cumulative number of paths through each child
+        self.cumulative_counts: typing.Dict[int, typing.List[int]] = {}
+
+        self.path_counts = self._count_paths()
+        self.num_paths = self.path_counts.get(start_node, 0)
+
+        _LOGGER.debug("Intent graph has %s path(s)", self.num_paths)
+
+    def _count_paths(self) -> typing.Dict[int, int]:
+        """Count paths from each node to the end node (iterative post-order DFS)."""
+        path_counts: typing.Dict[int, int] = {self.end_node: 1}
+        stack = [self.start_node]
+
+        while stack:
+            node = stack[-1]
+            if node in path_counts:
+                stack.pop()
+                continue
+
+            unvisited = [
+                child
+                for child in self.graph.successors(node)
+                if child not in path_counts
+            ]
+            if unvisited:
+                stack.extend(unvisited)
+                continue
+
+            # All children are counted
+            stack.pop()
+            node_children = []
+            node_cumulative = []
+            node_count = 0
+            for child in self.graph.successors(node):
+                child_count = path_counts[child]
+                if child_count > 0:
+                    node_count += child_count
+                    node_children.append(child)
+                    node_cumulative.append(node_count)
+
+            path_counts[node] = node_count
+            if node_children:
+                self.children[node] = node_children
+                self.cumulative_counts[node] = node_cumulative
+
+        return path_counts
+
+    def __len__(self) -> int:
+        return self.num_paths
+
+    def path(self, index: int) -> typing.List[int]:
+        """Get the path with a specific index in [0, num_paths)."""
+        if not 0 <= index < self.num_paths:
+            raise IndexError(index)
+
+        node = self.start_node
+        path = [node]
+        while node != self.end_node:
+            node_cumulative = self.cumulative_counts[node]
+            child_index = bisect.bisect_right(node_cumulative, index)
+            if child_index > 0:
+                index -= node_cumulative[child_index - 1]
+
+            node = self.children[node][child_index]
+            path.append(node)
+
+        return path
+
+    def random_path(
+        self, rng: typing.Optional[random.Random] = None
+    ) -> typing.List[int]:
+        """Get a path chosen uniformly at random."""
+        rng = rng or random
+        return self.path(rng.randrange(self.num_paths))
+
+    def random_paths(
+        self,
+        number: typing.Optional[int] = None,
+        rng: typing.Optional[random.Random] = None,
+    ) -> typing.Iterable[typing.List[int]]:
+        """Yield distinct paths chosen uniformly at random (all if number is None)."""
+        for index in self.random_indexes(number, rng=rng):
+            yield self.path(index)
+
+    def random_indexes(
+        self,
+        number: typing.Optional[int] = None,
+        rng: typing.Optional[random.Random] = None,
+    ) -> typing.Iterable[int]:
+        """Yield distinct path indexes in random order (all if number is None)."""
+        rng = rng or random
+        if (number is None) or (number > self.num_paths):
+            number = self.num_paths
+
+        if (2 * number > self.num_paths) and (self.num_paths <= sys.maxsize):
+            # Most paths will be used
+            yield from rng.sample(range(self.num_paths), number)
+        else:
+            # Few paths compared to total
+            used_indexes: typing.Set[int] = set()
+            while len(used_indexes) < number:
+                index = rng.randrange(self.num_paths)
+                if index not in used_indexes:
+                    used_indexes.add(index)
+                    yield index
+
+    def __iter__(self) -> typing.Iterator[typing.List[int]]:
+        """Yield every path in index order, keeping only the current path in memory."""
+        if self.num_paths < 1:
+            return
+
+        path = [self.start_node]
+        child_iters = [iter(self.children.get(self.start_node, []))]
+
+        while child_iters:
+            child = next(child_iters[-1], None)
+            if child is None:
+                # Backtrack
+                child_iters.pop()
+                path.pop()
+                continue
+
+            path.append(child)
+            if child == self.end_node:
+                yield list(path)
+                path.pop()
+            else:
+                child_iters.append(iter(self.children[child]))
+
+
+# -----------------------------------------------------------------------------
+
+
+def get_intent_graph_stats(graph) -> typing.Dict[str, typing.Any]:
+    """Count sentences, words, nodes, and edges overall and for each intent."""
+    import rhasspynlu
+
+    start_node, end_node = rhasspynlu.jsgf_graph.get_start_end_nodes(graph)
+    assert (start_node is not None) and (
+        end_node is not None
+    ), "Missing start/end node(s)"
+
+    paths = GraphPaths(graph, start_node, end_node)
+    vocabulary: typing.Set[str] = set()
+    intent_words: typing.Dict[str, typing.Set[str]] = {}
+    intent_stats: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+
+    for intent_node in graph.successors(start_node):
+        olabel = graph.edges[(start_node, intent_node)].get("olabel", "")
+        intent_name = (
+            olabel[len("__label__") :] if olabel.startswith("__label__") else ""
+        )
+        stats = intent_stats.setdefault(
+            intent_name, {"sentences": 0, "vocabulary": 0, "nodes": 0, "edges": 0}
+        )
+
+        # Walk the intent's sub-graph
+        intent_vocabulary = intent_words.setdefault(intent_name, set())
+        visited = {intent_node}
+        num_edges = 0
+        stack = [intent_node]
+        while stack:
+            node = stack.pop()
+            for child in graph.successors(node):
+                num_edges += 1
+                ilabel = graph.edges[(node, child)].get("ilabel", "")
+                if ilabel:
+                    intent_vocabulary.add(ilabel)
+
+                if child not in visited:
+                    visited.add(child)
+                    stack.append(child)
+
+        vocabulary.update(intent_vocabulary)
+
+        stats["sentences"] += paths.path_counts.get(intent_node, 0)
+        stats["vocabulary"] = len(intent_vocabulary)
+        stats["nodes"] += len(visited)
+        stats["edges"] += num_edges + 1
+
+    return {
+        "sentences": paths.num_paths,
+        "vocabulary": len(vocabulary),
+        "nodes": graph.number_of_nodes(),
+        "edges": graph.number_of_edges(),
+        "intents": intent_stats,
+    }
+
+
+def get_intent_graph_fingerprint(graph) -> str:
+    """Hash of the sentences, labels, and weights in an intent graph.
+
+    Nodes are numbered in breadth-first order from the start node, following
+    edges sorted by label, so the hash doesn't depend on how the graph was
+    written to disk and usually not on the order its sentences were added.
+    """
+    import rhasspynlu
+
+    start_node, _ = rhasspynlu.jsgf_graph.get_start_end_nodes(graph)
+    assert start_node is not None, "Missing start node"
+
+    hasher = hashlib.sha256()
+    node_order = {start_node: 0}
+    queue = deque([start_node])
+
+    while queue:
+        node = queue.popleft()
+        if graph.nodes[node].get("final"):
+            hasher.update(json.dumps([node_order[node], "final"]).encode())
+
+        edges = []
+        for child in graph.successors(node):
+            edge_data = graph.edges[(node, child)]
+            edges.append(
+                (
+                    edge_data.get("ilabel") or "",
+                    edge_data.get("olabel") or "",
+                    edge_data.get("weight", 0),
+                    child,
+                )
+            )
+
+        for ilabel, olabel, weight, child in sorted(edges, key=lambda edge: edge[:3]):
+            if child not in node_order:
+                node_order[child] = len(node_order)
+                queue.append(child)
+
+            hasher.update(
+                json.dumps(
+                    [node_order[node], node_order[child], ilabel, olabel, weight]
+                ).encode()
+            )
+
+    return hasher.hexdigest()
@@ -16,7 +16,12 @@ import rhasspynlu
 from rhasspynlu.g2p import PronunciationAction, PronunciationsType
 
 from .core import Voice2JsonCore
-from .sounds_like import G2PAlignmentType, load_g2p_corpus, load_sounds_like
+from .sounds_like import (
+    G2PAlignmentType,
+    close_g2p_alignment,
+    load_g2p_corpus,
+    load_sounds_like,
+)
 
 _LOGGER = logging.getLogger("voice2json.pronounce")
 
@@ -38,6 +43,7 @@ async def pronounce(args: argparse.Namespace, core: Voice2JsonCore) -> None:
     g2p_exists = False
 
     pronunciations: rhasspynlu.g2p.PronunciationsType = {}
+    g2p_alignment: typing.Optional[G2PAlignmentType] = None
 
     if phoneme_pronunciations:
         # Make sure profile has been trained
@@ -46,6 +52,9 @@ async def pronounce(args: argparse.Namespace, core: Voice2JsonCore) -> None:
         base_dictionary_path = core.ppath(
             "training.base_dictionary", "base_dictionary.txt"
         )
+        base_dictionary_cache_path = core.ppath(
+            "training.base-dictionary-cache", "base_dictionary.cache"
+        )
         custom_words_path = core.ppath("training.custom-words-file", "custom_words.txt")
         custom_words_action = PronunciationAction(
             pydash.get(core.profile, "training.custom-words-action", "append")
@@ -54,10 +63,16 @@ async def pronounce(args: argparse.Namespace, core: Voice2JsonCore) -> None:
         sounds_like_action = PronunciationAction(
             pydash.get(core.profile, "training.sounds-like-action", "append")
         )
+        sounds_like_max_pronunciations = int(
+            pydash.get(core.profile, "training.sounds-like-max-pronunciations", 100)
+        )
         g2p_path = core.ppath("training.g2p-model", "g2p.fst")
         g2p_corpus_path = core.ppath(
             "training.grapheme-to-phoneme-corpus", "g2p.corpus"
         )
+        g2p_corpus_index_path = core.ppath(
+            "training.grapheme-to-phoneme-corpus-index", "g2p.corpus.index"
+        )
         g2p_exists = bool(g2p_path and g2p_path.exists())
 
         # Load pronunciations
@@ -68,6 +83,9 @@ async def pronounce(args: argparse.Namespace, core: Voice2JsonCore) -> None:
             sounds_like=sounds_like_path,
             sounds_like_action=sounds_like_action,
             g2p_corpus=g2p_corpus_path,
+            base_dictionary_cache=base_dictionary_cache_path,
+            g2p_corpus_index=g2p_corpus_index_path,
+            sounds_like_max_pronunciations=sounds_like_max_pronunciations,
         )
 
     # True if audio will go to stdout.
@@ -124,14 +142,17 @@ async def pronounce(args: argparse.Namespace, core: Voice2JsonCore) -> None:
                             g2p_corpus_path and g2p_corpus_path.is_file()
                         ), f"Missing g2p corpus: {g2p_corpus_path}"
 
-                        g2p_alignment = load_g2p_corpus(g2p_corpus_path)
+                        g2p_alignment = load_g2p_corpus(
+                            g2p_corpus_path, index_path=g2p_corpus_index_path
+                        )
 
                     with io.StringIO(line) as sounds_like_file:
-                        load_sounds_like(
+                        g2p_alignment = load_sounds_like(
                             sounds_like_file,
                             pronunciations=pronunciations,
                             action=sounds_like_action,
                             g2p_alignment=g2p_alignment,
+                            max_pronunciations=sounds_like_max_pronunciations,
                         )
 
                     dict_phonemes.extend(
@@ -209,6 +230,8 @@ async def pronounce(args: argparse.Namespace, core: Voice2JsonCore) -> None:
 
     except KeyboardInterrupt:
         pass
+    finally:
+        close_g2p_alignment(g2p_alignment)
 
 
 # -----------------------------------------------------------------------------
@@ -393,8 +416,16 @@ def load_pronunciations(
     sounds_like: typing.Optional[Path] = None,
     sounds_like_action: PronunciationAction = PronunciationAction.APPEND,
     g2p_corpus: typing.Optional[Path] = None,
+    base_dictionary_cache: typing.Optional[Path] = None,
+    g2p_corpus_index: typing.Optional[Path] = None,
+    sounds_like_max_pronunciations: typing.Optional[int] = None,
+    sounds_like_counts: typing.Optional[typing.List[typing.Tuple[str, int]]] = None,
 ) -> typing.Tuple[PronunciationsType, typing.Optional[G2PAlignmentType]]:
-    """Loads phonetic pronunciations from available dictionaries and sounds like file."""
+    """Loads phonetic pronunciations from available dictionaries and sounds like file.
+
+    If base_dictionary_cache is given, the base dictionary is compiled there
+    and words are looked up lazily.
+    """
     pronunciations: PronunciationsType = defaultdict(list)
 
     for dict_path in [base_dictionary, custom_words]:
@@ -405,6 +436,21 @@ def load_pronunciations(
             _LOGGER.warning("Skipping %s (does not exist)", dict_path)
             continue
 
+        if (dict_path == base_dictionary) and base_dictionary_cache:
+            from .dictionary import load_compiled_dictionary
+
+            try:
+                # Duck-typed stand-in for a dict
+                pronunciations = typing.cast(
+                    PronunciationsType,
+                    load_compiled_dictionary(
+                        dict_path, base_dictionary_cache, action=custom_words_action
+                    ),
+                )
+                continue
+            except OSError:
+                _LOGGER.exception("Failed to compile %s", dict_path)
+
         _LOGGER.debug("Loading base dictionary from %s", dict_path)
         with open(dict_path, "r") as dict_file:
             rhasspynlu.g2p.read_pronunciations(
@@ -420,6 +466,9 @@ def load_pronunciations(
             pronunciations,
             action=sounds_like_action,
             g2p_corpus=g2p_corpus,
+            g2p_corpus_index=g2p_corpus_index,
+            max_pronunciations=sounds_like_max_pronunciations,
+            entry_counts=sounds_like_counts,
         )
 
     return pronunciations, g2p_alignment
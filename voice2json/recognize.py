@@ -1,18 +1,20 @@
 """Intent recognition methods."""
 import argparse
+import copy
 import dataclasses
-import gzip
 import io
 import json
 import logging
 import os
+import pickle
 import subprocess
 import sys
+import threading
+import time
 import typing
+from collections import OrderedDict
 from pathlib import Path
 
-import pydash
-
 from .core import Voice2JsonCore
 from .utils import print_json
 
@@ -23,45 +25,9 @@ _LOGGER = logging.getLogger("voice2json.recognize")
 
 async def recognize(args: argparse.Namespace, core: Voice2JsonCore) -> None:
     """Recognize intent from sentence(s)."""
-    import networkx as nx
-    import rhasspynlu
-    from .train import WordCasing
-
     # Make sure profile has been trained
     assert core.check_trained(), "Not trained"
 
-    # Load settings
-    language_code = pydash.get(core.profile, "language.code", "en-US")
-    word_casing = WordCasing(
-        pydash.get(core.profile, "training.word-casing", "ignore").lower()
-    )
-    intent_graph_path = core.ppath("training.intent-graph", "intent.pickle.gz")
-    converters_dir = core.ppath("training.converters-directory", "converters")
-    stop_words_path = core.ppath("intent-recognition.stop-words", "stop_words.txt")
-    fuzzy = pydash.get(core.profile, "intent-recognition.fuzzy", True)
-
-    # Load stop words
-    stop_words: typing.Optional[typing.Set[str]] = None
-    if stop_words_path and stop_words_path.is_file():
-        stop_words = set()
-        with open(stop_words_path, "r") as stop_words_file:
-            for line in stop_words_file:
-                line = line.strip()
-                if line:
-                    stop_words.add(line)
-
-    # Load converters
-    extra_converters: typing.Optional[typing.Dict[str, typing.Any]] = {}
-    if converters_dir:
-        extra_converters = load_converters(converters_dir)
-
-    # Case transformation for input words
-    word_transform = None
-    if word_casing == WordCasing.UPPER:
-        word_transform = str.upper
-    elif word_casing == WordCasing.LOWER:
-        word_transform = str.lower
-
     if args.sentence:
         sentences = args.sentence
     else:
@@ -70,94 +36,383 @@ async def recognize(args: argparse.Namespace, core: Voice2JsonCore) -> None:
 
         sentences = sys.stdin
 
-    # Whitelist function for intents
+    # Whitelist for intents
     if args.intent_filter:
         args.intent_filter = set(args.intent_filter)
 
-    def intent_filter(intent_name: str) -> bool:
-        """Filter out intents."""
-        if args.intent_filter:
-            return intent_name in args.intent_filter
+    # Load intent graph and settings
+    recognizer = IntentRecognizer(core)
 
-        return True
+    # Process sentences
+    try:
+        if args.workers > 1:
+            import multiprocessing
+
+            # Forked workers share the recognizer (and intent graph) copy-on-write
+            global _WORKER_STATE
+            _WORKER_STATE = (recognizer, args)
+
+            with multiprocessing.get_context("fork").Pool(args.workers) as pool:
+                # imap preserves input order
+                for sentence_object, cache_entries in pool.imap(
+                    _recognize_worker, sentences, chunksize=args.batch_size
+                ):
+                    print_json(sentence_object)
+
+                    # Worker caches are lost when the pool exits
+                    recognizer.add_to_cache(cache_entries)
+        else:
+            for sentence in sentences:
+                print_json(recognize_sentence(sentence, recognizer, args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recognizer.stop()
 
-    # Load intent graph
-    _LOGGER.debug("Loading %s", intent_graph_path)
-    with gzip.GzipFile(intent_graph_path, mode="rb") as graph_gzip:
-        intent_graph = nx.readwrite.gpickle.read_gpickle(graph_gzip)
 
-    # Process sentences
+def recognize_sentence(
+    sentence: str, recognizer: "IntentRecognizer", args: argparse.Namespace
+) -> typing.Dict[str, typing.Any]:
+    """Recognize intent from a single line of input (JSON or text)."""
+    import rhasspynlu
+
+    if args.text_input:
+        # Input is plain text
+        text = sentence
+        sentence_object = {"text": text}
+    else:
+        # Input is JSON
+        sentence_object = json.loads(sentence)
+        text = sentence_object.get(args.transcription_property, "")
+
+    # Recognize intent
+    text = text.strip()
+    recognition = recognizer.recognize(
+        text, replace_numbers=args.replace_numbers, intent_filter=args.intent_filter
+    )
+
+    sentence_object = recognition_to_dict(recognition, sentence_object, text)
+
+    if args.perplexity:
+        # Compute perplexity of input text for one or more language
+        # models (stored in FST binary format).
+        perplexity = {}
+        for lm_fst_path in args.perplexity:
+            try:
+                perplexity[lm_fst_path] = rhasspynlu.arpa_lm.get_perplexity(
+                    text, lm_fst_path, debug=args.debug
+                )
+            except Exception:
+                _LOGGER.exception(lm_fst_path)
+
+        sentence_object["perplexity"] = perplexity
+
+    return sentence_object
+
+
+# Recognizer and arguments inherited by forked worker processes
+_WORKER_STATE: typing.Optional[
+    typing.Tuple["IntentRecognizer", argparse.Namespace]
+] = None
+
+
+def _recognize_worker(
+    sentence: str
+) -> typing.Tuple[typing.Dict[str, typing.Any], typing.List[typing.Any]]:
+    """Recognize a sentence in a worker process.
+
+    Returns the result and new (key, recognition) cache entries for the parent.
+    """
+    assert _WORKER_STATE is not None, "Worker state not set"
+    recognizer, args = _WORKER_STATE
+
+    recognizer.new_cache_entries = []
     try:
-        for sentence in sentences:
-            if args.text_input:
-                # Input is plain text
-                text = sentence
-                sentence_object = {"text": text}
-            else:
-                # Input is JSON
-                sentence_object = json.loads(sentence)
-                text = sentence_object.get(args.transcription_property, "")
+        sentence_object = recognize_sentence(sentence, recognizer, args)
+        return sentence_object, recognizer.new_cache_entries
+    finally:
+        recognizer.new_cache_entries = None
+
+
+# -----------------------------------------------------------------------------
+
 
-            # Tokenize
-            text = text.strip()
-            tokens = text.split()
+class IntentRecognizer:
+    """Recognizes intents from text using a profile's intent graph and settings."""
+
+    def __init__(self, core: Voice2JsonCore, intent_graph=None):
+        from .train import WordCasing
+
+        # Load settings
+        settings = core.settings.intent_recognition
+        self.language_code = settings.language_code
+        word_casing = WordCasing(settings.word_casing)
+        converters_dir = core.ppath("training.converters-directory", "converters")
+        stop_words_path = core.ppath("intent-recognition.stop-words", "stop_words.txt")
+        self.fuzzy = settings.fuzzy
+
+        # Load stop words
+        self.stop_words: typing.Optional[typing.Set[str]] = None
+        if stop_words_path and stop_words_path.is_file():
+            self.stop_words = set()
+            with open(stop_words_path, "r") as stop_words_file:
+                for line in stop_words_file:
+                    line = line.strip()
+                    if line:
+                        self.stop_words.add(line)
+
+        # Load converters
+        self.extra_converters: typing.Dict[str, typing.Any] = {}
+        if converters_dir:
+            self.extra_converters = load_converters(
+                converters_dir,
+                persistent_converters=settings.persistent_converters,
+            )
+
+        # Case transformation for input words
+        self.word_transform: typing.Optional[typing.Callable[[str], str]] = None
+        if word_casing == WordCasing.UPPER:
+            self.word_transform = str.upper
+        elif word_casing == WordCasing.LOWER:
+            self.word_transform = str.lower
+
+        # Load intent graph
+        if intent_graph is None:
+            intent_graph = core.load_intent_graph()
+
+        self.intent_graph = intent_graph
+
+        # Cache of recent recognitions.
+        # Key is (tokens, intent filter).
+        self.cache_size = settings.cache_size
+        self.cache: "OrderedDict[typing.Any, typing.Any]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_changed = False
+
+        # If not None, new cache entries are also collected here (worker processes)
+        self.new_cache_entries: typing.Optional[typing.List[typing.Any]] = None
+
+        # recognize may be called from multiple threads (serve)
+        self.cache_lock = threading.Lock()
+
+        # User converters are external programs whose output may change, so
+        # recognitions that run one are never cached.
+        self.converter_state = threading.local()
+        self.recognize_converters = {
+            name: self.track_converter(converter)
+            for name, converter in self.extra_converters.items()
+        }
+
+        # Cached recognitions are only valid for a specific intent graph and
+        # recognition settings.
+        self.cache_path = core.ppath("intent-recognition.cache-file")
+        self.cache_signature = (
+            tuple(
+                (str(path), path.stat().st_size, path.stat().st_mtime_ns)
+                for path in [
+                    core.ppath("intent-recognition.intent-graph", "intent.pickle.gz"),
+                    core.ppath(
+                        "intent-recognition.intent-graph-compact", "intent.graph"
+                    ),
+                ]
+                if path and path.is_file()
+            ),
+            self.language_code,
+            self.fuzzy,
+            tuple(sorted(self.stop_words)) if self.stop_words is not None else None,
+            word_casing.value,
+            tuple(sorted(self.extra_converters)),
+        )
+
+        if (self.cache_size > 0) and self.cache_path:
+            self.load_cache()
+
+    def recognize(
+        self,
+        text: str,
+        replace_numbers: bool = False,
+        intent_filter: typing.Optional[typing.Set[str]] = None,
+    ):
+        """Recognize a single sentence. Returns an empty recognition on failure."""
+        import rhasspynlu
 
-            if args.replace_numbers:
-                tokens = list(
-                    rhasspynlu.replace_numbers(tokens, language=language_code)
+        # Tokenize
+        tokens = text.split()
+
+        if replace_numbers:
+            tokens = list(
+                rhasspynlu.replace_numbers(tokens, language=self.language_code)
+            )
+
+        if self.word_transform:
+            tokens = [self.word_transform(t) for t in tokens]
+
+        cache_key: typing.Any = None
+        if self.cache_size > 0:
+            start_time = time.perf_counter()
+            cache_key = (
+                tuple(tokens),
+                frozenset(intent_filter) if intent_filter else None,
+            )
+            with self.cache_lock:
+                recognition = self.cache.get(cache_key)
+                if recognition is not None:
+                    self.cache_hits += 1
+                    self.cache.move_to_end(cache_key)
+                else:
+                    self.cache_misses += 1
+
+                cache_hits, cache_misses = self.cache_hits, self.cache_misses
+
+            if recognition is not None:
+                _LOGGER.debug(
+                    "Recognition cache hit (hits=%s, misses=%s)",
+                    cache_hits,
+                    cache_misses,
                 )
 
-            # Recognize intent
-            recognitions = rhasspynlu.recognize(
-                tokens,
-                intent_graph,
-                fuzzy=fuzzy,
-                stop_words=stop_words,
-                word_transform=word_transform,
-                extra_converters=extra_converters,
-                intent_filter=intent_filter,
+                recognition = copy.deepcopy(recognition)
+                recognition.recognize_seconds = time.perf_counter() - start_time
+                return recognition
+
+            _LOGGER.debug(
+                "Recognition cache miss (hits=%s, misses=%s)",
+                cache_hits,
+                cache_misses,
             )
 
-            if recognitions:
-                # Use first recognition
-                recognition = recognitions[0]
-            else:
-                # Recognition failure
-                recognition = rhasspynlu.intent.Recognition.empty()
+        # Whitelist function for intents
+        filter_func: typing.Optional[typing.Callable[[str], bool]] = None
+        if intent_filter:
+            filter_func = intent_filter.__contains__
+
+        # Recognize intent
+        self.converter_state.used = False
+        recognitions = rhasspynlu.recognize(
+            tokens,
+            self.intent_graph,
+            fuzzy=self.fuzzy,
+            stop_words=self.stop_words,
+            word_transform=self.word_transform,
+            extra_converters=self.recognize_converters,
+            intent_filter=filter_func,
+        )
 
-            result = dataclasses.asdict(recognition)
+        if recognitions:
+            # Use first recognition
+            recognition = recognitions[0]
+        else:
+            # Recognition failure
+            recognition = rhasspynlu.intent.Recognition.empty()
 
-            # Add slots
-            result["slots"] = {e.entity: e.value for e in recognition.entities}
+        if (cache_key is not None) and (not self.converter_state.used):
+            cache_entry = (cache_key, copy.deepcopy(recognition))
+            self.add_to_cache([cache_entry])
 
-            # Merge with input object
-            for key, value in result.items():
-                if (key not in sentence_object) or (value is not None):
-                    sentence_object[key] = value
+            if self.new_cache_entries is not None:
+                self.new_cache_entries.append(cache_entry)
 
-            if not sentence_object["text"]:
-                sentence_object["text"] = text
+        return recognition
 
-            # Keep text from transcription
-            sentence_object["raw_text"] = text
+    def add_to_cache(self, cache_entries: typing.Iterable[typing.Any]):
+        """Add (key, recognition) entries to the cache, evicting the oldest."""
+        if self.cache_size <= 0:
+            return
 
-            if args.perplexity:
-                # Compute perplexity of input text for one or more language
-                # models (stored in FST binary format).
-                perplexity = {}
-                for lm_fst_path in args.perplexity:
-                    try:
-                        perplexity[lm_fst_path] = rhasspynlu.arpa_lm.get_perplexity(
-                            text, lm_fst_path, debug=args.debug
-                        )
-                    except Exception:
-                        _LOGGER.exception(lm_fst_path)
+        with self.cache_lock:
+            for cache_key, recognition in cache_entries:
+                self.cache[cache_key] = recognition
+                self.cache.move_to_end(cache_key)
+                self.cache_changed = True
 
-                sentence_object["perplexity"] = perplexity
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
 
-            print_json(sentence_object)
-    except KeyboardInterrupt:
-        pass
+    def track_converter(self, converter: typing.Callable) -> typing.Callable:
+        """Wrap a user converter to record that it was run by this thread."""
+
+        def tracked_converter(*args, **kwargs):
+            self.converter_state.used = True
+            return converter(*args, **kwargs)
+
+        return tracked_converter
+
+    def load_cache(self):
+        """Load cached recognitions from disk if they match the intent graph."""
+        assert self.cache_path
+        if not self.cache_path.is_file():
+            return
+
+        try:
+            with open(self.cache_path, "rb") as cache_file:
+                signature, cache = pickle.load(cache_file)
+
+            if signature != self.cache_signature:
+                _LOGGER.debug("Intent graph changed. Ignoring %s", self.cache_path)
+                return
+
+            self.cache = cache
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+            _LOGGER.debug(
+                "Loaded %s cached recognition(s) from %s",
+                len(self.cache),
+                self.cache_path,
+            )
+        except Exception:
+            _LOGGER.exception("load_cache")
+
+    def stop(self):
+        """Save cache and stop converter programs."""
+        self.save_cache()
+
+        for converter in self.extra_converters.values():
+            converter.stop()
+
+    def save_cache(self):
+        """Save cached recognitions to disk (if enabled and changed)."""
+        if not (self.cache_path and self.cache_changed):
+            return
+
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.cache_lock:
+            with open(self.cache_path, "wb") as cache_file:
+                pickle.dump((self.cache_signature, self.cache), cache_file)
+
+            self.cache_changed = False
+
+        _LOGGER.debug(
+            "Saved %s cached recognition(s) to %s (hits=%s, misses=%s)",
+            len(self.cache),
+            self.cache_path,
+            self.cache_hits,
+            self.cache_misses,
+        )
+
+
+def recognition_to_dict(
+    recognition, sentence_object: typing.Dict[str, typing.Any], text: str
+) -> typing.Dict[str, typing.Any]:
+    """Merge a recognition (with slots) into an input JSON object."""
+    result = dataclasses.asdict(recognition)
+
+    # Add slots
+    result["slots"] = {e.entity: e.value for e in recognition.entities}
+
+    # Merge with input object
+    for key, value in result.items():
+        if (key not in sentence_object) or (value is not None):
+            sentence_object[key] = value
+
+    if not sentence_object["text"]:
+        sentence_object["text"] = text
+
+    # Keep text from transcription
+    sentence_object["raw_text"] = text
+
+    return sentence_object
 
 
 # -----------------------------------------------------------------------------
@@ -188,11 +443,88 @@ class CommandLineConverter:
 
             return [json.loads(line) for line in stdout.splitlines() if line.strip()]
 
+    def stop(self):
+        """Stop any running processes."""
+        pass
+
+
+class PersistentCommandLineConverter(CommandLineConverter):
+    """Command-line converter that is started once and handles many requests.
+
+    Each request is a single line of JSON with "args" and "converter_args".
+    The program must respond with a single line containing a JSON list of
+    converted values, and should exit when its standard in is closed.
+    """
+
+    def __init__(self, name: str, command_path: typing.Union[str, Path]):
+        super().__init__(name, command_path)
+        self.proc: typing.Optional[subprocess.Popen] = None
+        self.proc_pid: typing.Optional[int] = None
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, converter_args=None):
+        """Sends JSON values to running program for conversion"""
+        request = json.dumps(
+            {"args": list(args), "converter_args": converter_args or []}
+        )
+
+        with self.lock:
+            for attempt in range(2):
+                proc = self._get_proc()
+                try:
+                    assert proc.stdin is not None
+                    assert proc.stdout is not None
+                    print(request, file=proc.stdin, flush=True)
+                    response = proc.stdout.readline()
+                    if response:
+                        return json.loads(response)
+                except BrokenPipeError:
+                    pass
+
+                # Process died; restart and try once more
+                _LOGGER.warning(
+                    "Converter %s exited unexpectedly (attempt %s)",
+                    self.name,
+                    attempt + 1,
+                )
+                self.proc = None
+
+        raise RuntimeError(f"Converter {self.name} failed")
+
+    def _get_proc(self) -> subprocess.Popen:
+        """Start program if needed (once per process after a fork)."""
+        if (self.proc is None) or (self.proc_pid != os.getpid()):
+            _LOGGER.debug("Starting converter %s", self.name)
+            self.proc = subprocess.Popen(
+                [str(self.command_path)],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+            )
+            self.proc_pid = os.getpid()
+
+        return self.proc
+
+    def stop(self):
+        """Stop running program."""
+        with self.lock:
+            if (self.proc is not None) and (self.proc_pid == os.getpid()):
+                assert self.proc.stdin is not None
+                self.proc.stdin.close()
+                try:
+                    self.proc.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    self.proc.terminate()
+
+            self.proc = None
+
 
 def load_converters(
-    converters_dir: typing.Union[str, Path]
+    converters_dir: typing.Union[str, Path],
+    persistent_converters: typing.Optional[typing.Iterable[str]] = None,
 ) -> typing.Dict[str, CommandLineConverter]:
     """Load user-defined converters"""
+    persistent_converters = set(persistent_converters or [])
     converters: typing.Dict[str, CommandLineConverter] = {}
     converters_dir = Path(converters_dir)
 
@@ -210,7 +542,14 @@ def load_converters(
             # Run converter as external program.
             # Input arguments are encoded as JSON on individual lines.
             # Output values should be encoded as JSON on individual lines.
-            converter = CommandLineConverter(converter_name, converter_path)
+            converter: CommandLineConverter
+            if converter_name in persistent_converters:
+                # Program is started once and receives one request per line
+                converter = PersistentCommandLineConverter(
+                    converter_name, converter_path
+                )
+            else:
+                converter = CommandLineConverter(converter_name, converter_path)
 
             # Key off name without file extension
             converters[converter_name] = converter
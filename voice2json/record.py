@@ -2,20 +2,20 @@
 import argparse
 import asyncio
 import dataclasses
-import gzip
-import itertools
 import logging
 import os
 import re
 import sys
 import typing
+import wave
 from pathlib import Path
 
 import aioconsole
 import jsonlines
 
 from .core import Voice2JsonCore
-from .utils import dag_paths_random, itershuffle, print_json
+from .paths import GraphPaths
+from .utils import print_json
 
 _LOGGER = logging.getLogger("voice2json.record")
 
@@ -95,7 +95,6 @@ async def record_command(args: argparse.Namespace, core: Voice2JsonCore) -> None
 
 async def record_examples(args: argparse.Namespace, core: Voice2JsonCore) -> None:
     """Record example voice commands."""
-    import networkx as nx
     import rhasspynlu
 
     # Make sure profile has been trained
@@ -112,29 +111,19 @@ async def record_examples(args: argparse.Namespace, core: Voice2JsonCore) -> Non
 
     examples_dir.mkdir(parents=True, exist_ok=True)
 
-    # Load settings
-    intent_graph_path = core.ppath(
-        "intent-recognition.intent-graph", "intent.pickle.gz"
-    )
-
     # Load intent graph
-    _LOGGER.debug("Loading %s", intent_graph_path)
-    with gzip.GzipFile(intent_graph_path, mode="rb") as graph_gzip:
-        intent_graph = nx.readwrite.gpickle.read_gpickle(graph_gzip)
+    intent_graph = core.load_intent_graph()
 
     start_node, end_node = rhasspynlu.jsgf_graph.get_start_end_nodes(intent_graph)
     assert (start_node is not None) and (
         end_node is not None
     ), "Missing start/end node(s)"
 
-    # Iterable that yields random paths through the graph forever
-    random_paths = itertools.cycle(
-        itershuffle(dag_paths_random(intent_graph, start_node, end_node))
-    )
+    graph_paths = GraphPaths(intent_graph, start_node, end_node)
 
     def generate_intent() -> typing.Dict[str, typing.Any]:
         # Generate sample intent
-        path = next(random_paths)
+        path = graph_paths.random_path()
         _, recognition = rhasspynlu.fsticuffs.path_to_recognition(path, intent_graph)
         assert recognition, "Path to recognition failed"
         return dataclasses.asdict(recognition)
@@ -147,17 +136,20 @@ async def record_examples(args: argparse.Namespace, core: Voice2JsonCore) -> Non
     # Expecting raw 16-bit, 16Khz mono audio
     audio_source = await core.make_audio_source(args.audio_source)
 
-    # Recording task method
-    audio_data = bytes()
-    recording = False
+    # Recording task method.
+    # Audio is written to the WAV file as it arrives.
+    wav_file: typing.Optional[wave.Wave_write] = None
+    wav_path: typing.Optional[Path] = None
+    num_bytes = 0
 
-    async def record_audio(audio_source, chunk_size: int) -> bytes:
+    async def record_audio(audio_source, chunk_size: int):
         """Records audio until cancelled."""
-        nonlocal recording, audio_data
+        nonlocal num_bytes
         while True:
             chunk = await audio_source.read(chunk_size)
-            if chunk and recording:
-                audio_data += chunk
+            if chunk and (wav_file is not None):
+                wav_file.writeframesraw(chunk)
+                num_bytes += len(chunk)
 
     record_task = asyncio.create_task(record_audio(audio_source, chunk_size))
 
@@ -175,18 +167,6 @@ async def record_examples(args: argparse.Namespace, core: Voice2JsonCore) -> Non
             print("Press ENTER to start recording (CTRL+C to exit)")
             await aioconsole.ainput()
 
-            # Record
-            audio_data = bytes()
-            recording = True
-
-            # Instructions
-            print("Recording from audio source. Press ENTER to stop (CTRL+C to exit).")
-            await aioconsole.ainput()
-
-            # Save WAV
-            recording = False
-            logging.debug("Recorded %s byte(s) of audio data", len(audio_data))
-
             count = 0
             wav_path = get_wav_path(text, count)
             while wav_path.exists():
@@ -194,8 +174,18 @@ async def record_examples(args: argparse.Namespace, core: Voice2JsonCore) -> Non
                 count += 1
                 wav_path = get_wav_path(text, count)
 
-            wav_bytes = core.buffer_to_wav(audio_data)
-            wav_path.write_bytes(wav_bytes)
+            # Record
+            num_bytes = 0
+            wav_file = core.open_wav_file(wav_path)
+
+            # Instructions
+            print("Recording from audio source. Press ENTER to stop (CTRL+C to exit).")
+            await aioconsole.ainput()
+
+            # Finish WAV (header is updated with final size)
+            wav_file.close()
+            wav_file = None
+            logging.debug("Recorded %s byte(s) of audio data", num_bytes)
 
             # Save transcription
             transcript_path = examples_dir / f"{wav_path.stem}.txt"
@@ -214,6 +204,12 @@ async def record_examples(args: argparse.Namespace, core: Voice2JsonCore) -> Non
     finally:
         record_task.cancel()
 
+        if wav_file is not None:
+            # Discard partial recording
+            wav_file.close()
+            if wav_path is not None:
+                wav_path.unlink()
+
         try:
             await audio_source.close()
         except Exception:
@@ -0,0 +1,163 @@
+"""HTTP server that keeps a profile loaded between requests."""
+import argparse
+import asyncio
+import dataclasses
+import logging
+import typing
+
+from .core import Voice2JsonCore
+
+_LOGGER = logging.getLogger("voice2json.serve")
+
+# -----------------------------------------------------------------------------
+
+
+async def serve(args: argparse.Namespace, core: Voice2JsonCore) -> None:
+    """Serve transcription, recognition, and example generation over HTTP."""
+    from aiohttp import web
+
+    app = make_app(args, core)
+    runner = web.AppRunner(app)
+    await runner.setup()
+
+    try:
+        site: web.BaseSite
+        if args.socket:
+            site = web.UnixSite(runner, args.socket)
+            _LOGGER.info("Listening on %s", args.socket)
+        else:
+            site = web.TCPSite(runner, args.host, args.port)
+            _LOGGER.info("Listening on http://%s:%s", args.host, args.port)
+
+        await site.start()
+
+        # Run until interrupted
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def make_app(args: argparse.Namespace, core: Voice2JsonCore):
+    """Create web application with a loaded recognizer and transcriber."""
+    import rhasspynlu
+    from aiohttp import web
+    from rhasspyasr import Transcription
+
+    from .generate import intent_to_iob, path_to_intent
+    from .paths import GraphPaths
+    from .recognize import IntentRecognizer, recognition_to_dict
+
+    # Make sure profile has been trained
+    assert core.check_trained(), "Not trained"
+
+    # Load everything up front so requests only pay for decoding
+    recognizer = IntentRecognizer(core)
+    intent_graph = recognizer.intent_graph
+    start_node, end_node = rhasspynlu.jsgf_graph.get_start_end_nodes(intent_graph)
+    assert (start_node is not None) and (
+        end_node is not None
+    ), "Missing start/end node(s)"
+
+    graph_paths = GraphPaths(intent_graph, start_node, end_node)
+
+    transcriber = core.get_transcriber(open_transcription=args.open, debug=args.debug)
+
+    # Transcribers are not thread-safe
+    transcriber_lock = asyncio.Lock()
+
+    # -------------------------------------------------------------------------
+
+    async def transcribe(wav_data: bytes) -> typing.Dict[str, typing.Any]:
+        """Convert and transcribe WAV data."""
+        wav_data = await core.maybe_convert_wav(wav_data)
+
+        async with transcriber_lock:
+            transcription = await asyncio.get_running_loop().run_in_executor(
+                None, transcriber.transcribe_wav, wav_data
+            )
+
+        return dataclasses.asdict(transcription or Transcription.empty())
+
+    async def recognize(
+        request: web.Request, sentence_object: typing.Dict[str, typing.Any]
+    ) -> typing.Dict[str, typing.Any]:
+        """Recognize intent from text in a JSON object."""
+        text = str(sentence_object.get("text", "")).strip()
+        replace_numbers = request.query.get("replace-numbers", "").lower() in {
+            "1",
+            "true",
+            "yes",
+        }
+        intent_filter = set(request.query.getall("intent-filter", [])) or None
+
+        recognition = await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: recognizer.recognize(
+                text, replace_numbers=replace_numbers, intent_filter=intent_filter
+            ),
+        )
+
+        return recognition_to_dict(recognition, sentence_object, text)
+
+    # -------------------------------------------------------------------------
+
+    async def api_transcribe_wav(request: web.Request) -> web.Response:
+        """WAV data -> transcription JSON"""
+        return web.json_response(await transcribe(await request.read()))
+
+    async def api_recognize_intent(request: web.Request) -> web.Response:
+        """JSON object or plain text -> intent JSON"""
+        if request.content_type == "application/json":
+            try:
+                sentence_object = await request.json()
+            except ValueError:
+                raise web.HTTPBadRequest(text="Invalid JSON")
+
+            if not isinstance(sentence_object, dict):
+                raise web.HTTPBadRequest(text="Expected a JSON object")
+        else:
+            sentence_object = {"text": await request.text()}
+
+        return web.json_response(await recognize(request, sentence_object))
+
+    async def api_transcribe_recognize(request: web.Request) -> web.Response:
+        """WAV data -> intent JSON (with transcription)"""
+        transcription = await transcribe(await request.read())
+        return web.json_response(await recognize(request, transcription))
+
+    async def api_generate_examples(request: web.Request) -> web.Response:
+        """Random example intents as JSON (or IOB text)"""
+        try:
+            number = int(request.query.get("number", "1"))
+        except ValueError:
+            raise web.HTTPBadRequest(text="number must be an integer")
+
+        if number < 0:
+            raise web.HTTPBadRequest(text="number must not be negative")
+
+        number = min(number, args.max_examples)
+        intents: typing.List[typing.Dict[str, typing.Any]] = []
+
+        for path in graph_paths.random_paths(number):
+            intent = path_to_intent(path, intent_graph)
+            if intent:
+                intents.append(intent)
+
+        if "iob" in request.query:
+            return web.Response(text="\n".join(intent_to_iob(i) for i in intents))
+
+        return web.json_response(intents)
+
+    app = web.Application(client_max_size=args.max_request_bytes)
+    app.router.add_post("/api/transcribe-wav", api_transcribe_wav)
+    app.router.add_post("/api/recognize-intent", api_recognize_intent)
+    app.router.add_post("/api/transcribe-recognize", api_transcribe_recognize)
+    app.router.add_get("/api/generate-examples", api_generate_examples)
+
+    async def stop(app: web.Application):
+        transcriber.stop()
+        recognizer.stop()
+
+    app.on_cleanup.append(stop)
+
+    return app
@@ -0,0 +1,307 @@
+"""Typed, immutable settings read once from a profile.
+
+Covers the settings used while handling audio, transcriptions, and
+intents. File paths are resolved relative to the profile by
+Voice2JsonCore.ppath, and settings only read once per command (training,
+text to speech, wake word) are read where they're used.
+"""
+import shlex
+import typing
+
+import pydash
+
+# -----------------------------------------------------------------------------
+
+
+class AudioFormat(typing.NamedTuple):
+    """Expected format of audio data."""
+
+    sample_rate: int
+    sample_width: int  # bytes
+    channels: int
+
+
+class AudioSettings(typing.NamedTuple):
+    """Settings for recording and converting audio."""
+
+    format: AudioFormat
+    converter: str
+    convert_command: typing.Tuple[str, ...]
+    record_command: typing.Tuple[str, ...]
+    buffer_seconds: float
+    buffer_policy: str
+
+    @property
+    def buffer_bytes(self) -> int:
+        """Size of live audio buffer in bytes."""
+        bytes_per_second = (
+            self.format.sample_rate * self.format.sample_width * self.format.channels
+        )
+        return max(1, int(self.buffer_seconds * bytes_per_second))
+
+
+class VoiceCommandSettings(typing.NamedTuple):
+    """Settings for detecting voice commands in live audio."""
+
+    vad_mode: int
+    min_seconds: float
+    max_seconds: float
+    speech_seconds: float
+    silence_seconds: float
+    before_seconds: float
+    skip_seconds: float
+    chunk_size: int
+
+
+class KaldiSettings(typing.NamedTuple):
+    """Settings for Kaldi speech to text."""
+
+    model_type: str
+    decoder: str
+
+
+class JuliusSettings(typing.NamedTuple):
+    """Settings for Julius speech to text."""
+
+    streaming: bool
+    adinnet_port: int
+    timeout_seconds: float
+    temp_directory: str
+
+
+class SpeechToTextSettings(typing.NamedTuple):
+    """Settings for creating transcribers."""
+
+    acoustic_model_type: str
+    kaldi: KaldiSettings
+    julius: JuliusSettings
+
+
+class IntentRecognitionSettings(typing.NamedTuple):
+    """Settings for recognizing intents from text."""
+
+    language_code: str
+    word_casing: str
+    fuzzy: bool
+    cache_size: int
+    persistent_converters: typing.Tuple[str, ...]
+
+
+class Settings(typing.NamedTuple):
+    """Profile settings that are used for every utterance or file."""
+
+    audio: AudioSettings
+    voice_command: VoiceCommandSettings
+    speech_to_text: SpeechToTextSettings
+    intent_recognition: IntentRecognitionSettings
+
+    @classmethod
+    def from_profile(cls, profile: typing.Dict[str, typing.Any]) -> "Settings":
+        """Read and validate settings from a profile.
+
+        Raises ValueError if a setting has the wrong type or value.
+        """
+        sample_width_bits = _get(profile, "audio.format.sample-width-bits", 16, int)
+        _check(
+            sample_width_bits in {8, 16, 24, 32},
+            "audio.format.sample-width-bits",
+            sample_width_bits,
+        )
+
+        audio_format = AudioFormat(
+            sample_rate=_get(profile, "audio.format.sample-rate-hertz", 16000, int),
+            sample_width=sample_width_bits // 8,
+            channels=_get(profile, "audio.format.channel-count", 1, int),
+        )
+        _check(
+            audio_format.sample_rate > 0,
+            "audio.format.sample-rate-hertz",
+            audio_format.sample_rate,
+        )
+        _check(
+            audio_format.channels > 0,
+            "audio.format.channel-count",
+            audio_format.channels,
+        )
+
+        converter = _get(profile, "audio.converter", "builtin", str)
+        _check(converter in {"builtin", "command"}, "audio.converter", converter)
+
+        buffer_seconds = _get(profile, "audio.buffer-seconds", 60, float)
+        _check(buffer_seconds > 0, "audio.buffer-seconds", buffer_seconds)
+
+        buffer_policy = _get(profile, "audio.buffer-policy", "drop-oldest", str)
+        _check(
+            buffer_policy in {"drop-oldest", "block"},
+            "audio.buffer-policy",
+            buffer_policy,
+        )
+
+        audio = AudioSettings(
+            format=audio_format,
+            converter=converter,
+            convert_command=tuple(
+                shlex.split(
+                    _get(
+                        profile,
+                        "audio.convert-command",
+                        "sox -t wav - -r 16000 -e signed-integer -b 16 -c 1 -t wav -",
+                        str,
+                    )
+                )
+            ),
+            record_command=tuple(
+                shlex.split(
+                    _get(
+                        profile,
+                        "audio.record-command",
+                        "arecord -q -r 16000 -c 1 -f S16_LE -t raw",
+                        str,
+                    )
+                )
+            ),
+            buffer_seconds=buffer_seconds,
+            buffer_policy=buffer_policy,
+        )
+
+        voice_command = VoiceCommandSettings(
+            vad_mode=_get(profile, "voice-command.vad-mode", 3, int),
+            min_seconds=_get(profile, "voice-command.minimum-seconds", 1, float),
+            max_seconds=_get(profile, "voice-command.maximum-seconds", 30, float),
+            speech_seconds=_get(profile, "voice-command.speech-seconds", 0.3, float),
+            silence_seconds=_get(profile, "voice-command.silence-seconds", 0.5, float),
+            before_seconds=_get(profile, "voice-command.before-seconds", 0.5, float),
+            skip_seconds=_get(profile, "voice-command.skip-seconds", 0, float),
+            chunk_size=_get(profile, "voice-command.chunk-size", 960, int),
+        )
+        _check(
+            0 <= voice_command.vad_mode <= 3,
+            "voice-command.vad-mode",
+            voice_command.vad_mode,
+        )
+        _check(
+            voice_command.chunk_size > 0,
+            "voice-command.chunk-size",
+            voice_command.chunk_size,
+        )
+
+        acoustic_model_type = _get(
+            profile, "speech-to-text.acoustic-model-type", "pocketsphinx", str
+        ).lower()
+        _check(
+            acoustic_model_type
+            in {"dummy", "pocketsphinx", "kaldi", "julius", "deepspeech"},
+            "speech-to-text.acoustic-model-type",
+            acoustic_model_type,
+        )
+
+        kaldi = KaldiSettings(
+            model_type=_get(profile, "speech-to-text.kaldi.model-type", "", str),
+            decoder=_get(profile, "speech-to-text.kaldi.decoder", "command-line", str),
+        )
+        if acoustic_model_type == "kaldi":
+            _check(
+                kaldi.model_type in {"nnet3", "gmm"},
+                "speech-to-text.kaldi.model-type",
+                kaldi.model_type,
+            )
+
+        _check(
+            kaldi.decoder in {"command-line", "online"},
+            "speech-to-text.kaldi.decoder",
+            kaldi.decoder,
+        )
+
+        julius = JuliusSettings(
+            streaming=_get(profile, "speech-to-text.julius.streaming", False, _to_bool),
+            adinnet_port=_get(profile, "speech-to-text.julius.adinnet-port", 0, int),
+            timeout_seconds=_get(
+                profile, "speech-to-text.julius.timeout-seconds", 60, float
+            ),
+            temp_directory=_get(
+                profile, "speech-to-text.julius.temp-directory", "", str
+            ),
+        )
+        _check(
+            0 <= julius.adinnet_port <= 65535,
+            "speech-to-text.julius.adinnet-port",
+            julius.adinnet_port,
+        )
+        _check(
+            julius.timeout_seconds > 0,
+            "speech-to-text.julius.timeout-seconds",
+            julius.timeout_seconds,
+        )
+
+        speech_to_text = SpeechToTextSettings(
+            acoustic_model_type=acoustic_model_type, kaldi=kaldi, julius=julius
+        )
+
+        intent_recognition = IntentRecognitionSettings(
+            language_code=_get(profile, "language.code", "en-US", str),
+            word_casing=_get(profile, "training.word-casing", "ignore", str).lower(),
+            fuzzy=_get(profile, "intent-recognition.fuzzy", True, _to_bool),
+            cache_size=_get(profile, "intent-recognition.cache-size", 1000, int),
+            persistent_converters=tuple(
+                _get(profile, "intent-recognition.persistent-converters", [], list)
+            ),
+        )
+        _check(
+            intent_recognition.word_casing in {"default", "upper", "lower", "ignore"},
+            "training.word-casing",
+            intent_recognition.word_casing,
+        )
+        _check(
+            intent_recognition.cache_size >= 0,
+            "intent-recognition.cache-size",
+            intent_recognition.cache_size,
+        )
+
+        return cls(
+            audio=audio,
+            voice_command=voice_command,
+            speech_to_text=speech_to_text,
+            intent_recognition=intent_recognition,
+        )
+
+
+# -----------------------------------------------------------------------------
+
+T = typing.TypeVar("T")
+
+
+def _get(
+    profile: typing.Dict[str, typing.Any],
+    query: str,
+    default: typing.Any,
+    value_type: typing.Callable[[typing.Any], T],
+) -> T:
+    """Get a setting from the profile and convert it to value_type."""
+    value = pydash.get(profile, query, default)
+
+    try:
+        return value_type(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid profile setting {query}: {value!r}") from e
+
+
+def _to_bool(value: typing.Any) -> bool:
+    """Convert a boolean or true/false, yes/no, 1/0 string to bool."""
+    if isinstance(value, bool):
+        return value
+
+    if isinstance(value, (int, str)):
+        text = str(value).strip().lower()
+        if text in {"true", "yes", "1"}:
+            return True
+
+        if text in {"false", "no", "0"}:
+            return False
+
+    raise ValueError(value)
+
+
+def _check(is_valid: bool, query: str, value: typing.Any) -> None:
+    """Raise ValueError if a setting is not valid."""
+    if not is_valid:
+        raise ValueError(f"Invalid profile setting {query}: {value!r}")
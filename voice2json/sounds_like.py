@@ -1,6 +1,9 @@
 """Methods for creating phonetic pronunciations from existing words and word segments."""
+import array
+import heapq
 import itertools
 import logging
+import os
 import re
 import typing
 from collections import defaultdict
@@ -8,6 +11,8 @@ from pathlib import Path
 
 from rhasspynlu.g2p import PronunciationAction, PronunciationsType
 
+from .packed import PackedFile, StringTable, pack_strings, write_packed
+
 _LOGGER = logging.getLogger("voice2json.sounds_like")
 
 G2PAlignmentType = typing.Dict[
@@ -25,8 +30,17 @@ def load_sounds_like(
     action: PronunciationAction = PronunciationAction.APPEND,
     g2p_alignment: typing.Optional[G2PAlignmentType] = None,
     g2p_corpus: typing.Optional[Path] = None,
+    g2p_corpus_index: typing.Optional[Path] = None,
+    max_pronunciations: typing.Optional[int] = None,
+    entry_counts: typing.Optional[typing.List[typing.Tuple[str, int]]] = None,
 ) -> typing.Optional[G2PAlignmentType]:
-    """Loads file with unknown word pronunciations based on known words."""
+    """Loads file with unknown word pronunciations based on known words.
+
+    At most max_pronunciations (if > 0) are generated per line, preferring
+    earlier pronunciations/alignments of the known words. If given,
+    entry_counts is filled with (unknown word, number of pronunciations)
+    for each line.
+    """
     original_action = action
 
     # word -> [[(["graheme", ...], ["phoneme", ...])], ...]
@@ -101,7 +115,9 @@ def load_sounds_like(
                                     g2p_corpus.is_file()
                                 ), f"Missing G2P corpus for {known_word}: {g2p_corpus}"
 
-                                g2p_alignment = load_g2p_corpus(g2p_corpus)
+                                g2p_alignment = load_g2p_corpus(
+                                    g2p_corpus, index_path=g2p_corpus_index
+                                )
 
                             # Align graphemes with phonemes
                             word = re.sub(r"[<>]", "", known_word)
@@ -124,11 +140,24 @@ def load_sounds_like(
                         if current_phonemes:
                             known_phonemes.append([current_phonemes])
 
+                num_combinations = 1
+                for alternatives in known_phonemes:
+                    num_combinations *= len(alternatives)
+
+                if max_pronunciations and (num_combinations > max_pronunciations):
+                    _LOGGER.warning(
+                        "%s has %s possible pronunciation(s), keeping up to %s (line %s)",
+                        unknown_word,
+                        num_combinations,
+                        max_pronunciations,
+                        i + 1,
+                    )
+
                 # Collect pronunciations from known words
-                # word_prons: typing.List[typing.List[typing.List[str]]] = []
-                for word_phonemes in itertools.product(*known_phonemes):
-                    # Generate all possible pronunciations.
-                    word_pron = list(itertools.chain(*word_phonemes))
+                num_prons = 0
+                for word_pron in expand_pronunciations(
+                    known_phonemes, max_pronunciations=max_pronunciations
+                ):
                     has_word = unknown_word in pronunciations
 
                     # Handle according to custom words action
@@ -142,6 +171,19 @@ def load_sounds_like(
                     else:
                         # Overwrite
                         pronunciations[unknown_word] = [word_pron]
+
+                    num_prons += 1
+
+                _LOGGER.debug(
+                    "%s: %s combination(s), %s pronunciation(s) (line %s)",
+                    unknown_word,
+                    num_combinations,
+                    num_prons,
+                    i + 1,
+                )
+
+                if entry_counts is not None:
+                    entry_counts.append((unknown_word, num_prons))
             except Exception as e:
                 _LOGGER.warning("load_sounds_like: %s (line %s)", e, i + 1)
                 raise e
@@ -149,8 +191,73 @@ def load_sounds_like(
     return g2p_alignment
 
 
-def load_g2p_corpus(g2p_corpus: Path) -> G2PAlignmentType:
-    """Loads a grapheme to phoneme alignment corpus generated by Phonetisaurus."""
+def expand_pronunciations(
+    known_phonemes: typing.Sequence[typing.Sequence[typing.List[str]]],
+    max_pronunciations: typing.Optional[int] = None,
+) -> typing.Iterable[typing.List[str]]:
+    """Yields unique concatenations of one alternative from each position.
+
+    Combinations are generated best-first: those using earlier alternatives
+    (lower total index) come before later ones, so a cap keeps the most
+    likely pronunciations.
+    """
+    if any(not alternatives for alternatives in known_phonemes):
+        return
+
+    num_yielded = 0
+    seen_prons: typing.Set[typing.Tuple[str, ...]] = set()
+
+    # Priority queue of (total index, alternative indexes)
+    start = tuple(0 for _ in known_phonemes)
+    queue = [(0, start)]
+    queued = {start}
+
+    while queue:
+        total_index, indexes = heapq.heappop(queue)
+        word_pron = list(
+            itertools.chain.from_iterable(
+                alternatives[index]
+                for alternatives, index in zip(known_phonemes, indexes)
+            )
+        )
+
+        pron_key = tuple(word_pron)
+        if pron_key not in seen_prons:
+            seen_prons.add(pron_key)
+            yield word_pron
+
+            num_yielded += 1
+            if max_pronunciations and (num_yielded >= max_pronunciations):
+                break
+
+        # Try next alternative at each position
+        for position, index in enumerate(indexes):
+            if (index + 1) < len(known_phonemes[position]):
+                next_indexes = (
+                    indexes[:position] + (index + 1,) + indexes[position + 1 :]
+                )
+                if next_indexes not in queued:
+                    queued.add(next_indexes)
+                    heapq.heappush(queue, (total_index + 1, next_indexes))
+
+
+def load_g2p_corpus(
+    g2p_corpus: Path, index_path: typing.Optional[Path] = None
+) -> G2PAlignmentType:
+    """Loads a grapheme to phoneme alignment corpus generated by Phonetisaurus.
+
+    If index_path is given, an index of the corpus is (re-)built there and
+    alignments are only read for words that are looked up.
+    """
+    if index_path:
+        try:
+            # Duck-typed stand-in for a dict
+            return typing.cast(
+                G2PAlignmentType, load_g2p_corpus_index(g2p_corpus, index_path)
+            )
+        except OSError:
+            _LOGGER.exception("Failed to index %s", g2p_corpus)
+
     g2p_alignment: G2PAlignmentType = defaultdict(list)
 
     _LOGGER.debug("Loading g2p corpus from %s", g2p_corpus)
@@ -160,26 +267,7 @@ def load_g2p_corpus(g2p_corpus: Path) -> G2PAlignmentType:
             if not line:
                 continue
 
-            word = ""
-            inputs_outputs = []
-
-            # Parse line
-            parts = line.split()
-            for part in parts:
-                # Assume default delimiters:
-                # } separates input/output
-                # | separates input/output tokens
-                # _ indicates empty output
-                part_in, part_out = part.split("}")
-                part_ins = part_in.split("|")
-                if part_out == "_":
-                    # Empty output
-                    part_outs = []
-                else:
-                    part_outs = part_out.split("|")
-
-                inputs_outputs.append((part_ins, part_outs))
-                word += "".join(part_ins)
+            word, inputs_outputs = parse_g2p_corpus_line(line)
 
             # Add to pronunciations for word
             g2p_alignment[word].append(inputs_outputs)
@@ -187,6 +275,172 @@ def load_g2p_corpus(g2p_corpus: Path) -> G2PAlignmentType:
     return g2p_alignment
 
 
+def parse_g2p_corpus_line(
+    line: str,
+) -> typing.Tuple[str, typing.List[typing.Tuple[typing.List[str], typing.List[str]]]]:
+    """Parses a line from a Phonetisaurus alignment corpus into (word, alignment)."""
+    word = ""
+    inputs_outputs = []
+
+    # Parse line
+    parts = line.split()
+    for part in parts:
+        # Assume default delimiters:
+        # } separates input/output
+        # | separates input/output tokens
+        # _ indicates empty output
+        part_in, part_out = part.split("}")
+        part_ins = part_in.split("|")
+        if part_out == "_":
+            # Empty output
+            part_outs = []
+        else:
+            part_outs = part_out.split("|")
+
+        inputs_outputs.append((part_ins, part_outs))
+        word += "".join(part_ins)
+
+    return word, inputs_outputs
+
+
+# -----------------------------------------------------------------------------
+
+G2P_INDEX_MAGIC = b"V2JA"
+G2P_INDEX_VERSION = 1
+
+
+def load_g2p_corpus_index(g2p_corpus: Path, index_path: Path) -> "G2PCorpusIndex":
+    """Load an index of a g2p alignment corpus, building it if it's out of date."""
+    corpus_stat = g2p_corpus.stat()
+    source_info = [corpus_stat.st_size, corpus_stat.st_mtime_ns]
+
+    if index_path.is_file():
+        try:
+            g2p_index = G2PCorpusIndex(g2p_corpus, index_path)
+            if g2p_index.source_info == source_info:
+                _LOGGER.debug("Using g2p corpus index %s", index_path)
+                return g2p_index
+
+            g2p_index.close()
+        except ValueError:
+            _LOGGER.exception("load_g2p_corpus_index")
+
+    write_g2p_corpus_index(g2p_corpus, index_path)
+
+    return G2PCorpusIndex(g2p_corpus, index_path)
+
+
+def write_g2p_corpus_index(g2p_corpus: Path, index_path: Path) -> None:
+    """Index a g2p alignment corpus by word (sorted words -> line byte offsets)."""
+    _LOGGER.debug("Indexing g2p corpus %s to %s", g2p_corpus, index_path)
+    corpus_stat = g2p_corpus.stat()
+
+    # word -> [line offset, ...] in corpus order
+    word_lines: typing.Dict[str, typing.List[int]] = defaultdict(list)
+    with open(g2p_corpus, "rb") as corpus_file:
+        line_offset = 0
+        for line_bytes in corpus_file:
+            line = line_bytes.decode().strip()
+            if line:
+                word, _ = parse_g2p_corpus_line(line)
+                word_lines[word].append(line_offset)
+
+            line_offset += len(line_bytes)
+
+    # Sorted by UTF-8 bytes for binary search
+    words = sorted(word_lines, key=str.encode)
+    word_offsets, word_data = pack_strings(words)
+
+    word_line_ranges = array.array("I", [0])
+    line_offsets = array.array("Q")
+    for word in words:
+        line_offsets.extend(word_lines[word])
+        word_line_ranges.append(len(line_offsets))
+
+    # Write to temporary file first in case another process is reading
+    temp_path = index_path.with_name(f".{index_path.name}.{os.getpid()}")
+    write_packed(
+        temp_path,
+        G2P_INDEX_MAGIC,
+        G2P_INDEX_VERSION,
+        [
+            array.array("q", [corpus_stat.st_size, corpus_stat.st_mtime_ns]),
+            word_offsets,
+            word_data,
+            word_line_ranges,
+            line_offsets,
+        ],
+    )
+    temp_path.replace(index_path)
+
+
+class G2PCorpusIndex:
+    """Read-only word -> alignments lookup that seeks into a g2p corpus."""
+
+    def __init__(self, g2p_corpus: Path, index_path: Path):
+        self.packed = PackedFile(index_path, G2P_INDEX_MAGIC, G2P_INDEX_VERSION)
+        sources, word_offsets, word_data, word_lines, line_offsets = (
+            self.packed.sections
+        )
+
+        self.source_info = list(sources)
+        self.words = StringTable(word_offsets, word_data)
+        self.word_lines = word_lines
+        self.line_offsets = line_offsets
+        self.corpus_file = open(g2p_corpus, "rb")
+
+    def get(
+        self, word: str, default: typing.Any = None
+    ) -> typing.List[typing.List[typing.Tuple[typing.List[str], typing.List[str]]]]:
+        """Read all alignments for a word from the corpus."""
+        word_index = self.words.find(word)
+        if word_index is None:
+            return default
+
+        alignments = []
+        for line_index in range(
+            self.word_lines[word_index], self.word_lines[word_index + 1]
+        ):
+            self.corpus_file.seek(self.line_offsets[line_index])
+            line = self.corpus_file.readline().decode().strip()
+            alignments.append(parse_g2p_corpus_line(line)[1])
+
+        return alignments
+
+    def __getitem__(self, word: str):
+        alignments = self.get(word)
+        if alignments is None:
+            raise KeyError(word)
+
+        return alignments
+
+    def __contains__(self, word: typing.Any) -> bool:
+        return isinstance(word, str) and (self.words.find(word) is not None)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def close(self):
+        """Close corpus and index."""
+        self.corpus_file.close()
+        self.packed.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def close_g2p_alignment(g2p_alignment: typing.Optional[G2PAlignmentType]) -> None:
+    """Close a g2p alignment corpus if it was loaded from an index."""
+    if isinstance(g2p_alignment, G2PCorpusIndex):
+        g2p_alignment.close()
+
+
+# -----------------------------------------------------------------------------
+
+
 def get_aligned_phonemes(
     g2p_alignment: G2PAlignmentType, word: str, prefix: str, body: str
 ) -> typing.Iterable[typing.List[str]]:
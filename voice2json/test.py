@@ -1,12 +1,8 @@
 """Methods for testing recorded examples."""
 import argparse
-import asyncio
 import dataclasses
 import json
 import logging
-import shlex
-import shutil
-import tempfile
 import typing
 from pathlib import Path
 
@@ -66,99 +62,7 @@ async def test_examples(args: argparse.Namespace, core: Voice2JsonCore) -> None:
         _LOGGER.fatal("No expected examples provided")
         return
 
-    temp_dir = None
-    try:
-        if not args.actual:
-            # Generate actual results from examples directory
-            assert args.directory, "Examples directory required if no --expected"
-            examples_dir = Path(args.directory)
-            _LOGGER.debug("Generating actual intents from %s", examples_dir)
-
-            # Use voice2json and GNU parallel
-            assert shutil.which("parallel"), "GNU parallel is required"
-            if args.results:
-                # Save results to user-specified directory
-                results_dir = Path(args.results)
-                results_dir.mkdir(parents=True, exist_ok=True)
-                _LOGGER.debug("Saving results to %s", results_dir)
-            else:
-                # Save resuls to temporary directory
-                temp_dir = tempfile.TemporaryDirectory()
-                results_dir = Path(temp_dir.name)
-                _LOGGER.debug(
-                    "Saving results to temporary directory (use --results to specify)"
-                )
-
-            # Transcribe WAV files
-            actual_wavs_path = results_dir / "actual_wavs.txt"
-            actual_transcriptions_path = results_dir / "actual_transcriptions.jsonl"
-
-            # Write list of WAV files to a text file
-            with open(actual_wavs_path, "w") as actual_wavs_file:
-                for wav_path in examples_dir.glob("*.wav"):
-                    print(str(wav_path.absolute()), file=actual_wavs_file)
-
-            # Transcribe in parallel
-            transcribe_args = ["--stdin-files"]
-            if args.open:
-                transcribe_args.append("--open")
-
-            transcribe_command = (
-                [
-                    "parallel",
-                    "-k",
-                    "--pipe",
-                    "-n",
-                    str(args.threads),
-                    "voice2json",
-                    "-p",
-                    shlex.quote(str(core.profile_file)),
-                    "transcribe-wav",
-                ]
-                + transcribe_args
-                + ["<", str(actual_wavs_path), ">", str(actual_transcriptions_path)]
-            )
-
-            _LOGGER.debug(transcribe_command)
-
-            transcribe_process = await asyncio.create_subprocess_shell(
-                " ".join(transcribe_command)
-            )
-
-            await transcribe_process.wait()
-            assert transcribe_process.returncode == 0, "Transcription failed"
-
-            # Recognize intents from transcriptions in parallel
-            actual_intents_path = results_dir / "actual_intents.jsonl"
-            recognize_command = [
-                "parallel",
-                "-k",
-                "--pipe",
-                "-n",
-                str(args.threads),
-                "voice2json",
-                "-p",
-                shlex.quote(str(core.profile_file)),
-                "recognize-intent",
-                "<",
-                str(actual_transcriptions_path),
-                ">",
-                str(actual_intents_path),
-            ]
-
-            _LOGGER.debug(recognize_command)
-
-            recognize_process = await asyncio.create_subprocess_shell(
-                " ".join(recognize_command)
-            )
-
-            await recognize_process.wait()
-            assert recognize_process.returncode == 0, "Recognition failed"
-
-            # Load actual intents
-            args.actual = actual_intents_path
-
-        assert args.actual, "No actual intents to load"
+    if args.actual:
         _LOGGER.debug("Loading actual intents from %s", args.actual)
 
         # Load actual results from jsonl file
@@ -167,14 +71,85 @@ async def test_examples(args: argparse.Namespace, core: Voice2JsonCore) -> None:
                 actual_intent = Recognition.from_dict(json.loads(line))
                 assert actual_intent.wav_name, f"No wav_name for {line}"
                 actual[actual_intent.wav_name] = actual_intent
+    else:
+        # Generate actual results from examples directory
+        assert args.directory, "Examples directory required if no --expected"
+        examples_dir = Path(args.directory)
+        _LOGGER.debug("Generating actual intents from %s", examples_dir)
+
+        actual = await transcribe_recognize_examples(args, core, examples_dir)
+
+    if not actual:
+        _LOGGER.fatal("No actual examples provided")
+        return
+
+    report = evaluate_intents(expected, actual)
+    print_json(dataclasses.asdict(report))
+
 
-        if not actual:
-            _LOGGER.fatal("No actual examples provided")
-            return
+async def transcribe_recognize_examples(
+    args: argparse.Namespace, core: Voice2JsonCore, examples_dir: Path
+) -> typing.Dict[str, typing.Any]:
+    """Transcribe WAV files and recognize intents with --threads transcribers."""
+    from rhasspynlu.intent import Recognition
+
+    from .recognize import IntentRecognizer, recognition_to_dict
+    from .transcribe import transcribe_wav_files
+
+    actual: typing.Dict[str, Recognition] = {}
+    wav_paths = [str(p.absolute()) for p in examples_dir.glob("*.wav")]
 
-        report = evaluate_intents(expected, actual)
-        print_json(dataclasses.asdict(report))
+    # Load speech/intent models once
+    recognizer = IntentRecognizer(core)
+    transcribers = core.get_transcribers(
+        max(1, args.threads), open_transcription=args.open, debug=args.debug
+    )
+
+    # Optionally save intermediate results
+    transcriptions_file: typing.Optional[typing.TextIO] = None
+    intents_file: typing.Optional[typing.TextIO] = None
+
+    try:
+        if args.results:
+            # Save results to user-specified directory
+            results_dir = Path(args.results)
+            results_dir.mkdir(parents=True, exist_ok=True)
+            _LOGGER.debug("Saving results to %s", results_dir)
+
+            # Write list of WAV files to a text file
+            with open(results_dir / "actual_wavs.txt", "w") as actual_wavs_file:
+                for wav_path in wav_paths:
+                    print(wav_path, file=actual_wavs_file)
+
+            transcriptions_file = open(results_dir / "actual_transcriptions.jsonl", "w")
+            intents_file = open(results_dir / "actual_intents.jsonl", "w")
+
+        async for wav_path, transcription in transcribe_wav_files(
+            core, wav_paths, transcribers, prefetch=2 * len(transcribers)
+        ):
+            transcription_dict = dataclasses.asdict(transcription)
+            transcription_dict["wav_name"] = wav_path.name
+            if transcriptions_file:
+                print_json(transcription_dict, out_file=transcriptions_file)
+
+            # Recognize intent
+            text = transcription.text.strip()
+            recognition = recognizer.recognize(text)
+            intent_dict = recognition_to_dict(recognition, transcription_dict, text)
+            if intents_file:
+                print_json(intent_dict, out_file=intents_file)
+
+            actual[wav_path.name] = Recognition.from_dict(intent_dict)
     finally:
-        # Delete temporary directory
-        if temp_dir:
-            temp_dir.cleanup()
+        for transcriber in transcribers:
+            transcriber.stop()
+
+        recognizer.stop()
+
+        if transcriptions_file:
+            transcriptions_file.close()
+
+        if intents_file:
+            intents_file.close()
+
+    return actual
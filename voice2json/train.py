@@ -1,4 +1,6 @@
 """Methods to train a voice2json profile."""
+import hashlib
+import json
 import logging
 import typing
 from enum import Enum
@@ -9,12 +11,19 @@ import rhasspynlu
 from rhasspynlu.g2p import PronunciationAction, PronunciationsType
 from rhasspynlu.jsgf import Expression, Word
 
+from .graph import write_compact_graph
+from .paths import get_intent_graph_fingerprint, get_intent_graph_stats
 from .pronounce import load_pronunciations
+from .sounds_like import close_g2p_alignment
+from .utils import hash_paths
 from .utils import ppath as utils_ppath
 from .utils import reassemble_large_files
 
 _LOGGER = logging.getLogger("voice2json.train")
 
+# Change to invalidate training manifests from older versions
+_MANIFEST_VERSION = 2
+
 # -----------------------------------------------------------------------------
 
 
@@ -41,9 +50,13 @@ class WordCasing(str, Enum):
 
 
 async def train_profile(
-    profile_dir: Path, profile: typing.Dict[str, typing.Any]
-) -> None:
-    """Re-generate speech/intent artifacts for profile."""
+    profile_dir: Path, profile: typing.Dict[str, typing.Any], force: bool = False
+) -> typing.Dict[str, bool]:
+    """Re-generate speech/intent artifacts for profile.
+
+    Stages whose inputs haven't changed since the last training are skipped
+    unless force is True. Returns whether each stage was run.
+    """
 
     # Compact
     def ppath(query, default=None):
@@ -62,6 +75,9 @@ async def train_profile(
     # Speech to text
     # -------------------
     base_dictionary = ppath("training.base-dictionary", "base_dictionary.txt")
+    base_dictionary_cache = ppath(
+        "training.base-dictionary-cache", "base_dictionary.cache"
+    )
     custom_words = ppath("training.custom-words-file", "custom_words.txt")
     custom_words_action = PronunciationAction(
         pydash.get(profile, "training.custom-words-action", "append")
@@ -70,6 +86,9 @@ async def train_profile(
     sounds_like_action = PronunciationAction(
         pydash.get(profile, "training.sounds-like-action", "append")
     )
+    sounds_like_max_pronunciations = int(
+        pydash.get(profile, "training.sounds-like-max-pronunciations", 100)
+    )
 
     acoustic_model = ppath("training.acoustic-model", "acoustic_model")
     acoustic_model_type = AcousticModelType(
@@ -95,6 +114,9 @@ async def train_profile(
     # -------------------
     g2p_model = ppath("training.grapheme-to-phoneme-model", "g2p.fst")
     g2p_corpus = ppath("training.grapheme-to-phoneme-corpus", "g2p.corpus")
+    g2p_corpus_index = ppath(
+        "training.grapheme-to-phoneme-corpus-index", "g2p.corpus.index"
+    )
 
     # default/ignore/upper/lower
     g2p_word_casing = pydash.get(profile, "training.g2p-word-casing", word_casing)
@@ -108,104 +130,150 @@ async def train_profile(
     mixed_language_model_fst_path = ppath(
         "training.mixed-language-model-fst", "mixed_language_model.fst"
     )
-    intent_graph_path = ppath("training.intent-graph", "intent.pickle.gz")
+    intent_graph_path = ppath("intent-recognition.intent-graph", "intent.pickle.gz")
+    compact_graph_path = ppath(
+        "intent-recognition.intent-graph-compact", "intent.graph"
+    )
+    intent_stats_path = ppath("training.intent-stats-file", "intent_stats.json")
     vocab_path = ppath("training.vocabulary-file", "vocab.txt")
     unknown_words_path = ppath("training.unknown-words-file", "unknown_words.txt")
 
+    # Fingerprints of each stage's inputs from the last training
+    manifest_path = ppath("training.manifest-file", "training_manifest.json")
+
     # -------------------------------------------------------------------------
     # 1. Reassemble large files
     # -------------------------------------------------------------------------
 
     await reassemble_large_files(large_paths)
 
+    manifest: typing.Dict[str, str] = {}
+    if (not force) and manifest_path.is_file():
+        try:
+            manifest = json.loads(manifest_path.read_text()).get("stages", {})
+        except Exception:
+            _LOGGER.exception("Failed to load %s", manifest_path)
+
+    stages_run: typing.Dict[str, bool] = {}
+
+    def stage_done(stage: str, fingerprint: str):
+        stages_run[stage] = True
+        manifest[stage] = fingerprint
+        manifest_path.write_text(json.dumps({"stages": manifest}, indent=4))
+
     # -------------------------------------------------------------------------
     # 2. Generate intent graph
     # -------------------------------------------------------------------------
 
-    # Parse JSGF sentences
-    _LOGGER.debug("Parsing %s", sentences_ini)
-    intents = rhasspynlu.parse_ini(sentences_ini)
-
-    # Split into sentences and rule/slot replacements
-    sentences, replacements = rhasspynlu.ini_jsgf.split_rules(intents)
-
     word_transform = None
     if word_casing == WordCasing.UPPER:
         word_transform = str.upper
     elif word_casing == WordCasing.LOWER:
         word_transform = str.lower
 
-    word_visitor: typing.Optional[
-        typing.Callable[[Expression], typing.Union[bool, Expression]]
-    ] = None
-
-    if word_transform:
-        # Apply transformation to words
-
-        def transform_visitor(word: Expression):
-            if isinstance(word, Word):
-                assert word_transform
-                new_text = word_transform(word.text)
+    graph_fingerprint = get_fingerprint(
+        {
+            "language": language_code,
+            "replace-numbers": replace_numbers,
+            "word-casing": word_casing,
+        },
+        [sentences_ini, slots_dir],
+    )
 
-                # Preserve case by using original text as substition
-                if (word.substitution is None) and (new_text != word.text):
-                    word.substitution = word.text
+    # Slot programs may output different values every time
+    has_slot_programs = slot_programs.is_dir() and any(
+        p.is_file() for p in slot_programs.rglob("*")
+    )
 
-                word.text = new_text
+    intent_graph = None
+    if (
+        has_slot_programs
+        or (manifest.get("intent-graph") != graph_fingerprint)
+        or (not intent_graph_path.is_file())
+        or (not compact_graph_path.is_file())
+        or (not intent_stats_path.is_file())
+    ):
+        intent_graph = make_intent_graph(
+            sentences_ini,
+            slots_dir,
+            slot_programs,
+            language_code=language_code,
+            replace_numbers=replace_numbers,
+            word_transform=word_transform,
+        )
 
-            return word
+        # Convert to gzipped pickle
+        intent_graph_path.parent.mkdir(exist_ok=True)
+        with open(intent_graph_path, mode="wb") as intent_graph_file:
+            rhasspynlu.graph_to_gzip_pickle(intent_graph, intent_graph_file)
 
-        word_visitor = transform_visitor
+        _LOGGER.debug("Wrote intent graph to %s", intent_graph_path)
 
-    # Apply case/number transforms
-    if word_visitor or replace_numbers:
-        for intent_sentences in sentences.values():
-            for sentence in intent_sentences:
-                if replace_numbers:
-                    # Replace number ranges with slot references
-                    # type: ignore
-                    rhasspynlu.jsgf.walk_expression(
-                        sentence, rhasspynlu.number_range_transform, replacements
-                    )
+        # Memory-mappable version for fast loading
+        write_compact_graph(intent_graph, compact_graph_path)
+        _LOGGER.debug("Wrote compact intent graph to %s", compact_graph_path)
 
-                if word_visitor:
-                    # Do case transformation
-                    # type: ignore
-                    rhasspynlu.jsgf.walk_expression(
-                        sentence, word_visitor, replacements
-                    )
+        # Sentence/vocabulary counts for print-graph-stats
+        intent_stats_path.write_text(
+            json.dumps(get_intent_graph_stats(intent_graph), indent=4)
+        )
+        _LOGGER.debug("Wrote intent graph statistics to %s", intent_stats_path)
 
-    # Load slot values
-    slot_replacements = rhasspynlu.get_slot_replacements(
-        intents,
-        slots_dirs=[slots_dir],
-        slot_programs_dirs=[slot_programs],
-        slot_visitor=word_visitor,
-    )
+        # Speech to text only depends on what's in the graph, so re-building
+        # an identical graph (e.g., from slot programs) doesn't re-train it.
+        manifest["intent-graph-content"] = get_intent_graph_fingerprint(intent_graph)
 
-    # Merge with existing replacements
-    for slot_key, slot_values in slot_replacements.items():
-        replacements[slot_key] = slot_values
+        stage_done("intent-graph", graph_fingerprint)
+    else:
+        _LOGGER.debug("Intent graph is up to date")
+        stages_run["intent-graph"] = False
 
-    if replace_numbers:
-        # Do single number transformations
-        for intent_sentences in sentences.values():
-            for sentence in intent_sentences:
-                rhasspynlu.jsgf.walk_expression(
-                    sentence,
-                    lambda w: rhasspynlu.number_transform(w, language_code),
-                    replacements,
-                )
+    # -------------------------------------------------------------------------
+    # 3. Check speech to text inputs and load pronunciations
+    # -------------------------------------------------------------------------
 
-    # Convert to directed graph
-    intent_graph = rhasspynlu.sentences_to_graph(sentences, replacements=replacements)
+    if acoustic_model_type == AcousticModelType.DUMMY:
+        _LOGGER.warning("Not training speech to text system (%s)", acoustic_model_type)
+        return stages_run
+
+    # Outputs that must exist to skip training
+    stt_outputs = [language_model_path]
+    if acoustic_model_type != AcousticModelType.DEEPSPEECH:
+        stt_outputs.append(dictionary_path)
+
+    # Acoustic models are large, so only file sizes/times are checked.
+    # Kaldi writes its training artifacts next to the model directory.
+    acoustic_model_inputs = acoustic_model
+    graph_dir = ppath("training.kaldi.graph-directory") or (acoustic_model / "graph")
+    if acoustic_model_type == AcousticModelType.KALDI:
+        acoustic_model_inputs = acoustic_model / "model"
+        stt_outputs.append(graph_dir / "HCLG.fst")
+
+    stt_fingerprint = get_fingerprint(
+        {
+            "language": language_code,
+            "training": pydash.get(profile, "training", {}),
+            "speech-to-text": pydash.get(profile, "speech-to-text", {}),
+            "intent-graph": manifest["intent-graph-content"],
+        },
+        [base_dictionary, custom_words, sounds_like],
+        stat_paths=[
+            acoustic_model_inputs,
+            g2p_model,
+            g2p_corpus,
+            base_language_model_fst,
+        ],
+    )
 
-    # Convert to gzipped pickle
-    intent_graph_path.parent.mkdir(exist_ok=True)
-    with open(intent_graph_path, mode="wb") as intent_graph_file:
-        rhasspynlu.graph_to_gzip_pickle(intent_graph, intent_graph_file)
+    if (manifest.get("speech-to-text") == stt_fingerprint) and all(
+        p.exists() for p in stt_outputs
+    ):
+        _LOGGER.debug("Speech to text system is up to date")
+        stages_run["speech-to-text"] = False
+        return stages_run
 
-    _LOGGER.debug("Wrote intent graph to %s", intent_graph_path)
+    if intent_graph is None:
+        intent_graph = load_intent_graph(intent_graph_path)
 
     g2p_word_transform = None
     if g2p_word_casing == WordCasing.UPPER:
@@ -220,15 +288,31 @@ async def train_profile(
         AcousticModelType.KALDI,
         AcousticModelType.JULIUS,
     ]:
-        pronunciations, _ = load_pronunciations(
+        sounds_like_counts: typing.List[typing.Tuple[str, int]] = []
+        pronunciations, g2p_alignment = load_pronunciations(
             base_dictionary=base_dictionary,
             custom_words=custom_words,
             custom_words_action=custom_words_action,
             sounds_like=sounds_like,
             sounds_like_action=sounds_like_action,
             g2p_corpus=g2p_corpus,
+            g2p_corpus_index=g2p_corpus_index,
+            base_dictionary_cache=base_dictionary_cache,
+            sounds_like_max_pronunciations=sounds_like_max_pronunciations,
+            sounds_like_counts=sounds_like_counts,
         )
 
+        # Only needed while loading sounds like pronunciations
+        close_g2p_alignment(g2p_alignment)
+
+        if sounds_like_counts:
+            _LOGGER.info(
+                "Added %s pronunciation(s) for %s sounds like entries (max %s for %s)",
+                sum(num_prons for _, num_prons in sounds_like_counts),
+                len(sounds_like_counts),
+                *max((num_prons, word) for word, num_prons in sounds_like_counts),
+            )
+
     # -------------------------------------------------------------------------
     # Speech to Text Training
     # -------------------------------------------------------------------------
@@ -257,10 +341,6 @@ async def train_profile(
         import rhasspyasr_kaldi
         from rhasspyasr_kaldi.train import LanguageModelType
 
-        graph_dir = ppath("training.kaldi.graph-directory") or (
-            acoustic_model / "graph"
-        )
-
         # Type of language model to generate
         language_model_type = LanguageModelType(
             pydash.get(profile, "training.kaldi.language-model-type", "arpa")
@@ -325,5 +405,113 @@ async def train_profile(
             base_language_model_weight=base_language_model_weight,
             mixed_language_model_fst=mixed_language_model_fst_path,
         )
-    else:
-        _LOGGER.warning("Not training speech to text system (%s)", acoustic_model_type)
+
+    stage_done("speech-to-text", stt_fingerprint)
+
+    return stages_run
+
+
+# -----------------------------------------------------------------------------
+
+
+def load_intent_graph(intent_graph_path: Path):
+    """Load intent graph saved by a previous training."""
+    _LOGGER.debug("Loading %s", intent_graph_path)
+    with open(intent_graph_path, mode="rb") as intent_graph_file:
+        return rhasspynlu.gzip_pickle_to_graph(intent_graph_file)
+
+
+def make_intent_graph(
+    sentences_ini: Path,
+    slots_dir: Path,
+    slot_programs: Path,
+    language_code: str = "en-US",
+    replace_numbers: bool = True,
+    word_transform: typing.Optional[typing.Callable[[str], str]] = None,
+):
+    """Parse sentences.ini and slots into an intent graph."""
+    # Parse JSGF sentences
+    _LOGGER.debug("Parsing %s", sentences_ini)
+    intents = rhasspynlu.parse_ini(sentences_ini)
+
+    # Split into sentences and rule/slot replacements
+    sentences, replacements = rhasspynlu.ini_jsgf.split_rules(intents)
+
+    word_visitor: typing.Optional[
+        typing.Callable[[Expression], typing.Union[bool, Expression]]
+    ] = None
+
+    if word_transform:
+        # Apply transformation to words
+
+        def transform_visitor(word: Expression):
+            if isinstance(word, Word):
+                assert word_transform
+                new_text = word_transform(word.text)
+
+                # Preserve case by using original text as substition
+                if (word.substitution is None) and (new_text != word.text):
+                    word.substitution = word.text
+
+                word.text = new_text
+
+            return word
+
+        word_visitor = transform_visitor
+
+    # Apply case/number transforms
+    if word_visitor or replace_numbers:
+        for intent_sentences in sentences.values():
+            for sentence in intent_sentences:
+                if replace_numbers:
+                    # Replace number ranges with slot references
+                    # type: ignore
+                    rhasspynlu.jsgf.walk_expression(
+                        sentence, rhasspynlu.number_range_transform, replacements
+                    )
+
+                if word_visitor:
+                    # Do case transformation
+                    # type: ignore
+                    rhasspynlu.jsgf.walk_expression(
+                        sentence, word_visitor, replacements
+                    )
+
+    # Load slot values
+    slot_replacements = rhasspynlu.get_slot_replacements(
+        intents,
+        slots_dirs=[slots_dir],
+        slot_programs_dirs=[slot_programs],
+        slot_visitor=word_visitor,
+    )
+
+    # Merge with existing replacements
+    for slot_key, slot_values in slot_replacements.items():
+        replacements[slot_key] = slot_values
+
+    if replace_numbers:
+        # Do single number transformations
+        for intent_sentences in sentences.values():
+            for sentence in intent_sentences:
+                rhasspynlu.jsgf.walk_expression(
+                    sentence,
+                    lambda w: rhasspynlu.number_transform(w, language_code),
+                    replacements,
+                )
+
+    # Convert to directed graph
+    return rhasspynlu.sentences_to_graph(sentences, replacements=replacements)
+
+
+def get_fingerprint(
+    settings: typing.Any,
+    content_paths: typing.Iterable[typing.Optional[Path]],
+    stat_paths: typing.Iterable[typing.Optional[Path]] = (),
+) -> str:
+    """Hash of training stage inputs (settings and files)."""
+    hasher = hashlib.sha256(
+        json.dumps([_MANIFEST_VERSION, settings], sort_keys=True, default=str).encode()
+    )
+    hash_paths(content_paths, hasher=hasher)
+
+    return hash_paths(stat_paths, contents=False, hasher=hasher)
@@ -1,5 +1,6 @@
 """Speech to text transcriptions methods."""
 import argparse
+import asyncio
 import dataclasses
 import itertools
 import logging
@@ -7,16 +8,18 @@ import sys
 import threading
 import time
 import typing
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from queue import Queue
-
-import pydash
 
+from .audio import AudioRingBuffer
 from .core import Voice2JsonCore
 from .utils import print_json
 
 _LOGGER = logging.getLogger("voice2json.transcribe")
 
+# Seconds to wait for space in the audio buffer with the "block" policy
+_BUFFER_WRITE_SECONDS = 5.0
+
 # -----------------------------------------------------------------------------
 
 
@@ -27,8 +30,16 @@ async def transcribe_wav(args: argparse.Namespace, core: Voice2JsonCore) -> None
     # Make sure profile has been trained
     assert core.check_trained(), "Not trained"
 
-    # Get speech to text transcriber for profile
-    transcriber = core.get_transcriber(open_transcription=args.open, debug=args.debug)
+    # Get speech to text transcriber(s) for profile.
+    # Extra transcribers are only used for WAV files.
+    num_transcribers = 1
+    if args.wav_file or args.stdin_files:
+        num_transcribers = max(1, args.workers)
+
+    transcribers = core.get_transcribers(
+        num_transcribers, open_transcription=args.open, debug=args.debug
+    )
+    transcriber = transcribers[0]
 
     # Directory to report WAV file names relative to
     relative_dir = (
@@ -43,19 +54,14 @@ async def transcribe_wav(args: argparse.Namespace, core: Voice2JsonCore) -> None
                 _LOGGER.debug("Reading file paths from stdin")
                 wav_files = itertools.chain(wav_files, sys.stdin)
 
-            for wav_path_str in wav_files:
-                wav_path_str = wav_path_str.strip()
-
-                # Load and convert
-                wav_path = Path(wav_path_str)
-                _LOGGER.debug("Transcribing %s", wav_path)
-
-                wav_data = await core.maybe_convert_wav(wav_path.read_bytes())
-
-                # Transcribe
-                transcription = (
-                    transcriber.transcribe_wav(wav_data) or Transcription.empty()
-                )
+            # Files are loaded/converted ahead while transcribers are busy
+            async for wav_path, transcription in transcribe_wav_files(
+                core,
+                wav_files,
+                transcribers,
+                prefetch=args.prefetch,
+                ordered=not args.unordered,
+            ):
                 result = dataclasses.asdict(transcription)
 
                 if relative_dir is None:
@@ -112,7 +118,115 @@ async def transcribe_wav(args: argparse.Namespace, core: Voice2JsonCore) -> None
 
                 print_json(result)
     finally:
-        transcriber.stop()
+        for transcriber in transcribers:
+            transcriber.stop()
+
+
+async def transcribe_wav_files(
+    core: Voice2JsonCore,
+    wav_paths: typing.Iterable[str],
+    transcribers: typing.Sequence[typing.Any],
+    prefetch: int = 4,
+    ordered: bool = True,
+) -> typing.AsyncIterator[typing.Tuple[Path, typing.Any]]:
+    """Transcribe WAV files with one or more transcribers.
+
+    Up to prefetch files are read and converted ahead of the transcribers,
+    which each run in their own thread. Yields (path, transcription) in input
+    order, or as soon as each transcription is ready if ordered is False.
+    """
+    from rhasspyasr import Transcription
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=len(transcribers))
+    pending: "asyncio.Queue[typing.Any]" = asyncio.Queue(maxsize=max(1, prefetch))
+    results: "asyncio.Queue[typing.Any]" = asyncio.Queue()
+
+    async def load(wav_path: Path) -> bytes:
+        _LOGGER.debug("Loading %s", wav_path)
+        wav_data = await loop.run_in_executor(None, wav_path.read_bytes)
+        return await core.maybe_convert_wav(wav_data)
+
+    async def read_paths():
+        # Reading paths may block (stdin)
+        path_iter = iter(wav_paths)
+        index = 0
+        while True:
+            wav_path_str = await loop.run_in_executor(None, next, path_iter, None)
+            if wav_path_str is None:
+                break
+
+            wav_path_str = wav_path_str.strip()
+            if not wav_path_str:
+                continue
+
+            wav_path = Path(wav_path_str)
+            await pending.put((index, wav_path, asyncio.ensure_future(load(wav_path))))
+            index += 1
+
+        for _ in transcribers:
+            await pending.put(None)
+
+    async def transcribe(transcriber):
+        try:
+            while True:
+                item = await pending.get()
+                if item is None:
+                    break
+
+                index, wav_path, load_task = item
+                wav_data = await load_task
+
+                _LOGGER.debug("Transcribing %s", wav_path)
+                transcription = await loop.run_in_executor(
+                    executor, transcriber.transcribe_wav, wav_data
+                )
+
+                await results.put(
+                    (index, wav_path, transcription or Transcription.empty())
+                )
+        except Exception as e:
+            await results.put(e)
+        finally:
+            await results.put(None)
+
+    tasks = [asyncio.ensure_future(read_paths())] + [
+        asyncio.ensure_future(transcribe(t)) for t in transcribers
+    ]
+
+    try:
+        # Results that arrived ahead of their turn (ordered only)
+        waiting: typing.Dict[int, typing.Tuple[Path, typing.Any]] = {}
+        next_index = 0
+        num_running = len(transcribers)
+
+        while num_running > 0:
+            result = await results.get()
+            if result is None:
+                num_running -= 1
+                continue
+
+            if isinstance(result, Exception):
+                raise result
+
+            index, wav_path, transcription = result
+            if not ordered:
+                yield (wav_path, transcription)
+                continue
+
+            waiting[index] = (wav_path, transcription)
+            while next_index in waiting:
+                yield waiting.pop(next_index)
+                next_index += 1
+
+        if tasks[0].done():
+            # Report errors from reading paths
+            tasks[0].result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+        executor.shutdown(wait=False)
 
 
 # -----------------------------------------------------------------------------
@@ -154,11 +268,7 @@ async def transcribe_stream(args: argparse.Namespace, core: Voice2JsonCore) -> N
     audio_source = await core.make_audio_source(args.audio_source)
 
     # Audio settings
-    sample_rate = int(pydash.get(core.profile, "audio.format.sample-rate-hertz", 16000))
-    sample_width = (
-        int(pydash.get(core.profile, "audio.format.sample-width-bits", 16)) // 8
-    )
-    channels = int(pydash.get(core.profile, "audio.format.channel-count", 1))
+    sample_rate, sample_width, channels = core.settings.audio.format
 
     # Get speech to text transcriber for profile
     transcriber = core.get_transcriber(open_transcription=args.open, debug=args.debug)
@@ -166,31 +276,50 @@ async def transcribe_stream(args: argparse.Namespace, core: Voice2JsonCore) -> N
     # Set after a transcription has been printed
     transcription_printed = threading.Event()
 
-    # Run transcription in separate thread
-    frame_queue: "Queue[typing.Optional[bytes]]" = Queue()
+    # Run transcription in separate thread.
+    # Audio for each voice command is passed through a fixed-size buffer.
+    audio_buffer = AudioRingBuffer(
+        core.settings.audio.buffer_bytes,
+        drop_oldest=(core.settings.audio.buffer_policy == "drop-oldest"),
+    )
 
     def audio_stream() -> typing.Iterable[bytes]:
-        """Read audio chunks from queue and yield."""
-        frames = frame_queue.get()
+        """Read audio chunks from buffer until end of voice command."""
+        frames = audio_buffer.read(args.chunk_size)
         while frames:
             yield frames
-            frames = frame_queue.get()
+            frames = audio_buffer.read(args.chunk_size)
+
+    # Errors from transcription thread
+    transcribe_errors: typing.List[Exception] = []
 
     def transcribe_proc():
         """Transcribe live audio stream indefinitely."""
-        while True:
-            # Get result of transcription
-            transcribe_result = transcriber.transcribe_stream(
-                audio_stream(), sample_rate, sample_width, channels
-            )
+        try:
+            while not audio_buffer.closed:
+                # Get result of transcription
+                transcribe_result = transcriber.transcribe_stream(
+                    audio_stream(), sample_rate, sample_width, channels
+                )
+
+                if audio_buffer.closed:
+                    # Stopped in the middle of a voice command
+                    break
 
-            _LOGGER.debug("Transcription result: %s", transcribe_result)
+                _LOGGER.debug("Transcription result: %s", transcribe_result)
 
-            transcribe_result = transcribe_result or Transcription.empty()
-            transcribe_dict = dataclasses.asdict(transcribe_result)
-            transcribe_dict["timeout"] = is_timeout
+                transcribe_result = transcribe_result or Transcription.empty()
+                transcribe_dict = dataclasses.asdict(transcribe_result)
+                transcribe_dict["timeout"] = is_timeout
 
-            print_json(transcribe_dict)
+                print_json(transcribe_dict)
+                transcription_printed.set()
+        except Exception as e:
+            _LOGGER.exception("transcribe_proc")
+            transcribe_errors.append(e)
+        finally:
+            # Unblock writer and stop reading audio
+            audio_buffer.close()
             transcription_printed.set()
 
     threading.Thread(target=transcribe_proc, daemon=True).start()
@@ -204,11 +333,23 @@ async def transcribe_stream(args: argparse.Namespace, core: Voice2JsonCore) -> N
     # Number of transcriptions that have happened
     num_transcriptions = 0
 
+    # True while audio is being dropped (warning is only logged once)
+    is_overflowing = False
+
     print("Ready", file=sys.stderr)
 
+    loop = asyncio.get_running_loop()
+
     try:
         chunk = await audio_source.read(args.chunk_size)
         while chunk:
+            if audio_buffer.closed:
+                # Transcription thread stopped
+                if transcribe_errors:
+                    raise transcribe_errors[0]
+
+                break
+
             # Reset event
             transcription_printed.clear()
 
@@ -226,7 +367,7 @@ async def transcribe_stream(args: argparse.Namespace, core: Voice2JsonCore) -> N
                 is_timeout = voice_command.result == VoiceCommandResult.FAILURE
 
                 # Force transcription
-                frame_queue.put(None)
+                audio_buffer.end_segment()
 
                 # Reset
                 audio_data = recorder.stop()
@@ -261,13 +402,35 @@ async def transcribe_stream(args: argparse.Namespace, core: Voice2JsonCore) -> N
                 recorder.start()
             else:
                 # Add to current command
-                frame_queue.put(chunk)
+                if audio_buffer.drop_oldest:
+                    is_written = audio_buffer.write(chunk)
+                else:
+                    # Wait for space outside of the event loop, but not forever
+                    is_written = await loop.run_in_executor(
+                        None, audio_buffer.write, chunk, _BUFFER_WRITE_SECONDS
+                    )
+
+                if not is_written:
+                    if not is_overflowing:
+                        _LOGGER.warning("Audio buffer full, dropping audio")
+                        is_overflowing = True
+                elif is_overflowing:
+                    _LOGGER.debug("Audio buffer no longer full")
+                    is_overflowing = False
 
             # Next audio chunk
             chunk = await audio_source.read(args.chunk_size)
     finally:
+        audio_buffer.close()
         transcriber.stop()
 
+        if audio_buffer.overflow_count > 0:
+            _LOGGER.warning(
+                "Audio buffer overflowed %s time(s) (%s byte(s) dropped)",
+                audio_buffer.overflow_count,
+                audio_buffer.dropped_bytes,
+            )
+
         try:
             await audio_source.close()
         except Exception:
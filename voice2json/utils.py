@@ -1,24 +1,29 @@
 """Utility methods for voice2json."""
 import asyncio
 import collections
+import hashlib
 import io
+import json
 import logging
 import os
 import platform
-import random
+import re
 import ssl
+import stat
 import sys
+import time
 import typing
 import wave
-from collections import deque
+import weakref
 from pathlib import Path
 
-import aiofiles
-import aiohttp
 import pydash
 
+if typing.TYPE_CHECKING:
+    # Only imported when downloading files
+    import aiohttp
+
 _LOGGER = logging.getLogger("voice2json.utils")
-T = typing.TypeVar("T")
 DEFAULT_URL_FORMAT = (
     "https://raw.githubusercontent.com/synesthesiam/{profile}/master/{file}"
 )
@@ -55,6 +60,48 @@ def ppath(
 # -----------------------------------------------------------------------------
 
 
+def hash_paths(
+    paths: typing.Iterable[typing.Optional[typing.Union[str, Path]]],
+    contents: bool = True,
+    hasher: typing.Optional[typing.Any] = None,
+) -> str:
+    """Hash files (directories are recursive) by contents or size/modification time.
+
+    Missing files are part of the hash, so creating them will change it.
+    """
+    if hasher is None:
+        hasher = hashlib.sha256()
+
+    for path in paths:
+        if path is None:
+            continue
+
+        path = Path(path)
+        if path.is_dir():
+            file_paths = sorted(p for p in path.rglob("*") if p.is_file())
+        else:
+            file_paths = [path]
+
+        for file_path in file_paths:
+            hasher.update(str(file_path).encode() + b"\0")
+            if not file_path.is_file():
+                hasher.update(b"missing")
+            elif contents:
+                with open(file_path, "rb") as hash_file:
+                    for chunk in iter(lambda: hash_file.read(1024 * 1024), b""):
+                        hasher.update(chunk)
+            else:
+                file_stat = file_path.stat()
+                hasher.update(f"{file_stat.st_size} {file_stat.st_mtime_ns}".encode())
+
+            hasher.update(b"\0")
+
+    return hasher.hexdigest()
+
+
+# -----------------------------------------------------------------------------
+
+
 def recursive_update(
     base_dict: typing.Dict[typing.Any, typing.Any],
     new_dict: typing.Mapping[typing.Any, typing.Any],
@@ -72,67 +119,143 @@ def recursive_update(
 
 def print_json(value: typing.Any, out_file=sys.stdout) -> None:
     """Print a single line of JSON to stdout."""
-    import jsonlines
+    get_json_sink(out_file).write(value)
 
-    with jsonlines.Writer(out_file) as out:
-        # pylint: disable=E1101
-        out.write(value)
 
-    out_file.flush()
+class JsonSink:
+    """Writes lines of JSON to a file, flushing on an interval instead of every line."""
 
+    def __init__(
+        self, out_file: typing.TextIO, flush_interval: float = 1.0, line_buffered=False
+    ):
+        self.out_file = out_file
+        self.flush_interval = flush_interval
+        self.line_buffered = line_buffered
+        self.encode = get_json_encoder()
+        self.last_flush = time.perf_counter()
 
-# -----------------------------------------------------------------------------
+        try:
+            # Always flush for a person at a terminal
+            self.line_buffered = self.line_buffered or out_file.isatty()
+        except (AttributeError, ValueError):
+            pass
 
+    def write(self, value: typing.Any) -> None:
+        """Write a single line of JSON, flushing if necessary."""
+        self.write_line(self.encode(value))
 
-def env_constructor(loader, node):
-    """Expand !env STRING to replace environment variables in STRING."""
-    return os.path.expandvars(node.value)
+    def write_line(self, line: str) -> None:
+        """Write a line that's already encoded, flushing if necessary."""
+        self.out_file.write(line + "\n")
 
+        if self.line_buffered or (self.flush_interval <= 0):
+            self.flush()
+        elif (time.perf_counter() - self.last_flush) >= self.flush_interval:
+            self.flush()
 
-# -----------------------------------------------------------------------------
+    def flush(self) -> None:
+        """Flush file if it's still open."""
+        if not self.out_file.closed:
+            self.out_file.flush()
 
+        self.last_flush = time.perf_counter()
 
-def dag_paths_random(G, source: int, target: int) -> typing.Iterable[typing.List[int]]:
-    """Yields paths from source to target in random order. Assumes no cycles."""
-    q: typing.Deque[typing.Tuple[int, typing.List[int]]] = deque([(source, [])])
-    while q:
-        node, path = q.popleft()
-        if node == target:
-            yield path + [target]
-        else:
-            children = list(G[node])
-            random.shuffle(children)
-            for child in children:
-                q.append((child, path + [node]))
+
+_JSON_SINKS: "weakref.WeakKeyDictionary[typing.Any, JsonSink]" = (
+    weakref.WeakKeyDictionary()
+)
+_JSON_FLUSH_INTERVAL = 0.0
+_JSON_LINE_BUFFERED = True
+_JSON_ENCODER: typing.Optional[typing.Callable[[typing.Any], str]] = None
 
 
-def itershuffle(
-    iterable: typing.Iterable[T], bufsize: int = 1000
-) -> typing.Iterable[T]:
-    """Shuffle an iterator by maintaining a buffer of elements.
+def configure_json_output(flush_interval: float, line_buffered: bool) -> None:
+    """Set how often print_json flushes its output files.
 
-    Original credit: https://gist.github.com/andres-erbsen/1307752
+    A flush_interval of 0 flushes every line. Line buffered output is always
+    flushed immediately.
     """
-    iterator = iter(iterable)
-    buf: typing.List[T] = []
+    global _JSON_FLUSH_INTERVAL, _JSON_LINE_BUFFERED
+    _JSON_FLUSH_INTERVAL = flush_interval
+    _JSON_LINE_BUFFERED = line_buffered
+
+    for sink in list(_JSON_SINKS.values()):
+        sink.flush()
+        sink.flush_interval = flush_interval
+        sink.line_buffered = sink.line_buffered or line_buffered
+
+
+def get_json_sink(out_file: typing.TextIO) -> JsonSink:
+    """Get the shared JSON sink for a file."""
     try:
-        while True:
-            # Drain some of the iterable
-            for _ in range(random.randint(1, bufsize - len(buf))):
-                buf.append(next(iterator))
-
-            # Shuffle and yield some of buffer
-            random.shuffle(buf)
-            for _ in range(random.randint(1, bufsize)):
-                if buf:
-                    yield buf.pop()
-                else:
-                    break
-    except StopIteration:
-        # Shuffle and yield rest of buffer
-        random.shuffle(buf)
-        while buf:
-            yield buf.pop()
+        sink = _JSON_SINKS.get(out_file)
+    except TypeError:
+        # Not weak-referenceable
+        return JsonSink(out_file, flush_interval=0, line_buffered=True)
+
+    if sink is None:
+        sink = JsonSink(
+            out_file,
+            flush_interval=_JSON_FLUSH_INTERVAL,
+            line_buffered=_JSON_LINE_BUFFERED,
+        )
+        _JSON_SINKS[out_file] = sink
+
+    return sink
+
+
+def flush_json_output() -> None:
+    """Flush all files written by print_json."""
+    for sink in list(_JSON_SINKS.values()):
+        sink.flush()
+
+
+def is_regular_file(in_file: typing.IO) -> bool:
+    """True if file is backed by a regular file (not a terminal, pipe, etc.)"""
+    try:
+        return stat.S_ISREG(os.fstat(in_file.fileno()).st_mode)
+    except (AttributeError, ValueError, OSError, io.UnsupportedOperation):
+        return False
+
+
+def get_json_encoder() -> typing.Callable[[typing.Any], str]:
+    """Get function that encodes a value as a single line of JSON.
+
+    Uses orjson if it's installed, falling back to the standard library for
+    values it can't encode.
+    """
+    global _JSON_ENCODER
+
+    if _JSON_ENCODER is None:
+        json_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+        try:
+            import orjson
+
+            def orjson_encode(value: typing.Any) -> str:
+                try:
+                    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+                except TypeError:
+                    return json_encode(value)
+
+            _JSON_ENCODER = orjson_encode
+        except ImportError:
+            _JSON_ENCODER = json_encode
+
+    return _JSON_ENCODER
+
+
+# -----------------------------------------------------------------------------
+
+
+def env_constructor(loader, node):
+    """Expand !env STRING to replace environment variables in STRING."""
+    return os.path.expandvars(node.value)
+
+
+def get_env_names(value: str) -> typing.Set[str]:
+    """Get names of environment variables ($NAME or ${NAME}) referenced in value."""
+    return {name.strip("{}") for name in re.findall(r"\$(\w+|\{[^}]*\})", value)}
 
 
 # -----------------------------------------------------------------------------
@@ -148,7 +271,7 @@ async def download_file(
     path: Path,
     file_key: str = "",
     bytes_expected: typing.Optional[int] = None,
-    session: typing.Optional[aiohttp.ClientSession] = None,
+    session: typing.Optional["aiohttp.ClientSession"] = None,
     ssl_context: typing.Optional[ssl.SSLContext] = None,
     chunk_size: int = 4096,
     status_fun: typing.Optional[DownloadStatusType] = None,
@@ -159,6 +282,9 @@ async def download_file(
 
     Returns url, bytes downloaded, and bytes expected.
     """
+    import aiofiles
+    import aiohttp
+
     close_session = session is None
     session = session or aiohttp.ClientSession()
     assert session
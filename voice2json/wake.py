@@ -12,6 +12,7 @@ from pathlib import Path
 
 import pydash
 
+from .audio import AudioRingBuffer
 from .core import Voice2JsonCore
 from .utils import print_json
 
@@ -86,8 +87,10 @@ async def wake(args: argparse.Namespace, core: Voice2JsonCore) -> None:
         # Create audio source and start listening
         audio_source = await core.make_audio_source(args.audio_source)
 
-        # Audio data buffer
-        chunk = bytes()
+        # Audio data buffer.
+        # Never holds more than two chunks since reads are at most chunk size.
+        audio_buffer = AudioRingBuffer(2 * args.chunk_size, drop_oldest=True)
+        chunk = bytearray(args.chunk_size)
 
         try:
             while True:
@@ -96,11 +99,11 @@ async def wake(args: argparse.Namespace, core: Voice2JsonCore) -> None:
                     # Empty chunk
                     break
 
-                chunk += chunk_part
-                if len(chunk) >= args.chunk_size:
-                    chunk_stream.write(chunk[: args.chunk_size])
+                audio_buffer.write(chunk_part)
+                if len(audio_buffer) >= args.chunk_size:
+                    audio_buffer.read_into(chunk)
+                    chunk_stream.write(chunk)
                     chunk_stream.flush()
-                    chunk = chunk[args.chunk_size :]
                 else:
                     # Need more data before writing chunk
                     continue